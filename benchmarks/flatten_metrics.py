@@ -0,0 +1,70 @@
+"""
+Benchmark flattening metrics in a long running loop: formatters.flatten_metrics
+and formatters.sort_flatten_metrics_iter against formatters.CachedFlattener,
+which learns the metrics shape once and reuses the path strings.
+
+    $ python benchmarks/flatten_metrics.py [--repeat 5] [--number 200] [--indices 500]
+"""
+import os
+import sys
+import json
+import timeit
+from copy import deepcopy
+from argparse import ArgumentParser
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+
+from elasticmetrics.formatters import flatten_metrics, sort_flatten_metrics_iter, CachedFlattener  # noqa: E402
+
+
+FIXTURE_NODEMETRICS = os.path.join(ROOT_PATH, 'tests', 'fixtures', 'node_metrics.json')
+
+
+def large_metrics(base_metrics, sections):
+    """Return a copy of the metrics with many more sections (like thread pools
+    and per index metrics), to resemble metrics of a busy node.
+    """
+    metrics = deepcopy(base_metrics)
+    indices = base_metrics['indices']
+    metrics['per_index'] = dict(('index-{:05d}'.format(i), deepcopy(indices)) for i in range(sections))
+    return metrics
+
+
+def bench(label, func, repeat, number, paths):
+    best = min(timeit.repeat(func, repeat=repeat, number=number)) / number
+    print('{:<40} {:>10.1f} us/call {:>8.2f} us/1000 paths'.format(label, best * 1e6, best * 1e9 / paths))
+    return best
+
+
+def main():
+    parser = ArgumentParser(description='benchmark flattening metrics')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=200)
+    parser.add_argument('--indices', type=int, default=500, help='number of extra index sections')
+    opts = parser.parse_args()
+
+    with open(FIXTURE_NODEMETRICS, 'rt') as fh:
+        node_metrics = json.load(fh)
+
+    for label, metrics in (('node metrics', node_metrics),
+                           ('node metrics + {} indices'.format(opts.indices),
+                            large_metrics(node_metrics, opts.indices))):
+        paths = len(flatten_metrics(metrics))
+        print('{} ({} paths)'.format(label, paths))
+        flattener = CachedFlattener(prefix='node')
+        sort_flattener = CachedFlattener(prefix='node', sort=True)
+        baseline = bench('  flatten_metrics', lambda: flatten_metrics(metrics, prefix='node'),
+                         opts.repeat, opts.number, paths)
+        cached = bench('  CachedFlattener.flatten', lambda: flattener.flatten(metrics),
+                       opts.repeat, opts.number, paths)
+        sort_baseline = bench('  sort_flatten_metrics_iter',
+                              lambda: sort_flatten_metrics_iter([metrics], prefix='node'),
+                              opts.repeat, opts.number, paths)
+        sort_cached = bench('  CachedFlattener(sort=True).flatten', lambda: sort_flattener.flatten(metrics),
+                            opts.repeat, opts.number, paths)
+        print('  speedup: {:.2f}x unsorted, {:.2f}x sorted'.format(baseline / cached, sort_baseline / sort_cached))
+
+
+if __name__ == '__main__':
+    main()
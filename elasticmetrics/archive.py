@@ -0,0 +1,427 @@
+"""
+elasticmetrics.archive
+~~~~~~~~~~~~~~~~~~~~~~
+Archive flattened metrics on disk in a columnar format, and read single series
+back without parsing whole files.
+
+Each archive file has a path dictionary at the start of the file, followed by
+segments of fixed width columns (native doubles), and dictionary extensions:
+
+    header      magic (4s), layout version (B), byte order (B, 1 for little endian),
+                2 padding bytes, number of paths (I), dictionary size (I)
+    dictionary  UTF-8 metric paths separated by new lines, padded to 8 bytes
+    segments    each segment has a header: magic (4s), rows (I), capacity (I),
+                number of paths (I), then a timestamps column and a column for
+                each of the first paths, of capacity values each. Missing values are NaN.
+    extensions  paths added to the dictionary, with a header: magic (4s),
+                number of paths (I), dictionary size (I), 4 padding bytes,
+                then the paths like in the dictionary
+
+When metrics with paths not in the dictionary are archived, the current segment
+is closed with the rows it has, and the paths are added to the dictionary, so the
+following segments have their columns. A new file is started when the file has
+max_segments segments. Old files are removed when they're older than max_age,
+or while all the files are larger than max_bytes.
+"""
+import os
+import sys
+import mmap
+import time
+import struct
+from array import array
+from numbers import Real
+from logging import getLogger
+from .exceptions import ElasticMetricsError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MAGIC = b'EMAR'
+SEGMENT_MAGIC = b'EMSG'
+DICTIONARY_MAGIC = b'EMDX'
+LAYOUT_VERSION = 2
+FILE_SUFFIX = '.emar'
+
+_HEADER = struct.Struct('<4sBB2xII')
+_SEGMENT_HEADER = struct.Struct('<4sIII')
+_DICTIONARY_HEADER = struct.Struct('<4sII4x')
+_LITTLE_ENDIAN = 1 if sys.byteorder == 'little' else 0
+_NAN = float('nan')
+
+logger = getLogger(__name__)
+
+
+def _pad(size, alignment=8):
+    return (size + alignment - 1) // alignment * alignment
+
+
+def _array_from_bytes(data):
+    values = array('d')
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:  # Python 2
+        values.fromstring(data)
+    return values
+
+
+def _array_to_bytes(values):
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+
+def archive_files(directory, prefix='metrics'):
+    """Return the paths of the archive files in the directory, oldest first.
+
+    :param str directory: path to the archive directory
+    :param str prefix: prefix of archive file names
+    :rtype: list
+    """
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, filename) for filename in os.listdir(directory)
+        if filename.startswith(prefix + '-') and filename.endswith(FILE_SUFFIX)
+    )
+
+
+class ArchiveWriter(object):
+    """Archive flattened metrics into columnar files in a directory.
+
+    Samples are buffered in the current segment, which is written to the
+    file when it's full, on flush, and when the last write is flush_interval
+    seconds older than the archived sample (so a partial segment is rewritten
+    in place until it's full). Non numeric metrics are not archived.
+
+    When a file is started and on the timed writes, archive files (except the
+    current one) last modified more than max_age seconds ago are removed, and the
+    oldest files are removed while all the files are larger than max_bytes.
+
+    Implements the sink interface (send, flush, close).
+
+    :param str directory: path to the archive directory, created if missing
+    :param str prefix: prefix of archive file names
+    :param int segment_rows: number of samples in each segment
+    :param int max_segments: maximum number of segments in each file
+    :param float flush_interval: maximum seconds (of sample timestamps) samples are only buffered
+    :param float max_age: maximum age of archive files in seconds, None to keep them
+    :param int max_bytes: maximum size of all the archive files, None for no limit
+    """
+
+    def __init__(self, directory, prefix='metrics', segment_rows=256, max_segments=1024, flush_interval=60,
+                 max_age=None, max_bytes=None):
+        if segment_rows < 1:
+            raise ElasticMetricsError('invalid segment rows "{}"'.format(segment_rows))
+        if max_segments < 1:
+            raise ElasticMetricsError('invalid max segments "{}"'.format(max_segments))
+        if flush_interval <= 0:
+            raise ElasticMetricsError('invalid flush interval "{}"'.format(flush_interval))
+        if max_age is not None and max_age <= 0:
+            raise ElasticMetricsError('invalid max age "{}"'.format(max_age))
+        if max_bytes is not None and max_bytes <= 0:
+            raise ElasticMetricsError('invalid max bytes "{}"'.format(max_bytes))
+        self._directory = directory
+        self._prefix = prefix
+        self._segment_rows = segment_rows
+        self._max_segments = max_segments
+        self._flush_interval = flush_interval
+        self._max_age = max_age
+        self._max_bytes = max_bytes
+        self._last_write = None
+        self._file = None
+        self._filename = None
+        self._paths = None
+        self._index = {}
+        self._segments = 0
+        self._segment_offset = 0
+        self._timestamps = array('d')
+        self._columns = []
+        self._stats = {'samples': 0, 'segments': 0, 'files': 0, 'pruned': 0}
+
+    @property
+    def filename(self):
+        """Path of the current archive file, None before the first sample"""
+        return self._filename
+
+    @property
+    def stats(self):
+        return dict(self._stats)
+
+    def send(self, metrics, timestamp=None):
+        """Archive a sample of metrics.
+
+        :param dict metrics: flattened paths mapped to values
+        :param float timestamp: collection time of the metrics, default is now
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        numeric_metrics = [(path, value) for path, value in metrics.items()
+                           if isinstance(value, Real)]
+        if self._file is not None:
+            new_paths = sorted(path for path, _ in numeric_metrics if path not in self._index)
+            if new_paths:
+                self._add_paths(new_paths)
+        if self._file is None:
+            self._open_file(sorted(path for path, _ in numeric_metrics), timestamp)
+
+        row = len(self._timestamps)
+        self._timestamps.append(timestamp)
+        for column in self._columns:
+            column.append(_NAN)
+        for path, value in numeric_metrics:
+            self._columns[self._index[path]][row] = value
+        self._stats['samples'] += 1
+        if len(self._timestamps) == self._segment_rows:
+            self._write_segment()
+            self._last_write = timestamp
+            self._start_segment()
+        elif timestamp - self._last_write >= self._flush_interval:
+            self.flush()
+            self._last_write = timestamp
+            self.prune()
+
+    def flush(self):
+        if self._file is not None and self._timestamps:
+            self._write_segment()
+            self._file.flush()
+
+    def prune(self):
+        """Remove archive files older than max age, and the oldest files while
+        all the files are larger than max bytes. The current file is kept.
+        """
+        if self._max_age is None and self._max_bytes is None:
+            return
+        now = time.time()
+        sizes = []
+        for filename in archive_files(self._directory, self._prefix):
+            try:
+                stat = os.stat(filename)
+            except OSError:  # removed meanwhile
+                continue
+            if filename != self._filename and self._max_age is not None and now - stat.st_mtime > self._max_age:
+                self._remove(filename)
+            else:
+                sizes.append((filename, stat.st_size))
+        if self._max_bytes is None:
+            return
+        total = sum(size for _, size in sizes)
+        for filename, size in sizes:
+            if total <= self._max_bytes:
+                break
+            if filename != self._filename:
+                self._remove(filename)
+                total -= size
+
+    def _remove(self, filename):
+        logger.debug('removing archive file "{}"'.format(filename))
+        try:
+            os.remove(filename)
+        except OSError as err:
+            logger.warning('failed to remove archive file "{}": {}'.format(filename, err))
+        else:
+            self._stats['pruned'] += 1
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def _open_file(self, paths, timestamp):
+        self.close()
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        sequence = 0
+        while True:
+            self._filename = os.path.join(
+                self._directory, '{}-{:014.3f}-{:03d}{}'.format(self._prefix, timestamp, sequence, FILE_SUFFIX))
+            if not os.path.exists(self._filename):
+                break
+            sequence += 1
+        logger.debug('starting archive file "{}" with {} paths'.format(self._filename, len(paths)))
+        dictionary = '\n'.join(paths).encode('utf-8')
+        self._file = open(self._filename, 'w+b')
+        self._file.write(_HEADER.pack(MAGIC, LAYOUT_VERSION, _LITTLE_ENDIAN, len(paths), len(dictionary)))
+        self._file.write(dictionary.ljust(_pad(len(dictionary)), b'\0'))
+        self._paths = paths
+        self._index = dict((path, index) for index, path in enumerate(paths))
+        self._segments = 0
+        self._segment_offset = self._file.tell()
+        self._last_write = timestamp
+        self._stats['files'] += 1
+        self._start_segment(first=True)
+        self.prune()
+
+    def _add_paths(self, paths):
+        rows = len(self._timestamps)
+        if rows:
+            self._write_segment(capacity=rows)
+            self._start_segment(capacity=rows)
+            if self._file is None:
+                return
+        logger.debug('adding {} paths to archive file "{}"'.format(len(paths), self._filename))
+        dictionary = '\n'.join(paths).encode('utf-8')
+        self._file.seek(self._segment_offset)
+        self._file.write(_DICTIONARY_HEADER.pack(DICTIONARY_MAGIC, len(paths), len(dictionary)))
+        self._file.write(dictionary.ljust(_pad(len(dictionary)), b'\0'))
+        # a flushed partial segment might have been written past the extension
+        self._file.truncate()
+        self._segment_offset = self._file.tell()
+        for path in paths:
+            self._index[path] = len(self._paths)
+            self._paths.append(path)
+        self._columns = [array('d') for _ in self._paths]
+
+    def _start_segment(self, first=False, capacity=None):
+        if not first:
+            capacity = self._segment_rows if capacity is None else capacity
+            self._segment_offset += _SEGMENT_HEADER.size + 8 * capacity * (len(self._paths) + 1)
+            self._segments += 1
+        self._timestamps = array('d')
+        self._columns = [array('d') for _ in self._paths]
+        if self._segments == self._max_segments:
+            # the next sample starts a new file
+            self._file.close()
+            self._file = None
+
+    def _write_segment(self, capacity=None):
+        capacity = self._segment_rows if capacity is None else capacity
+        rows = len(self._timestamps)
+        padding = b'\0' * (8 * (capacity - rows))
+        self._file.seek(self._segment_offset)
+        self._file.write(_SEGMENT_HEADER.pack(SEGMENT_MAGIC, rows, capacity, len(self._columns)))
+        for column in [self._timestamps] + self._columns:
+            self._file.write(_array_to_bytes(column))
+            self._file.write(padding)
+        if rows == capacity:
+            self._stats['segments'] += 1
+
+
+class ArchiveReader(object):
+    """Read series from an archive file, by memory mapping the file.
+
+    Only the headers and the dictionary are parsed when the file is opened.
+    Series are read from the columns of the path in each segment (NaN in the
+    segments before the path was added): with NumPy they are arrays that are
+    views into the mapped file (when the series is in a single segment),
+    otherwise array('d') copies of the columns.
+
+    :param str filename: path to the archive file
+    :param bool use_numpy: return NumPy arrays, default is when NumPy is available
+    :raises ElasticMetricsError: if the file is not an archive file
+    """
+
+    def __init__(self, filename, use_numpy=None):
+        if use_numpy and numpy is None:
+            raise ElasticMetricsError('NumPy is not available')
+        self._use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self._filename = filename
+        with open(filename, 'rb') as archive_file:
+            self._mmap = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse()
+        except (struct.error, ValueError) as err:
+            self.close()
+            raise ElasticMetricsError('invalid archive file "{}": {}'.format(filename, err))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def paths(self):
+        return self._paths
+
+    def __len__(self):
+        """Number of samples in the file"""
+        return sum(rows for _, rows, _, _ in self._segments)
+
+    def timestamps(self):
+        """Return the timestamps of the samples"""
+        return self._column(0)
+
+    def series(self, path):
+        """Return the values of the path in all the samples (NaN when missing)
+
+        :param str path: flattened path of the metric
+        :raises ElasticMetricsError: if the path is not in the file
+        """
+        if path not in self._index:
+            raise ElasticMetricsError('path "{}" not in archive "{}"'.format(path, self._filename))
+        return self._column(self._index[path] + 1)
+
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # NumPy views of series still use the mapping, it's closed when they're released
+                pass
+            self._mmap = None
+
+    def _parse(self):
+        magic, version, byteorder, path_count, dictionary_size = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError('not an archive file')
+        if version != LAYOUT_VERSION:
+            raise ValueError('unsupported layout version "{}"'.format(version))
+        self._little_endian = byteorder == 1
+        self._byteswap = byteorder != _LITTLE_ENDIAN
+        paths = self._read_paths(_HEADER.size, path_count, dictionary_size)
+        offset = _HEADER.size + _pad(dictionary_size)
+
+        # segments: (offset of the first column, rows, capacity, number of paths)
+        self._segments = []
+        while offset + _SEGMENT_HEADER.size <= len(self._mmap):
+            magic = self._mmap[offset:offset + 4]
+            if magic == DICTIONARY_MAGIC:
+                _, path_count, dictionary_size = _DICTIONARY_HEADER.unpack_from(self._mmap, offset)
+                offset += _DICTIONARY_HEADER.size
+                paths.extend(self._read_paths(offset, path_count, dictionary_size))
+                offset += _pad(dictionary_size)
+                continue
+            if magic != SEGMENT_MAGIC:
+                break
+            _, rows, capacity, columns = _SEGMENT_HEADER.unpack_from(self._mmap, offset)
+            if columns > len(paths):
+                raise ValueError('segment columns of unknown paths')
+            columns_offset = offset + _SEGMENT_HEADER.size
+            offset = columns_offset + 8 * capacity * (columns + 1)
+            if offset > len(self._mmap):
+                break
+            self._segments.append((columns_offset, rows, capacity, columns))
+        self._paths = tuple(paths)
+        self._index = dict((path, index) for index, path in enumerate(self._paths))
+
+    def _read_paths(self, offset, path_count, dictionary_size):
+        dictionary = self._mmap[offset:offset + dictionary_size].decode('utf-8')
+        paths = dictionary.split('\n') if path_count else []
+        if len(paths) != path_count:
+            raise ValueError('invalid path dictionary')
+        return paths
+
+    def _column(self, column):
+        parts = []
+        for columns_offset, rows, capacity, columns in self._segments:
+            start = columns_offset + 8 * capacity * column
+            if column > columns:
+                # the path was added after the segment
+                parts.append(numpy.full(rows, _NAN) if self._use_numpy else array('d', [_NAN] * rows))
+            elif self._use_numpy:
+                dtype = numpy.dtype('<f8' if self._little_endian else '>f8')
+                parts.append(numpy.frombuffer(self._mmap, dtype=dtype, count=rows, offset=start))
+            else:
+                values = _array_from_bytes(self._mmap[start:start + 8 * rows])
+                if self._byteswap:
+                    values.byteswap()
+                parts.append(values)
+        if self._use_numpy:
+            if len(parts) == 1:
+                return parts[0]
+            return numpy.concatenate(parts) if parts else numpy.empty(0)
+        values = array('d')
+        for part in parts:
+            values.extend(part)
+        return values
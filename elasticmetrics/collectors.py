@@ -1,11 +1,34 @@
+import time
 from logging import getLogger
 from .http import HttpClient
+from .streaming import iter_json_array
+from .exceptions import ElasticMetricsError
 
 
 PATH_CLUSTER_HEALTH = '_cluster/health'
 PATH_CLUSTER_STATS = '_cluster/stats'
 PATH_CLUSTER_PENDING_TASKS = '_cluster/pending_tasks'
 PATH_NODE_STATS = '_nodes/_local/stats'
+PATH_NODE_INFO = '_nodes'
+PATH_CAT_HEALTH = '_cat/health'
+PATH_CAT_THREAD_POOL = '_cat/thread_pool'
+# columns requested from _cat APIs, parsed by metrics.cat_health_metrics and cat_thread_pool_metrics.
+# id is the full node ID, to select the thread pools of a node
+CAT_HEALTH_COLUMNS = ('status', 'shards', 'pri', 'relo', 'init', 'pending_tasks', 'max_task_wait_time',
+                      'active_shards_percent')
+CAT_THREAD_POOL_COLUMNS = ('id', 'name', 'active', 'queue', 'rejected', 'largest', 'completed', 'pool_size')
+NODE_INFO_FILTER_PATH = 'nodes.*.name,nodes.*.host,nodes.*.version,nodes.*.roles,nodes.*.attributes'
+DEFAULT_NODE_INFO_TTL = 3600
+
+NODE_STATS_SECTIONS = ('adaptive_selection', 'breaker', 'discovery', 'fs', 'http', 'indices', 'ingest', 'jvm',
+                       'os', 'process', 'script', 'thread_pool', 'transport')
+
+TARGET_PATHS = {
+    'cluster_health': PATH_CLUSTER_HEALTH,
+    'cluster_stats': PATH_CLUSTER_STATS,
+    'cluster_pending_tasks': PATH_CLUSTER_PENDING_TASKS,
+    'node_stats': PATH_NODE_STATS,
+}
 
 
 logger = getLogger(__name__)
@@ -20,11 +43,25 @@ class ElasticSearchCollector(HttpClient):
     :param str password: HTTP basic auth password
     :param str scheme: URL scheme, http/https
     :param dict headers: dictionary of additional headers
+    :param ssl.SSLContext|dict ssl_context: an SSLContext instance, or dict for SSL config
+    :param float node_info_ttl: seconds to cache node info, see cached_node_info
     """
 
     default_port_http = 9200
     default_port_https = 9200
 
+    def __init__(self, host, port=None, user='', password='', scheme='http', headers=None,
+                 ssl_context=None, node_info_ttl=DEFAULT_NODE_INFO_TTL):
+        super(ElasticSearchCollector, self).__init__(host, port, user, password, scheme, headers, ssl_context)
+        self._node_info_ttl = node_info_ttl
+        self._node_info = {}
+        self._node_info_loaded = None
+        self._node_info_missing = set()
+
+    @property
+    def node_info_ttl(self):
+        return self._node_info_ttl
+
     def cluster_health(self):
         """Collect cluster health status
 
@@ -50,10 +87,99 @@ class ElasticSearchCollector(HttpClient):
         logger.debug('getting cluster pending tasks')
         return self._get_json(PATH_CLUSTER_PENDING_TASKS)
 
-    def node_stats(self):
-        """Collect statistics from local node.
+    def iter_cluster_pending_tasks(self, chunk_size=65536):
+        """Iterate over pending cluster-level changes (tasks), decoding the response
+        incrementally. Memory usage is constant however long the queue is.
+
+        :param int chunk_size: size of the chunks of the response to read
+        :return: generator of task dicts
+        :raise ElasticMetricsRequestError: on failed requests or invalid responses
+        """
+        logger.debug('streaming cluster pending tasks')
+        return iter_json_array(self._get_chunks(PATH_CLUSTER_PENDING_TASKS, chunk_size), 'tasks')
+
+    def node_stats(self, sections=None, node_ids=None):
+        """Collect statistics from local node. Optionally only the specified
+        sections of the stats (like "jvm" or "indices") are collected, and/or
+        from the specified nodes (like "_all") instead of the local node.
 
+        :param iterable sections: stats sections to collect, default is all
+        :param iterable node_ids: IDs (or ES node filters) of the nodes, default is the local node
+        :rtype: dict
+        :raise ElasticMetricsError: on invalid sections
+        """
+        path = PATH_NODE_STATS
+        if node_ids:
+            path = '{}/{}/stats'.format(PATH_NODE_INFO, ','.join(sorted(node_ids)))
+        if not sections:
+            logger.debug('getting node statistics')
+            return self._get_json(path)
+
+        sections = sorted(set(sections))
+        invalid_sections = set(sections).difference(NODE_STATS_SECTIONS)
+        if invalid_sections:
+            raise ElasticMetricsError('invalid node stats sections: {}'.format(','.join(sorted(invalid_sections))))
+        logger.debug('getting node statistics for {}'.format(','.join(sections)))
+        return self._get_json('{}/{}'.format(path, ','.join(sections)))
+
+    def node_info(self, node_ids=None):
+        """Collect node metadata: name, host, version, roles and attributes.
+        Default is the local node.
+
+        :param iterable node_ids: IDs of the nodes, default is the local node
         :rtype: dict
         """
-        logger.debug('getting node statistics')
-        return self._get_json(PATH_NODE_STATS)
+        node_ids = ','.join(sorted(node_ids)) if node_ids else '_local'
+        logger.debug('getting node info for {}'.format(node_ids))
+        return self._get_json('{}/{}?filter_path={}'.format(PATH_NODE_INFO, node_ids, NODE_INFO_FILTER_PATH))
+
+    def cached_node_info(self, node_ids=()):
+        """Return node metadata (see node_info) of the nodes that are in a stats
+        response, mapped by node IDs. Node info is requested for the same nodes
+        the stats are collected from, and cached. The cache is refreshed when
+        it's older than node info TTL, or when unknown node IDs are passed.
+        Node IDs still unknown after a refresh do not trigger refreshes until
+        the TTL expires.
+
+        :param iterable node_ids: IDs of the nodes from a stats response
+        :return dict: node IDs mapped to node info
+        """
+        unknown_node_ids = set(node_ids).difference(self._node_info, self._node_info_missing)
+        now = time.time()
+        if self._node_info_loaded is None or unknown_node_ids or now - self._node_info_loaded >= self._node_info_ttl:
+            self._node_info = self.node_info().get('nodes', {})
+            self._node_info_loaded = now
+            self._node_info_missing = set(node_ids).difference(self._node_info)
+        return self._node_info
+
+    def cat_health(self):
+        """Collect cluster health from the _cat API, as compact text rows of
+        CAT_HEALTH_COLUMNS (times in milliseconds). Much lighter than cluster_health
+        for high frequency polling, see metrics.cat_health_metrics.
+
+        :rtype: str
+        """
+        logger.debug('getting cat health')
+        return self._get_text('{}?h={}&time=ms'.format(PATH_CAT_HEALTH, ','.join(CAT_HEALTH_COLUMNS)))
+
+    def cat_thread_pool(self):
+        """Collect thread pools of all nodes from the _cat API, as compact text rows
+        of CAT_THREAD_POOL_COLUMNS. See metrics.cat_thread_pool_metrics.
+
+        :rtype: str
+        """
+        logger.debug('getting cat thread pool')
+        return self._get_text('{}?h={}'.format(PATH_CAT_THREAD_POOL, ','.join(CAT_THREAD_POOL_COLUMNS)))
+
+    def raw_stats(self, target):
+        """Collect the raw response body of the target, without decoding it.
+        Target is the name of one of the collecting methods, like "node_stats".
+
+        :param str target: name of the target
+        :rtype: bytes
+        :raise ElasticMetricsError: on invalid target
+        """
+        if target not in TARGET_PATHS:
+            raise ElasticMetricsError('invalid target "{}"'.format(target))
+        logger.debug('getting raw {}'.format(target))
+        return self._get(TARGET_PATHS[target])
@@ -0,0 +1,134 @@
+"""
+elasticmetrics.derived
+~~~~~~~~~~~~~~~~~~~~~~
+Derive efficiency metrics from counters of consecutive snapshots of flattened
+metrics (paths mapped to values), like mean latency of operations and cache hit
+ratios during each interval.
+"""
+import time
+from numbers import Real
+from collections import OrderedDict
+
+
+# sections (path suffixes) mapped to (total, time in milliseconds, derived name) of operations
+LATENCY_COUNTERS = {
+    'indices.search': (('query_total', 'query_time_in_millis', 'query_latency_in_millis'),
+                       ('fetch_total', 'fetch_time_in_millis', 'fetch_latency_in_millis'),
+                       ('scroll_total', 'scroll_time_in_millis', 'scroll_latency_in_millis')),
+    'indices.indexing': (('index_total', 'index_time_in_millis', 'index_latency_in_millis'),
+                         ('delete_total', 'delete_time_in_millis', 'delete_latency_in_millis')),
+    'indices.get': (('total', 'time_in_millis', 'latency_in_millis'),),
+    'indices.refresh': (('total', 'total_time_in_millis', 'latency_in_millis'),),
+    'indices.flush': (('total', 'total_time_in_millis', 'latency_in_millis'),),
+    'indices.merges': (('total', 'total_time_in_millis', 'latency_in_millis'),),
+}
+# sections (path suffixes) mapped to (hits, misses, derived name) of caches
+HIT_RATIO_COUNTERS = {
+    'indices.query_cache': (('hit_count', 'miss_count', 'hit_ratio'),),
+    'indices.request_cache': (('hit_count', 'miss_count', 'hit_ratio'),),
+}
+
+_LATENCY = 0
+_HIT_RATIO = 1
+
+
+def _is_counter(value):
+    return isinstance(value, Real) and not isinstance(value, bool)
+
+
+class DerivedMetrics(object):
+    """Derive gauges from pairs of counters, between consecutive snapshots:
+
+        - mean latency of operations, as the increase of total time in milliseconds
+          divided by the increase of the number of operations (like
+          indices.search.query_latency_in_millis from query_time_in_millis and query_total)
+        - cache hit ratios, as the increase of hits divided by the increase of
+          lookups (like indices.query_cache.hit_ratio from hit_count and miss_count)
+
+    Counters are matched by the last parts of their paths, so metrics of any node
+    (prefixed by the node alias or name) are derived. Derived metrics are named
+    like the counters, in the same section. They are not derived for the first
+    snapshot, for intervals without operations (or lookups), or when counters are
+    reset (like when a node restarts).
+
+    Counters are compared to their previous values, from the last call they were
+    in, so snapshots of different targets or clusters (like of tiers, or of a fleet)
+    can be interleaved. Counters not in any snapshot for expire_after seconds (like
+    of nodes that left the cluster) are forgotten.
+
+    :param dict latency_counters: sections mapped to tuples of (total, time, derived name)
+    :param dict hit_ratio_counters: sections mapped to tuples of (hits, misses, derived name)
+    :param int max_cached_paths: maximum number of paths to cache matches for
+    :param float expire_after: seconds after which counters no longer seen are forgotten,
+                               None to keep them
+    """
+
+    def __init__(self, latency_counters=None, hit_ratio_counters=None, max_cached_paths=100000,
+                 expire_after=None):
+        self._rules = {}
+        for kind, counters in ((_LATENCY, LATENCY_COUNTERS if latency_counters is None else latency_counters),
+                               (_HIT_RATIO, HIT_RATIO_COUNTERS if hit_ratio_counters is None else hit_ratio_counters)):
+            for section, pairs in counters.items():
+                for first, second, name in pairs:
+                    # rules are matched by the last key of paths, then by the section
+                    self._rules.setdefault(first, []).append((section, second, name, kind))
+        self._max_cached_paths = max_cached_paths
+        self._expire_after = expire_after
+        self._matches = {}
+        # derived paths mapped to (first counter, second counter, timestamp)
+        self._previous = {}
+
+    def derive(self, metrics, timestamp=None):
+        """Return the metrics derived from the counters in the metrics, compared
+        to their values in the previous call they were in.
+
+        :param dict metrics: flattened paths mapped to metric values
+        :param float timestamp: collection time of the metrics, default is now
+        :return OrderedDict: derived paths mapped to values
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        derived = OrderedDict()
+        previous = self._previous
+        current = {}
+        for path in metrics:
+            matches = self._matches.get(path)
+            if matches is None:
+                matches = self._match(path)
+            for derived_path, second_path, kind in matches:
+                first, second = metrics[path], metrics.get(second_path)
+                if not (_is_counter(first) and _is_counter(second)):
+                    continue
+                current[derived_path] = (first, second, timestamp)
+                if derived_path not in previous:
+                    continue
+                first_delta = first - previous[derived_path][0]
+                second_delta = second - previous[derived_path][1]
+                if first_delta < 0 or second_delta < 0:
+                    # counters are reset
+                    continue
+                if kind == _LATENCY:
+                    if first_delta:
+                        derived[derived_path] = second_delta / float(first_delta)
+                elif first_delta + second_delta:
+                    derived[derived_path] = first_delta / float(first_delta + second_delta)
+        previous.update(current)
+        if self._expire_after is not None and len(previous) > len(current):
+            seen_after = timestamp - self._expire_after
+            for derived_path in [path for (path, values) in previous.items() if values[2] < seen_after]:
+                del previous[derived_path]
+        return derived
+
+    def reset(self):
+        """Forget the previous counters, metrics are derived again from the next two calls"""
+        self._previous = {}
+
+    def _match(self, path):
+        parent, _, key = path.rpartition('.')
+        matches = []
+        for section, second, name, kind in self._rules.get(key, ()):
+            if parent == section or parent.endswith('.' + section):
+                matches.append(('{}.{}'.format(parent, name), '{}.{}'.format(parent, second), kind))
+        if len(self._matches) >= self._max_cached_paths:
+            self._matches = {}
+        self._matches[path] = matches
+        return matches
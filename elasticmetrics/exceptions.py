@@ -13,3 +13,8 @@ class ElasticMetricsError(Exception):
 class ElasticMetricsRequestError(ElasticMetricsError):
     """Errors on failure to query ElasticSearch"""
     pass
+
+
+class ReplayFinished(ElasticMetricsError):
+    """All the recorded responses are replayed"""
+    pass
@@ -0,0 +1,201 @@
+"""
+elasticmetrics.exporter
+~~~~~~~~~~~~~~~~~~~~~~~
+Serve metrics over HTTP for Prometheus to scrape.
+"""
+import time
+import threading
+from logging import getLogger
+from .pystdlib.http_server import HTTPServer, BaseHTTPRequestHandler, ThreadingMixIn
+from .exceptions import ElasticMetricsError
+
+
+CONTENT_TYPE_PROMETHEUS = 'text/plain; version=0.0.4; charset=utf-8'
+
+logger = getLogger(__name__)
+
+
+class MetricsCache(object):
+    """Cache the results of a collection function, refreshed in the background.
+
+    Readers always get the most recently cached results. Only when there are
+    no results yet, readers trigger a collection. Concurrent collections are
+    never started, callers arriving while a collection is in flight wait for it
+    and share its results.
+
+    :param callable collect: function that collects and returns the results
+    :param float interval: seconds between background refreshes
+    """
+
+    def __init__(self, collect, interval):
+        self._collect = collect
+        self._interval = interval
+        self._condition = threading.Condition(threading.Lock())
+        self._in_flight = False
+        self._value = None
+        self._updated = None
+        self._collections = 0
+        self._errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self):
+        """Return the cached results, collect the results if nothing
+        is cached yet.
+
+        :raise ElasticMetricsError: when no results are available
+        """
+        value = self._value
+        if value is None:
+            value = self.refresh()
+        if value is None:
+            raise ElasticMetricsError('no metrics are collected yet')
+        return value
+
+    def refresh(self):
+        """Collect and cache the results. If a collection is already in flight,
+        wait for it and return its results instead.
+        """
+        with self._condition:
+            if self._in_flight:
+                while self._in_flight:
+                    self._condition.wait()
+                return self._value
+            self._in_flight = True
+
+        value = None
+        try:
+            value = self._collect()
+        except Exception as err:
+            logger.error('failed to collect metrics: {}'.format(err))
+
+        with self._condition:
+            self._collections += 1
+            if value is None:
+                self._errors += 1
+            else:
+                self._value = value
+                self._updated = time.time()
+            self._in_flight = False
+            self._condition.notify_all()
+            return self._value
+
+    def start(self):
+        """Start refreshing the cache in a background thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name='elasticmetrics-cache-refresh')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background refresh thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            started = time.time()
+            self.refresh()
+            self._stop.wait(max(0, self._interval - (time.time() - started)))
+
+    @property
+    def updated(self):
+        """Timestamp of the last successful collection, None if there was none"""
+        return self._updated
+
+    @property
+    def collections(self):
+        return self._collections
+
+    @property
+    def errors(self):
+        return self._errors
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self._respond(404, 'not found\n', 'text/plain; charset=utf-8')
+            return
+        try:
+            body = self.server.exporter.render()
+        except ElasticMetricsError as err:
+            self._respond(503, '{}\n'.format(err), 'text/plain; charset=utf-8')
+            return
+        self._respond(200, body, CONTENT_TYPE_PROMETHEUS)
+
+    def _respond(self, code, body, content_type):
+        body = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug('{} {}'.format(self.address_string(), format % args))
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class PrometheusExporter(object):
+    """Serve metrics from a MetricsCache over HTTP on "/metrics", in Prometheus
+    text exposition format. The cache is expected to hold the metrics already
+    formatted in Prometheus text format (see formatters.prometheus_text).
+
+    Some metrics about the exporter itself are appended to the response.
+
+    :param MetricsCache cache: cache of metrics in Prometheus text format
+    :param str host: address to listen on, default is all addresses
+    :param int port: port number to listen on
+    """
+
+    default_port = 9206
+
+    def __init__(self, cache, host='', port=None):
+        self._cache = cache
+        self._server = _ThreadingHTTPServer((host, port or self.default_port), _MetricsRequestHandler)
+        self._server.exporter = self
+
+    def render(self):
+        """Return the response body for a scrape.
+
+        :raise ElasticMetricsError: when no metrics are available
+        """
+        metrics = self._cache.get()
+        updated = self._cache.updated or 0
+        return '{}elasticmetrics_cache_age_seconds {}\n' \
+               'elasticmetrics_collections_total {}\n' \
+               'elasticmetrics_collection_errors_total {}\n'.format(
+                   metrics,
+                   round(time.time() - updated, 3),
+                   self._cache.collections,
+                   self._cache.errors,
+               )
+
+    def serve_forever(self):
+        """Start refreshing the cache in the background, and serve requests
+        until shutdown is called.
+        """
+        self._cache.start()
+        logger.debug('serving metrics on {}:{}'.format(*self.server_address[:2]))
+        try:
+            self._server.serve_forever()
+        finally:
+            self._cache.stop()
+
+    def shutdown(self):
+        self._server.shutdown()
+
+    def close(self):
+        self._server.server_close()
+
+    @property
+    def server_address(self):
+        return self._server.server_address
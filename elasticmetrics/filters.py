@@ -0,0 +1,83 @@
+"""
+elasticmetrics.filters
+~~~~~~~~~~~~~~~~~~~~~~
+Select which flattened metrics (paths mapped to values) are reported.
+"""
+from array import array
+from numbers import Real
+from collections import OrderedDict
+from .exceptions import ElasticMetricsError
+
+
+class ChangeFilter(object):
+    """Suppress metrics whose values are unchanged since they were last emitted.
+
+    Each call to filter is a cycle. Unchanged metrics are still emitted every
+    heartbeat cycles, so backends can tell a constant series from a missing one.
+    A heartbeat of 1 emits all metrics on every cycle, 0 disables the heartbeat.
+
+    Last emitted values are kept in a list and their cycles in a compact array,
+    indexed by slots from a table of paths. Values are compared exactly, so large
+    integers (like byte counters above 2 ** 53) are not re-emitted due to float
+    rounding, and NaN is unchanged from a previous NaN. Bools are compared like
+    numbers, other non numeric values are always emitted.
+
+    :param int heartbeat: number of cycles to re-send unchanged metrics
+    """
+
+    def __init__(self, heartbeat=0):
+        if heartbeat < 0:
+            raise ElasticMetricsError('invalid heartbeat "{}"'.format(heartbeat))
+        self._heartbeat = heartbeat
+        self._cycle = 0
+        self._slots = {}
+        self._values = []
+        self._emitted = array('l')
+
+    def filter(self, metrics):
+        """Return the metrics that should be emitted in this cycle, preserving
+        their order.
+
+        :param dict metrics: flattened paths mapped to metric values
+        :return OrderedDict: changed (or due for heartbeat) paths mapped to values
+        """
+        cycle = self._cycle
+        heartbeat = self._heartbeat
+        slots = self._slots
+        values = self._values
+        emitted = self._emitted
+        result = OrderedDict()
+        for path, value in metrics.items():
+            if not isinstance(value, Real):
+                result[path] = value
+                continue
+            slot = slots.get(path)
+            if slot is None:
+                slots[path] = len(values)
+                values.append(value)
+                emitted.append(cycle)
+                result[path] = value
+                continue
+            previous = values[slot]
+            # NaN differs from itself, a NaN after a NaN is unchanged
+            changed = previous != value and (previous == previous or value == value)
+            if changed or (heartbeat and cycle - emitted[slot] >= heartbeat):
+                values[slot] = value
+                emitted[slot] = cycle
+                result[path] = value
+        self._cycle += 1
+        return result
+
+    def reset(self):
+        """Forget all the emitted values, the next cycle emits all metrics"""
+        self._cycle = 0
+        self._slots = {}
+        self._values = []
+        self._emitted = array('l')
+
+    @property
+    def heartbeat(self):
+        return self._heartbeat
+
+    def __len__(self):
+        return len(self._slots)
@@ -0,0 +1,293 @@
+"""
+elasticmetrics.fleet
+~~~~~~~~~~~~~~~~~~~~
+Collect metrics from a fleet of ElasticSearch clusters, sharded across
+multiple worker processes.
+"""
+import os
+import json
+import time
+import signal
+import hashlib
+from bisect import bisect
+from collections import OrderedDict
+from logging import getLogger
+from multiprocessing import Process
+from .collectors import ElasticSearchCollector
+from .processing import Processor, TRANSFORMS
+from .exceptions import ElasticMetricsError
+
+
+DEFAULT_TARGETS = ('cluster_health', 'node_stats')
+TARGET_PREFIXES = {
+    'cluster_health': 'cluster',
+    'cluster_stats': 'cluster',
+}
+
+logger = getLogger(__name__)
+
+
+def load_fleet_config(filename):
+    """Load the fleet configuration from a JSON file, which lists the clusters:
+
+        {"clusters": [
+            {"name": "prod", "host": "es.example.org", "port": 9200, "scheme": "https",
+             "user": "metrics", "password_env": "PROD_ES_PASSWORD", "insecure": false,
+             "targets": ["cluster_health", "node_stats"]}
+        ]}
+
+    Only "name" and "host" are required. Passwords can be set directly ("password")
+    or read from an environment variable ("password_env").
+
+    :param str filename: path to the config file
+    :return list: list of cluster config dicts
+    :raise ElasticMetricsError: on invalid config
+    """
+    try:
+        with open(filename, 'rt') as fh:
+            config = json.load(fh)
+    except (IOError, ValueError) as err:
+        raise ElasticMetricsError('failed to load fleet config "{}": {}'.format(filename, err))
+
+    clusters = config.get('clusters') if isinstance(config, dict) else None
+    if not clusters:
+        raise ElasticMetricsError('no clusters are configured in "{}"'.format(filename))
+
+    names = set()
+    for cluster in clusters:
+        if not cluster.get('name') or not cluster.get('host'):
+            raise ElasticMetricsError('cluster config requires "name" and "host": {}'.format(cluster))
+        if cluster['name'] in names:
+            raise ElasticMetricsError('duplicate cluster name "{}"'.format(cluster['name']))
+        names.add(cluster['name'])
+        for target in cluster.get('targets', DEFAULT_TARGETS):
+            if target not in TRANSFORMS:
+                raise ElasticMetricsError('invalid target "{}" for cluster "{}"'.format(target, cluster['name']))
+        if cluster.get('password_env'):
+            cluster['password'] = os.environ.get(cluster['password_env'], '')
+    return clusters
+
+
+def create_collector(cluster):
+    """Create an ElasticSearchCollector from a cluster config dict
+
+    :param dict cluster: cluster config
+    :rtype: ElasticSearchCollector
+    """
+    return ElasticSearchCollector(
+        cluster['host'],
+        port=cluster.get('port'),
+        user=cluster.get('user', ''),
+        password=cluster.get('password', ''),
+        scheme=cluster.get('scheme', 'http'),
+        ssl_context={'no_cert_verify': True} if cluster.get('insecure') else None,
+    )
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """Consistent hashing ring, mapping keys to nodes. Each node is placed
+    on the ring multiple times (replicas), so keys are evenly distributed, and
+    adding or removing a node only moves the keys of that node.
+
+    :param iterable nodes: node names
+    :param int replicas: number of points on the ring for each node
+    """
+
+    def __init__(self, nodes, replicas=100):
+        points = []
+        for node in nodes:
+            for replica in range(replicas):
+                points.append((_hash('{}-{}'.format(node, replica)), node))
+        if not points:
+            raise ElasticMetricsError('hash ring requires at least one node')
+        points.sort()
+        self._hashes = [point[0] for point in points]
+        self._nodes = [point[1] for point in points]
+
+    def get(self, key):
+        """Return the node responsible for the key
+
+        :param str key: the key
+        :return: the node
+        """
+        index = bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+def assign_clusters(clusters, workers):
+    """Assign clusters to workers (0 to workers - 1) by consistent hashing
+    of cluster names.
+
+    :param list clusters: cluster configs
+    :param int workers: number of workers
+    :return dict: worker number mapped to the list of its cluster configs
+    """
+    ring = HashRing(range(workers))
+    assignments = dict((worker, []) for worker in range(workers))
+    for cluster in clusters:
+        assignments[ring.get(cluster['name'])].append(cluster)
+    return assignments
+
+
+def run_worker(clusters, interval, create_reporter, cycles=None):
+    """Collect metrics from the clusters every interval seconds, and report the
+    flattened metrics of each cluster (prefixed by the cluster name).
+    Collectors are created once and reused across cycles.
+
+    :param list clusters: cluster configs
+    :param float interval: seconds between collection cycles
+    :param callable create_reporter: returns an object with report_flattened(metrics) and close()
+    :param int cycles: number of cycles to run, default is to run forever
+    """
+    collectors = [(cluster, create_collector(cluster)) for cluster in clusters]
+    processor = Processor()
+    reporter = create_reporter()
+    cycle = 0
+    try:
+        while cycles is None or cycle < cycles:
+            started = time.time()
+            for cluster, collector in collectors:
+                try:
+                    jobs = [
+                        (target,
+                         collector.raw_stats(target),
+                         '.'.join(filter(None, (cluster['name'], TARGET_PREFIXES.get(target)))))
+                        for target in cluster.get('targets', DEFAULT_TARGETS)
+                    ]
+                    metrics = OrderedDict()
+                    for target_metrics in processor.process_many(jobs):
+                        metrics.update(target_metrics)
+                    reporter.report_flattened(metrics)
+                except ElasticMetricsError as err:
+                    logger.error('failed to collect metrics from cluster "{}": {}'.format(cluster['name'], err))
+                except Exception as err:
+                    # an unexpected response of one cluster should not stop the others of this worker
+                    logger.exception('failed to process metrics of cluster "{}": {}'.format(cluster['name'], err))
+            cycle += 1
+            if cycles is None or cycle < cycles:
+                time.sleep(max(0, interval - (time.time() - started)))
+    finally:
+        reporter.close()
+        processor.close()
+
+
+def _worker_main(clusters, interval, create_reporter):
+    # the supervisor's signal handlers are inherited on fork
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_worker(clusters, interval, create_reporter)
+
+
+class FleetSupervisor(object):
+    """Run worker processes collecting metrics from a fleet of clusters,
+    and restart the workers that die.
+
+    Clusters are assigned to workers by consistent hashing of their names,
+    so changing the number of workers moves few clusters between workers.
+
+    See: run_worker
+
+    :param list clusters: cluster configs
+    :param int workers: number of worker processes
+    :param float interval: seconds between collection cycles
+    :param callable create_reporter: called in each worker to create its reporter
+    :param float restart_delay: minimum seconds between restarts of a worker
+    """
+
+    def __init__(self, clusters, workers, interval, create_reporter, restart_delay=5.0):
+        if workers < 1:
+            raise ElasticMetricsError('invalid number of workers "{}"'.format(workers))
+        self._assignments = assign_clusters(clusters, workers)
+        self._interval = interval
+        self._create_reporter = create_reporter
+        self._restart_delay = restart_delay
+        self._processes = {}
+        self._started = {}
+        self._restarts = 0
+        self._running = False
+
+    def start(self):
+        """Start all the worker processes"""
+        self._running = True
+        for worker in self._assignments:
+            self._start_worker(worker)
+
+    def check(self):
+        """Restart dead workers (not sooner than restart_delay seconds since
+        they were started).
+
+        :return int: number of restarted workers
+        """
+        restarted = 0
+        for worker, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            if time.time() - self._started[worker] < self._restart_delay:
+                continue
+            logger.error('worker {} (pid {}) exited with code {}, restarting'.format(
+                worker, process.pid, process.exitcode))
+            process.join()
+            self._start_worker(worker)
+            self._restarts += 1
+            restarted += 1
+        return restarted
+
+    def run(self, check_interval=1.0):
+        """Start the workers and supervise them until stop is called
+        (or the process receives SIGTERM)
+        """
+        def handle_term(signum, frame):
+            self._running = False
+
+        previous_handler = signal.signal(signal.SIGTERM, handle_term)
+        try:
+            self.start()
+            while self._running:
+                time.sleep(check_interval)
+                if self._running:
+                    self.check()
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+            self.stop()
+
+    def stop(self):
+        """Terminate all the worker processes"""
+        self._running = False
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes.values():
+            process.join()
+
+    def _start_worker(self, worker):
+        clusters = self._assignments[worker]
+        if not clusters:
+            return
+        process = Process(
+            target=_worker_main,
+            args=(clusters, self._interval, self._create_reporter),
+            name='elasticmetrics-fleet-worker-{}'.format(worker)
+        )
+        process.daemon = True
+        process.start()
+        self._processes[worker] = process
+        self._started[worker] = time.time()
+        logger.debug('started worker {} (pid {}) for {} clusters'.format(worker, process.pid, len(clusters)))
+
+    @property
+    def assignments(self):
+        """Worker numbers mapped to the names of their clusters"""
+        return dict((worker, [cluster['name'] for cluster in clusters])
+                    for (worker, clusters) in self._assignments.items())
+
+    @property
+    def restarts(self):
+        return self._restarts
+
+    @property
+    def pids(self):
+        return dict((worker, process.pid) for (worker, process) in self._processes.items())
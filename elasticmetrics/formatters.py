@@ -1,4 +1,14 @@
+import re
+import time
+from math import isinf, isnan
+from numbers import Real, Integral
 from collections import OrderedDict
+from .exceptions import ElasticMetricsError
+
+
+_PROMETHEUS_INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_:]')
+_PROMETHEUS_INVALID_LABEL_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+_INFLUX_PRECISION_MULTIPLIERS = {'s': 1, 'ms': 1000, 'us': 1000000, 'ns': 1000000000}
 
 
 def flatten_metrics(metrics, path_separator='.', prefix=''):
@@ -51,3 +61,400 @@ def sort_flatten_metrics_iter(metrics_iter, path_separator='.', prefix=''):
         result[path] = flattened[path]
 
     return result
+
+
+class _ShapeChanged(Exception):
+    pass
+
+
+try:
+    _intern = intern  # noqa: F821 (Python 2)
+except NameError:
+    from sys import intern as _intern
+
+
+class CachedFlattener(object):
+    """Flatten metrics like flatten_metrics, caching the paths across calls.
+
+    On the first call the shape of the metrics hierarchy is learned: the traversal
+    order, and the (interned) path strings. Next calls only read the values
+    following the learned shape, without building any path strings. The shape is
+    learned again whenever the metrics hierarchy changes (keys added, removed or
+    changed between containers and values).
+
+    See: flatten_metrics
+
+    :param str path_separator: separate paths in flattened path from the hierarchy
+    :param str prefix: prefix for the metrics paths
+    :param bool sort: return an OrderedDict sorted by paths
+    """
+
+    def __init__(self, path_separator='.', prefix='', sort=False):
+        self._path_separator = path_separator
+        self._prefix = prefix
+        self._sort = sort
+        # (shape, sorted paths) are replaced at once, so threads can share the flattener
+        self._learned = None
+        self._rebuilds = 0
+
+    def flatten(self, metrics):
+        """Return the flattened metrics.
+
+        :param dict metrics: dictionary of metrics.
+        :return dict: flattened unique paths mapped to metric values
+        """
+        flattened = {}
+        learned = self._learned
+        if learned is not None:
+            try:
+                self._read(metrics, learned[0], flattened)
+            except (KeyError, _ShapeChanged):
+                flattened = {}
+                learned = None
+
+        if learned is None:
+            shape = self._learn(metrics, self._prefix)
+            learned = self._learned = (shape, sorted(self._paths(shape)))
+            self._rebuilds += 1
+            self._read(metrics, shape, flattened)
+
+        if self._sort:
+            result = OrderedDict()
+            for path in learned[1]:
+                result[path] = flattened[path]
+            return result
+        return flattened
+
+    def _learn(self, metrics, prefix):
+        shape = []
+        for name in metrics:
+            value = metrics[name]
+            current_path = _intern(prefix + self._path_separator + name if prefix else name)
+            if isinstance(value, dict):
+                shape.append((name, current_path, self._learn(value, current_path)))
+            else:
+                shape.append((name, current_path, None))
+        return shape
+
+    def _paths(self, shape):
+        for (_, path, sub_shape) in shape:
+            if sub_shape is None:
+                yield path
+            else:
+                for sub_path in self._paths(sub_shape):
+                    yield sub_path
+
+    def _read(self, metrics, shape, flattened):
+        if len(metrics) != len(shape):
+            raise _ShapeChanged()
+        for (name, path, sub_shape) in shape:
+            value = metrics[name]
+            if sub_shape is None:
+                if isinstance(value, dict):
+                    raise _ShapeChanged()
+                flattened[path] = value
+            elif isinstance(value, dict):
+                self._read(value, sub_shape, flattened)
+            else:
+                raise _ShapeChanged()
+
+    @property
+    def rebuilds(self):
+        """Number of times the shape of metrics is learned"""
+        return self._rebuilds
+
+
+def prometheus_metric_name(path, namespace=''):
+    """Return a valid Prometheus metric name from the metric path.
+    Characters that are not allowed in Prometheus names (like the path separator)
+    are replaced with "_".
+
+    :param str path: metric path
+    :param str namespace: prefix for the metric name
+    :return str: Prometheus metric name
+    """
+    name = '{}_{}'.format(namespace, path) if namespace else path
+    name = _PROMETHEUS_INVALID_NAME_CHARS.sub('_', name)
+    if name[:1].isdigit():
+        name = '_' + name
+    return name
+
+
+def prometheus_label_name(name):
+    """Return a valid Prometheus label name. Characters that are not allowed
+    (like dots of node attributes such as "ml.machine_memory") are replaced with "_",
+    and names starting with a digit are prefixed with "_".
+
+    :param str name: label name
+    :return str: Prometheus label name
+    """
+    name = _PROMETHEUS_INVALID_LABEL_NAME_CHARS.sub('_', name)
+    if name[:1].isdigit():
+        name = '_' + name
+    return name
+
+
+def prometheus_labels(labels):
+    """Format the labels dictionary as Prometheus labels (sorted by name),
+    including the braces. Returns an empty string if there are no labels.
+
+    :param dict labels: label names mapped to values
+    :return str: formatted labels
+    """
+    if not labels:
+        return ''
+    escaped = dict(
+        (prometheus_label_name(name),
+         u'{}'.format(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for (name, value) in labels.items()
+    )
+    return '{{{}}}'.format(','.join('{}="{}"'.format(name, escaped[name]) for name in sorted(escaped)))
+
+
+def prometheus_text(metrics, namespace='elasticsearch', labels=None):
+    """Format the flattened metrics (paths mapped to values) in Prometheus
+    text exposition format. Non numeric values are skipped.
+
+    :param dict metrics: flattened paths mapped to metric values
+    :param str namespace: prefix for the metric names
+    :param dict labels: labels added to all the metrics
+    :return str: metrics in Prometheus text format
+    """
+    labels_text = prometheus_labels(labels)
+    lines = []
+    for path, value in metrics.items():
+        if isinstance(value, bool):
+            value = int(value)
+        elif not isinstance(value, Real):
+            continue
+        lines.append('{}{} {}\n'.format(prometheus_metric_name(path, namespace), labels_text, value))
+    return ''.join(lines)
+
+
+class PrometheusTextRenderer(object):
+    """Render flattened metrics in Prometheus text exposition format, like
+    prometheus_text, reusing lines across renders.
+
+    The line of each path is cached with its value, so a line is formatted
+    again only when the value of its path changes, and the metric name (with the
+    labels) is formatted only once. Paths missing from the rendered metrics are
+    dropped from the cache.
+
+    See: prometheus_text
+
+    :param str namespace: prefix for the metric names
+    :param dict labels: labels added to all the metrics
+    :param str strip_prefix: prefix removed from the paths (like the node alias) before naming metrics
+    """
+
+    def __init__(self, namespace='elasticsearch', labels=None, strip_prefix=''):
+        self._namespace = namespace
+        self._strip_prefix = strip_prefix + '.' if strip_prefix else ''
+        self._labels = None
+        self._labels_text = ''
+        self._lines = {}
+        self._reused = 0
+        self._formatted = 0
+        self.labels = labels
+
+    @property
+    def labels(self):
+        return dict(self._labels)
+
+    @labels.setter
+    def labels(self, labels):
+        """Set the labels added to all the metrics. Cached names and lines are
+        reset only if the labels are changed.
+        """
+        labels = dict(labels or {})
+        if labels == self._labels:
+            return
+        self._labels = labels
+        self._labels_text = prometheus_labels(labels)
+        self._lines = {}
+
+    @property
+    def reused(self):
+        """Number of lines reused from previous renders"""
+        return self._reused
+
+    @property
+    def formatted(self):
+        """Number of lines formatted"""
+        return self._formatted
+
+    def render(self, metrics):
+        """Return the metrics in Prometheus text format. Non numeric values are skipped.
+
+        :param dict metrics: flattened paths mapped to metric values
+        :return str: metrics in Prometheus text format
+        """
+        cached_lines = self._lines
+        lines = {}
+        output = []
+        for path, value in metrics.items():
+            if not isinstance(value, Real):
+                continue
+            # cached lines are (value, line, metric name with labels)
+            cached = cached_lines.get(path)
+            if cached is None:
+                cached = (None, None, self._name(path))
+            # 1, 1.0 and True are equal but formatted differently
+            if cached[1] is not None and cached[0] == value and type(cached[0]) is type(value):
+                self._reused += 1
+            else:
+                cached = (value, u'{} {}\n'.format(cached[2], int(value) if isinstance(value, bool) else value),
+                          cached[2])
+                self._formatted += 1
+            lines[path] = cached
+            output.append(cached[1])
+        self._lines = lines
+        return u''.join(output)
+
+    def _name(self, path):
+        if self._strip_prefix and path.startswith(self._strip_prefix):
+            path = path[len(self._strip_prefix):]
+        return prometheus_metric_name(path, self._namespace) + self._labels_text
+
+
+def _influx_escape(text, chars):
+    text = u'{}'.format(text).replace('\\', '\\\\')
+    for char in chars:
+        text = text.replace(char, '\\' + char)
+    return text.encode('utf-8')
+
+
+class InfluxLineEncoder(object):
+    """Encode metrics in InfluxDB line protocol.
+
+    Each dictionary holding metric values becomes a measurement, named by its
+    path in the metrics hierarchy (like "jvm.mem"), with the metric values as
+    fields. Metric values at the top level of the hierarchy are fields of the
+    root measurement. The tags are added to all the measurements.
+
+    Lines are written into a byte buffer that is reused on every call to encode,
+    and encoded measurement names and field keys are cached, so repeated encoding
+    of metrics with the same structure only formats the values.
+
+    :param dict tags: tag names mapped to values, added to all measurements
+    :param str precision: timestamp precision: s, ms, us or ns
+    :param str path_separator: separate paths in measurement names
+    :param str root_measurement: measurement name for top level metrics, when no prefix is used
+    """
+
+    def __init__(self, tags=None, precision='ns', path_separator='.', root_measurement='elasticsearch'):
+        if precision not in _INFLUX_PRECISION_MULTIPLIERS:
+            raise ElasticMetricsError('invalid timestamp precision "{}"'.format(precision))
+        self._precision_multiplier = _INFLUX_PRECISION_MULTIPLIERS[precision]
+        self._path_separator = path_separator
+        self._root_measurement = root_measurement
+        self._tags = None
+        self._encoded_tags = b''
+        self._measurements = {}
+        self._field_keys = {}
+        self._buffer = bytearray()
+        self.tags = tags
+
+    @property
+    def tags(self):
+        return dict(self._tags)
+
+    @tags.setter
+    def tags(self, tags):
+        """Set the tags added to all measurements. Cached measurements are
+        reset only if the tags are changed.
+        """
+        tags = dict((name, value) for (name, value) in (tags or {}).items() if value not in (None, ''))
+        if tags == self._tags:
+            return
+        self._tags = tags
+        self._encoded_tags = b''.join(
+            b',' + _influx_escape(name, ', =') + b'=' + _influx_escape(tags[name], ', =')
+            for name in sorted(tags)
+        )
+        self._measurements = {}
+
+    def encode(self, metrics, timestamp=None, prefix=''):
+        """Encode the metrics into the buffer, replacing its previous contents.
+        The returned buffer is reused by the next call to encode, so it should be
+        consumed (or copied) before that.
+
+        :param dict metrics: dictionary of metrics
+        :param float timestamp: seconds since epoch, default is now
+        :param str prefix: prefix for the measurement names
+        :return bytearray: the encoded lines
+        """
+        del self._buffer[:]
+        return self.encode_into(self._buffer, metrics, timestamp, prefix)
+
+    def encode_into(self, buffer_, metrics, timestamp=None, prefix=''):
+        """Append the encoded metrics to the buffer.
+
+        :param bytearray buffer_: the buffer to write into
+        :param dict metrics: dictionary of metrics
+        :param float timestamp: seconds since epoch, default is now
+        :param str prefix: prefix for the measurement names
+        :return bytearray: the buffer
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        line_end = u' {}\n'.format(int(timestamp * self._precision_multiplier)).encode('ascii')
+        self._encode_measurement(buffer_, metrics, prefix, line_end)
+        return buffer_
+
+    def _encode_measurement(self, buffer_, metrics, path, line_end):
+        sub_measurements = []
+        field_count = 0
+        for name in metrics:
+            value = metrics[name]
+            if isinstance(value, dict):
+                sub_measurements.append(name)
+                continue
+            if value is None or (isinstance(value, float) and (isnan(value) or isinf(value))):
+                # not representable in line protocol, would reject the whole batch
+                continue
+            if field_count == 0:
+                measurement = self._measurements.get(path)
+                if measurement is None:
+                    measurement = _influx_escape(path or self._root_measurement, ', ') + self._encoded_tags
+                    self._measurements[path] = measurement
+                buffer_ += measurement
+                buffer_ += b' '
+            else:
+                buffer_ += b','
+            field_key = self._field_keys.get(name)
+            if field_key is None:
+                field_key = self._field_keys[name] = _influx_escape(name, ', =') + b'='
+            buffer_ += field_key
+            buffer_ += self._encode_value(value)
+            field_count += 1
+        if field_count:
+            buffer_ += line_end
+
+        for name in sub_measurements:
+            sub_path = path + self._path_separator + name if path else name
+            self._encode_measurement(buffer_, metrics[name], sub_path, line_end)
+
+    @staticmethod
+    def _encode_value(value):
+        if isinstance(value, bool):
+            return b'true' if value else b'false'
+        if isinstance(value, Integral):
+            return str(value).encode('ascii') + b'i'
+        if isinstance(value, Real):
+            return repr(float(value)).encode('ascii')
+        return b'"' + u'{}'.format(value).replace('\\', '\\\\').replace('"', '\\"').encode('utf-8') + b'"'
+
+
+def influx_line_protocol(metrics, tags=None, timestamp=None, prefix='', precision='ns'):
+    """Format the metrics in InfluxDB line protocol.
+
+    See: InfluxLineEncoder
+
+    :param dict metrics: dictionary of metrics
+    :param dict tags: tag names mapped to values, added to all measurements
+    :param float timestamp: seconds since epoch, default is now
+    :param str prefix: prefix for the measurement names
+    :param str precision: timestamp precision: s, ms, us or ns
+    :return bytes: the encoded lines
+    """
+    return bytes(InfluxLineEncoder(tags, precision).encode(metrics, timestamp, prefix))
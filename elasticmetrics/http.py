@@ -5,10 +5,12 @@ common functionality over HTTP
 """
 import ssl
 import json
+import time
 from logging import getLogger
 from contextlib import closing
 from base64 import b64encode
 from .pystdlib.urllib_request import urlopen, Request
+from .pystdlib.http_client import HTTPConnection, HTTPSConnection
 from .exceptions import ElasticMetricsError, ElasticMetricsRequestError
 
 
@@ -53,6 +55,10 @@ class HttpClient(object):
                         ).decode('utf-8').strip()
             self._headers['Authorization'] = 'Basic {}'.format(basic_auth)
 
+        self._recorder = None
+        self._latency = None
+        self._max_latency = None
+
         ssl_context = ssl_context or {}
         if scheme == 'https' and hasattr(ssl, 'create_default_context'):
             # Python < 2.7.9 doesn't support create_default_context, but also
@@ -76,32 +82,131 @@ class HttpClient(object):
             return urlopen(request, context=self._ssl_context)
         return urlopen(request)
 
+    def _connection(self, timeout=None):
+        """Create a (keep-alive) connection to the server, with the SSL context
+        for HTTPS. The connection is not opened until the first request.
+
+        :param float timeout: socket timeout in seconds, default is the global default
+        :return: HTTPConnection|HTTPSConnection
+        """
+        kwargs = {} if timeout is None else {'timeout': timeout}
+        if self._scheme == 'https':
+            if self._ssl_context:
+                kwargs['context'] = self._ssl_context
+            return HTTPSConnection(self._host, self._port, **kwargs)
+        return HTTPConnection(self._host, self._port, **kwargs)
+
+    def _url(self, path='/'):
+        """Return the full URL for the URL path.
+        :param str path: the URL path
+        :return: str
+        """
+        return '{}://{}:{}/{}'.format(self._scheme, self._host, self._port, path)
+
     def _create_request(self, path='/'):
         """Create a Request object from the specified URL path.
         :param str path: the URL path
         :return: Request
         """
-        url = '{}://{}:{}/{}'.format(self._scheme, self._host, self._port, path)
-        return Request(url, headers=self._headers)
+        return Request(self._url(path), headers=self._headers)
 
-    def _get_json(self, path):
-        """Send a GET request to the URL path, expecting a JSON response.
-        Returns the decoded data from response.
+    def _get(self, path):
+        """Send a GET request to the URL path, returns the response body.
 
-        :param str path: the URL path that responds with JSON
+        :param str path: the URL path
+        :return: bytes
+        :raise ElasticMetricsRequestError
+        """
+        request = self._create_request(path)
+        url = request.get_full_url()
+        started = time.time()
+        try:
+            logger.debug('requesting URL "{}"'.format(url))
+            with closing(self._urlopen(request)) as response:
+                logger.debug('URL "{}" response code "{}"'.format(url, response.getcode()))
+                body = response.read()
+        except IOError as err:
+            logger.error('failed to request URL "{}": {}'.format(url, err))
+            raise ElasticMetricsRequestError('request error to URL "{}": {}'.format(url, err))
+        elapsed = time.time() - started
+        self._update_latency(elapsed)
+        if self._recorder is not None:
+            self._recorder.record(path, url, started, elapsed, body)
+        return body
+
+    def _get_chunks(self, path, chunk_size=65536):
+        """Send a GET request to the URL path, yields the response body in chunks,
+        so large responses do not have to be kept in memory (unless recording).
+
+        :param str path: the URL path
+        :param int chunk_size: maximum size of the chunks in bytes
+        :return: generator of bytes
         :raise ElasticMetricsRequestError
         """
         request = self._create_request(path)
         url = request.get_full_url()
+        started = time.time()
+        recorded_chunks = [] if self._recorder is not None else None
         try:
             logger.debug('requesting URL "{}"'.format(url))
             with closing(self._urlopen(request)) as response:
-                logger.debug('URL "{}" response code "{}". decoding JSON'.format(url, response.getcode()))
-                return json.loads(response.read().decode('utf-8'))
+                logger.debug('URL "{}" response code "{}"'.format(url, response.getcode()))
+                chunk = response.read(chunk_size)
+                while chunk:
+                    if recorded_chunks is not None:
+                        recorded_chunks.append(chunk)
+                    yield chunk
+                    chunk = response.read(chunk_size)
         except IOError as err:
             logger.error('failed to request URL "{}": {}'.format(url, err))
             raise ElasticMetricsRequestError('request error to URL "{}": {}'.format(url, err))
+        elapsed = time.time() - started
+        self._update_latency(elapsed)
+        if recorded_chunks is not None:
+            self._recorder.record(path, url, started, elapsed, b''.join(recorded_chunks))
+
+    def _update_latency(self, elapsed):
+        """Update the latency with the seconds a completed request took"""
+        self._latency = elapsed
+        self._max_latency = elapsed if self._max_latency is None else max(self._max_latency, elapsed)
+
+    def reset_max_latency(self):
+        """Return the latency of the slowest request since the last reset (None
+        if no requests are completed), and reset it
+
+        :return float: seconds
+        """
+        max_latency, self._max_latency = self._max_latency, None
+        return max_latency
+
+    def _get_text(self, path):
+        """Send a GET request to the URL path, expecting a (UTF-8) text response.
+        Returns the decoded text from response.
+
+        :param str path: the URL path that responds with text
+        :raise ElasticMetricsRequestError
+        """
+        body = self._get(path)
+        try:
+            return body.decode('utf-8')
+        except UnicodeDecodeError as err:
+            url = self._url(path)
+            logger.error('invalid text response from "{}": {}'.format(url, err))
+            raise ElasticMetricsRequestError('invalid text response from "{}": {}'.format(url, err))
+
+    def _get_json(self, path):
+        """Send a GET request to the URL path, expecting a JSON response.
+        Returns the decoded data from response.
+
+        :param str path: the URL path that responds with JSON
+        :raise ElasticMetricsRequestError
+        """
+        body = self._get(path)
+        try:
+            logger.debug('decoding JSON response from "{}"'.format(path))
+            return json.loads(body.decode('utf-8'))
         except ValueError as err:
+            url = self._url(path)
             logger.error('invalid JSON response from "{}": {}'.format(url, err))
             raise ElasticMetricsRequestError(
                       'invalid JSON response from "{}": {}'.format(url, err)
@@ -134,3 +239,17 @@ class HttpClient(object):
     @property
     def ssl_context(self):
         return self._ssl_context
+
+    @property
+    def latency(self):
+        """Seconds from sending the last completed request to reading its response"""
+        return self._latency
+
+    @property
+    def recorder(self):
+        """Recorder of responses (like recording.ResponseRecorder), None to not record"""
+        return self._recorder
+
+    @recorder.setter
+    def recorder(self, recorder):
+        self._recorder = recorder
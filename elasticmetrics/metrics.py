@@ -1,4 +1,8 @@
+import heapq
 from copy import copy
+from collections import namedtuple
+from .streaming import QuantileSketch
+from .exceptions import ElasticMetricsRequestError
 
 
 STATUS_CODES = {
@@ -8,6 +12,42 @@ STATUS_CODES = {
 }
 
 
+def _cat_int(value):
+    """Parse an integer column of _cat APIs, like "12", "10ms" or "-" (for none)"""
+    value = value.rstrip('%smh')
+    return int(float(value)) if value and value != '-' else 0
+
+
+# fixed schemas of _cat API rows, in the order of the columns requested by the collector
+# (collectors.CAT_HEALTH_COLUMNS and CAT_THREAD_POOL_COLUMNS): metric names (as named by
+# cluster_health_metrics and node_performance_metrics) and value parsers
+_CAT_HEALTH_SCHEMA = (
+    ('status', lambda value: STATUS_CODES.get(value.lower(), 0)),
+    ('active_shards', _cat_int),
+    ('active_primary_shards', _cat_int),
+    ('relocating_shards', _cat_int),
+    ('initializing_shards', _cat_int),
+    ('number_of_pending_tasks', _cat_int),
+    ('task_max_waiting_in_queue_millis', _cat_int),
+    ('active_shards_percent_as_number', _cat_int),
+)
+# thread pool rows start with the node ID and the thread pool name
+_CAT_THREAD_POOL_SCHEMA = (
+    ('active', _cat_int),
+    ('queue', _cat_int),
+    ('rejected', _cat_int),
+    ('largest', _cat_int),
+    ('completed', _cat_int),
+    ('threads', _cat_int),
+)
+
+PENDING_TASK_PRIORITIES = ('immediate', 'urgent', 'high', 'normal', 'low', 'languid')
+PENDING_TASKS_PERCENTILES = (50, 90, 99)
+
+# roles are reported as flags, known roles are always reported to keep the metrics stable
+NODE_ROLES = ('data', 'ingest', 'master', 'ml', 'remote_cluster_client', 'transform', 'voting_only')
+
+
 def cluster_health_metrics(health_stats):
     """From cluster health stats structure, returns a dictionary of cluster metrics.
 
@@ -28,22 +68,158 @@ def cluster_health_metrics(health_stats):
     return metrics
 
 
-def node_performance_metrics(node_stats):
+def cat_health_metrics(cat_health):
+    """From _cat/health rows (columns of collectors.CAT_HEALTH_COLUMNS, times in milliseconds),
+    returns a dictionary of cluster metrics named like cluster_health_metrics.
+    Metrics not available from the _cat API (delayed_unassigned_shards and
+    number_of_in_flight_fetch) are not included.
+
+    :param str cat_health: text response of _cat/health API
+    :return dict: selection of cluster metrics (numeric values)
+    :raise ElasticMetricsRequestError: on rows not matching the columns
+    """
+    for fields in _cat_rows(cat_health, len(_CAT_HEALTH_SCHEMA)):
+        return {name: parse(value) for (name, parse), value in zip(_CAT_HEALTH_SCHEMA, fields)}
+    return {}
+
+
+def cat_thread_pool_metrics(cat_thread_pool, node_id):
+    """From _cat/thread_pool rows (columns of collectors.CAT_THREAD_POOL_COLUMNS),
+    returns a dictionary of thread pool metrics of the node, named like the thread_pool
+    metrics of node_performance_metrics.
+
+    :param str cat_thread_pool: text response of _cat/thread_pool API
+    :param str node_id: full ID of the node
+    :return dict: thread pool metrics (numeric values)
+    :raise ElasticMetricsRequestError: on rows not matching the columns
+    """
+    thread_pools = {}
+    for fields in _cat_rows(cat_thread_pool, len(_CAT_THREAD_POOL_SCHEMA) + 2):
+        if fields[0] == node_id:
+            thread_pools[fields[1]] = {
+                name: parse(value) for (name, parse), value in zip(_CAT_THREAD_POOL_SCHEMA, fields[2:])
+            }
+    return {'thread_pool': thread_pools} if thread_pools else {}
+
+
+def _cat_rows(text, columns):
+    """Yield the fields of each (non empty) row of a _cat API text response,
+    with the number of columns
+    """
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        if len(fields) != columns:
+            raise ElasticMetricsRequestError('invalid _cat row, expected {} columns: "{}"'.format(columns, line))
+        yield fields
+
+
+def cluster_stats_metrics(cluster_stats):
+    """From cluster stats structure, returns a dictionary of cluster wide metrics,
+    aggregated over all nodes: indices (docs, store, caches, segments) and nodes
+    (counts by role, OS memory, process, JVM and file system metrics).
+
+    :param dict cluster_stats: dict of cluster stats, as returned from _cluster/stats API
+    :return dict: selection of cluster metrics (numeric values)
+    """
+    metrics = {}
+    if 'status' in cluster_stats:
+        metrics['status'] = STATUS_CODES.get(cluster_stats['status'].lower().strip(), 0)
+
+    indices_stats = cluster_stats.get('indices')
+    if indices_stats:
+        metrics['indices'] = _get_cluster_indices_metrics(indices_stats)
+
+    nodes_stats = cluster_stats.get('nodes')
+    if nodes_stats:
+        metrics['nodes'] = _get_cluster_nodes_metrics(nodes_stats)
+
+    return metrics
+
+
+def cluster_pending_tasks_metrics(pending_tasks, percentiles=PENDING_TASKS_PERCENTILES):
+    """From cluster pending tasks, returns a dictionary of pending tasks metrics:
+    count of tasks (total, executing and per priority), the time in queue of the
+    oldest task, and approximate percentiles of time in queue.
+
+    Tasks are summarized while iterating, in constant memory, so a generator of
+    tasks (see ElasticSearchCollector.iter_cluster_pending_tasks) can be passed
+    instead of the whole response.
+
+    :param dict|iterable pending_tasks: dict as returned from _cluster/pending_tasks API, or iterable of tasks
+    :param iterable percentiles: percentiles of time in queue to report
+    :return dict: pending tasks metrics (numeric values)
+    """
+    tasks = pending_tasks.get('tasks', ()) if isinstance(pending_tasks, dict) else pending_tasks
+    priorities = {priority: 0 for priority in PENDING_TASK_PRIORITIES}
+    sketch = QuantileSketch()
+    count, executing, oldest = 0, 0, 0
+    for task in tasks:
+        count += 1
+        if task.get('executing'):
+            executing += 1
+        # tasks without a priority are counted as unknown, an empty key would end the path with a dot
+        priority = (task.get('priority') or 'unknown').lower()
+        priorities[priority] = priorities.get(priority, 0) + 1
+        time_in_queue = task.get('time_in_queue_millis', 0)
+        oldest = max(oldest, time_in_queue)
+        sketch.add(time_in_queue)
+
+    return {
+        'count': count,
+        'executing': executing,
+        'oldest_time_in_queue_millis': oldest,
+        'priority': priorities,
+        'time_in_queue_millis': {
+            'p{}'.format(percentile): int(round(sketch.quantile(percentile / 100.0) or 0))
+            for percentile in percentiles
+        },
+    }
+
+
+def node_performance_metrics(node_stats, node_info=None):
     """From node stats structure, returns a dictionary of node performance metrics.
+    If node info is provided, node metadata is added to metrics (see node_info_metrics).
 
     :param dict node_stats: dict of node stats, as returned by _nodes/*/stats API
+    :param dict node_info: node IDs mapped to node info, as returned by _nodes API
     :return dict: selection of node performance metrics (numeric values)
     """
-    metrics = {}
     node_id = list(node_stats['nodes'].keys()).pop()
-    node_data = node_stats['nodes'][node_id]
+    return _node_metrics(node_id, node_stats['nodes'][node_id], node_info)
+
+
+def nodes_performance_metrics(node_stats, node_info=None):
+    """From node stats structure of multiple nodes, returns a dictionary of
+    node names (node IDs if names are not available) mapped to node performance
+    metrics (see node_performance_metrics).
+
+    :param dict node_stats: dict of node stats, as returned by _nodes/*/stats API
+    :param dict node_info: node IDs mapped to node info, as returned by _nodes API
+    :return dict: node names mapped to node performance metrics
+    """
+    return {
+        node_data.get('name', node_id): _node_metrics(node_id, node_data, node_info)
+        for node_id, node_data in node_stats['nodes'].items()
+    }
+
+
+def _node_metrics(node_id, node_data, node_info=None):
+    metrics = {}
+
+    # node metadata
+    if node_info and node_id in node_info:
+        metrics['node'] = node_info_metrics(node_info[node_id])
 
     # file system metrics
     fs_stats = node_data.get('fs')
     if fs_stats:
         metrics['fs'] = _get_node_fs_metrics(fs_stats)
 
-    metrics['http'] = node_data['http']  # HTTP connections info
+    # HTTP connections info
+    if 'http' in node_data:
+        metrics['http'] = node_data['http']
 
     # process resource usage
     proc_stats = node_data.get('process')
@@ -71,6 +247,139 @@ def node_performance_metrics(node_stats):
     return metrics
 
 
+def node_info_metrics(node_info):
+    """From node info structure (of a single node), returns a dictionary of node
+    metadata metrics. Roles are flags, 1 if the node has the role, otherwise 0.
+
+    :param dict node_info: node info of a node, as returned by _nodes API
+    :return dict: node metadata metrics (numeric values)
+    """
+    node_roles = node_info.get('roles', ())
+    roles = {role: 0 for role in NODE_ROLES}
+    roles.update({role: 1 for role in node_roles})
+    return {'roles': roles}
+
+
+def node_labels(node_info):
+    """From node info structure (of a single node), returns a dictionary of
+    labels (tags) to identify metrics of the node: node name, host, version
+    and custom node attributes (prefixed with "attr_").
+
+    :param dict node_info: node info of a node, as returned by _nodes API
+    :return dict: label names mapped to (str) values
+    """
+    labels = {}
+    for label, key in (('node_name', 'name'), ('host', 'host'), ('version', 'version')):
+        if node_info.get(key):
+            labels[label] = node_info[key]
+    for attribute, value in node_info.get('attributes', {}).items():
+        labels['attr_{}'.format(attribute)] = value
+    return labels
+
+
+HotspotMetric = namedtuple('HotspotMetric', ('name', 'value', 'largest', 'counter'))
+
+
+def _thread_pool_rejected(node_metrics):
+    thread_pools = node_metrics.get('thread_pool')
+    if not thread_pools:
+        return None
+    return sum(pool_stats.get('rejected', 0) for pool_stats in thread_pools.values())
+
+
+def _metric_getter(*path):
+    def get_metric(node_metrics):
+        for key in path:
+            node_metrics = node_metrics.get(key)
+            if node_metrics is None:
+                return None
+        return node_metrics
+    return get_metric
+
+
+HOTSPOT_METRICS = (
+    HotspotMetric('heap_used_percent', _metric_getter('jvm', 'mem', 'heap_used_percent'), True, False),
+    HotspotMetric('fs_available_in_bytes', _metric_getter('fs', 'total', 'available_in_bytes'), False, False),
+    HotspotMetric('thread_pool_rejected', _thread_pool_rejected, True, True),
+    HotspotMetric('search_query_current', _metric_getter('indices', 'search', 'query_current'), True, False),
+)
+
+# node stats sections required for hot spot metrics
+HOTSPOT_SECTIONS = ('fs', 'indices', 'jvm', 'thread_pool')
+
+
+def hotspot_metrics(nodes_metrics, k=3, skew=False, hotspots=HOTSPOT_METRICS, previous=None):
+    """From node performance metrics of multiple nodes, returns the k hot spot
+    nodes for each hot spot metric: nodes with the highest heap usage, lowest available
+    disk space, most thread pool rejections and most current search queries.
+    Nodes are selected with bounded heaps, without sorting all nodes on each metric.
+
+    Counter metrics (like thread pool rejections) are cumulative since the node started,
+    so nodes are ranked by the increase of the counter since the previous call instead.
+    The previous dict holds the counter values of the last call, and is updated in place.
+    Counter metrics are skipped without a previous dict, and nodes without a previous
+    value are skipped. When a counter decreases (the node restarted) the increase is
+    the current value.
+
+    Returned metrics are the node names (dots replaced by underscores) mapped to
+    values for each metric. Optionally the skew of each metric (ratio of the max,
+    or the min for metrics selecting the smallest values, to the median value
+    across nodes) is added, which requires sorting the values.
+
+    :param dict nodes_metrics: node names mapped to node performance metrics
+    :param int k: number of nodes to select for each metric
+    :param bool skew: add skew ratios
+    :param iterable hotspots: HotspotMetric tuples of name, value function, largest (or smallest)
+                              and counter
+    :param dict previous: counter values of the previous call, updated in place
+    :return dict: hot spot metrics (numeric values)
+    """
+    metrics = {}
+    skews = {}
+    for hotspot in hotspots:
+        if hotspot.counter and previous is None:
+            continue
+        values = []
+        counters = {}
+        last_counters = previous.get(hotspot.name, {}) if hotspot.counter else None
+        for node_name, node_metrics in nodes_metrics.items():
+            value = hotspot.value(node_metrics)
+            if value is None:
+                continue
+            if hotspot.counter:
+                counters[node_name] = value
+                if node_name not in last_counters:
+                    continue
+                last_value = last_counters[node_name]
+                value = value - last_value if value >= last_value else value
+            values.append((value, node_name))
+        if hotspot.counter:
+            # replaced, so nodes that left the cluster are dropped
+            previous[hotspot.name] = counters
+        if not values:
+            continue
+        select = heapq.nlargest if hotspot.largest else heapq.nsmallest
+        metrics[hotspot.name] = {
+            node_name.replace('.', '_'): value for value, node_name in select(k, values)
+        }
+        if skew:
+            skews[hotspot.name] = _skew([value for value, _ in values], hotspot.largest)
+    if skews:
+        metrics['skew'] = skews
+    return {'hotspot': metrics}
+
+
+def _skew(values, largest=True):
+    """Return the ratio of the max (or the min) to the median of the values,
+    0 if the median is 0
+    """
+    values = sorted(values)
+    middle = len(values) // 2
+    median = values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+    extreme = values[-1] if largest else values[0]
+    return float(extreme) / median if median else 0.0
+
+
 def _get_node_fs_metrics(fs_stats):
     fs_metrics = {}
     if 'total' in fs_stats:
@@ -164,7 +473,16 @@ def _get_node_indices_metrics(indices_stats):
         'fielddata': ('evictions', 'memory_size_in_bytes'),
         'query_cache': ('evictions', 'hit_count', 'miss_count', 'memory_size_in_bytes'),
         'request_cache': ('evictions', 'hit_count', 'miss_count', 'memory_size_in_bytes'),
-        'search': ('fetch_current', 'query_current', 'scroll_current', 'suggest_current'),
+        # operation counters are kept with their total time, to derive latency (see derived.DerivedMetrics)
+        'search': ('fetch_current', 'query_current', 'scroll_current', 'suggest_current',
+                   'query_total', 'query_time_in_millis', 'fetch_total', 'fetch_time_in_millis',
+                   'scroll_total', 'scroll_time_in_millis'),
+        'indexing': ('index_current', 'index_failed', 'index_total', 'index_time_in_millis',
+                     'delete_total', 'delete_time_in_millis', 'throttle_time_in_millis'),
+        'get': ('current', 'total', 'time_in_millis'),
+        'refresh': ('total', 'total_time_in_millis'),
+        'flush': ('total', 'total_time_in_millis'),
+        'merges': ('current', 'total', 'total_time_in_millis'),
         'segments': ('count', 'memory_in_bytes', 'index_writer_memory_in_bytes',
                      'fixed_bit_set_memory_in_bytes', 'doc_values_memory_in_bytes', 'version_map_memory_in_bytes'),
         'store': ('size_in_bytes',),
@@ -179,6 +497,74 @@ def _get_node_indices_metrics(indices_stats):
     return indices_metrics
 
 
+def _get_cluster_indices_metrics(indices_stats):
+    """Return metrics from indices stats of the cluster, which is the "indices" key
+    in the response from the cluster stats API.
+
+    :param dict indices_stats: the "indices" key from cluster stats API response
+    :return: dict
+    """
+    indices_metrics = _available_keys(indices_stats, ('count',))
+    metric_section_keys = {
+        'shards': ('total', 'primaries', 'replication'),
+        'docs': ('count', 'deleted'),
+        'store': ('size_in_bytes',),
+        'fielddata': ('evictions', 'memory_size_in_bytes'),
+        'query_cache': ('evictions', 'hit_count', 'miss_count', 'memory_size_in_bytes',
+                        'total_count', 'cache_size', 'cache_count'),
+        'completion': ('size_in_bytes',),
+        'segments': ('count', 'memory_in_bytes', 'index_writer_memory_in_bytes',
+                     'fixed_bit_set_memory_in_bytes', 'doc_values_memory_in_bytes', 'version_map_memory_in_bytes'),
+    }
+
+    for section, section_keys in metric_section_keys.items():
+        if section in indices_stats:
+            indices_metrics[section] = _available_keys(indices_stats[section], section_keys)
+
+    return indices_metrics
+
+
+def _get_cluster_nodes_metrics(nodes_stats):
+    """Return metrics from nodes stats of the cluster, which is the "nodes" key
+    in the response from the cluster stats API.
+    Node counts are reported for all the roles in the response.
+
+    :param dict nodes_stats: the "nodes" key from cluster stats API response
+    :return: dict
+    """
+    nodes_metrics = {}
+    if 'count' in nodes_stats:
+        nodes_metrics['count'] = copy(nodes_stats['count'])
+
+    os_stats = nodes_stats.get('os', {})
+    if 'mem' in os_stats:
+        nodes_metrics['os'] = {
+            'mem': _available_keys(
+                        os_stats['mem'],
+                        ('total_in_bytes', 'free_in_bytes', 'used_in_bytes', 'free_percent', 'used_percent')
+                   )
+        }
+
+    proc_stats = nodes_stats.get('process')
+    if proc_stats:
+        nodes_metrics['process'] = _available_keys(proc_stats, ('cpu', 'open_file_descriptors'))
+
+    jvm_stats = nodes_stats.get('jvm')
+    if jvm_stats:
+        nodes_metrics['jvm'] = _available_keys(jvm_stats, ('max_uptime_in_millis', 'threads'))
+        if 'mem' in jvm_stats:
+            nodes_metrics['jvm']['mem'] = _available_keys(
+                                            jvm_stats['mem'],
+                                            ('heap_used_in_bytes', 'heap_max_in_bytes')
+                                          )
+
+    fs_stats = nodes_stats.get('fs')
+    if fs_stats:
+        nodes_metrics['fs'] = _available_keys(fs_stats, ('available_in_bytes', 'free_in_bytes', 'total_in_bytes'))
+
+    return nodes_metrics
+
+
 def _available_keys(dict_, keys):
     """Return a sub dictionary of the argument, with the specified keys, only if they exit.
 
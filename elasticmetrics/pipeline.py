@@ -0,0 +1,302 @@
+"""
+elasticmetrics.pipeline
+~~~~~~~~~~~~~~~~~~~~~~~
+Staged pipeline of collection, transformation and output, connected by
+bounded queues, so slow outputs do not delay collecting samples.
+"""
+import time
+import threading
+from collections import deque
+from logging import getLogger
+from .exceptions import ElasticMetricsError
+
+
+POLICY_BLOCK = 'block'
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_DROP_NEWEST = 'drop_newest'
+BACKPRESSURE_POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST)
+
+logger = getLogger(__name__)
+
+
+class QueueClosed(Exception):
+    """Raised when getting from a closed and empty queue"""
+    pass
+
+
+class BoundedQueue(object):
+    """Thread safe FIFO queue with a maximum size, and a policy
+    for putting items when the queue is full:
+        - block: wait until there is room in the queue
+        - drop_oldest: drop the oldest item in the queue to make room
+        - drop_newest: drop the item being put
+
+    :param int maxsize: maximum number of items in the queue
+    :param str policy: backpressure policy when the queue is full
+    """
+
+    def __init__(self, maxsize, policy=POLICY_BLOCK):
+        if maxsize < 1:
+            raise ElasticMetricsError('invalid queue size "{}"'.format(maxsize))
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ElasticMetricsError('invalid backpressure policy "{}"'.format(policy))
+        self._maxsize = maxsize
+        self._policy = policy
+        self._items = deque()
+        self._condition = threading.Condition(threading.Lock())
+        self._closed = False
+        self._dropped = 0
+        self._max_depth = 0
+
+    def put(self, item):
+        """Put the item in the queue, according to the backpressure policy.
+        Items put into a closed queue are dropped.
+
+        :return bool: True if the item is queued, False if it's dropped
+        """
+        with self._condition:
+            if self._policy == POLICY_BLOCK:
+                while len(self._items) >= self._maxsize and not self._closed:
+                    self._condition.wait()
+            if self._closed:
+                self._dropped += 1
+                return False
+            if len(self._items) >= self._maxsize:
+                self._dropped += 1
+                if self._policy == POLICY_DROP_NEWEST:
+                    return False
+                self._items.popleft()
+            self._items.append(item)
+            self._max_depth = max(self._max_depth, len(self._items))
+            self._condition.notify_all()
+            return True
+
+    def get(self):
+        """Remove and return the oldest item, wait until an item is available.
+
+        :raise QueueClosed: when the queue is closed and empty
+        """
+        with self._condition:
+            while not self._items:
+                if self._closed:
+                    raise QueueClosed()
+                self._condition.wait()
+            item = self._items.popleft()
+            self._condition.notify_all()
+            return item
+
+    def close(self):
+        """Close the queue. Queued items can still be taken, blocked
+        put calls return and drop their items.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def depth(self):
+        return len(self._items)
+
+    @property
+    def max_depth(self):
+        return self._max_depth
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    @property
+    def policy(self):
+        return self._policy
+
+
+class Pipeline(object):
+    """Run collection, transformation and output in separate threads, connected by
+    bounded queues.
+
+    A collector thread calls collect every interval seconds, and queues the results
+    with the collection timestamp (a snapshot). Transform workers take snapshots and
+    call transform to create flattened metrics. Each emitter has its own queue and
+    worker thread, which calls the emitter with the metrics and the timestamp of the
+    snapshot they were collected in, so a slow emitter does not delay the others.
+
+    Snapshots are numbered when collected, and emitted in that order even when
+    multiple transform workers finish them out of order.
+
+    When stats_prefix is set, queue depths, drop counts and errors of the pipeline
+    are added to the metrics, as paths under the prefix.
+
+    :param callable collect: function that collects and returns a snapshot
+    :param callable transform: function that takes a snapshot and returns flattened metrics
+    :param list emitters: functions that take (metrics, timestamp) and emit them
+    :param float interval: seconds between collections
+    :param int transform_workers: number of transform threads
+    :param int queue_size: maximum number of items in each queue
+    :param str policy: backpressure policy for all the queues, see BoundedQueue
+    :param str stats_prefix: prefix for pipeline metrics paths, None to disable them
+    """
+
+    def __init__(self, collect, transform, emitters, interval, transform_workers=1, queue_size=10,
+                 policy=POLICY_BLOCK, stats_prefix='elasticmetrics.pipeline'):
+        if not emitters:
+            raise ElasticMetricsError('pipeline requires at least one emitter')
+        self._collect = collect
+        self._transform = transform
+        self._emitters = list(emitters)
+        self._interval = interval
+        self._transform_workers = transform_workers
+        self._stats_prefix = stats_prefix
+        self._transform_queue = BoundedQueue(queue_size, policy)
+        self._emit_queues = [BoundedQueue(queue_size, policy) for _ in self._emitters]
+        self._errors = {'collect': 0, 'transform': 0, 'emit': 0}
+        self._errors_lock = threading.Lock()
+        self._stop = threading.Event()
+        # sequence numbers of snapshots being transformed, and transformed ones waiting
+        # for earlier snapshots, to emit them in the order of collection
+        self._sequence = 0
+        self._take_lock = threading.Lock()
+        self._order_lock = threading.Lock()
+        self._in_flight = set()
+        self._transformed = {}
+        self._collector_thread = None
+        self._transform_threads = []
+        self._emit_threads = []
+
+    def start(self):
+        """Start the pipeline threads"""
+        self._stop.clear()
+        self._collector_thread = self._start_thread(self._run_collector, 'collector')
+        self._transform_threads = [
+            self._start_thread(self._run_transformer, 'transform-{}'.format(i))
+            for i in range(self._transform_workers)
+        ]
+        self._emit_threads = [
+            self._start_thread(self._run_emitter, 'emit-{}'.format(i), (emitter, queue))
+            for (i, (emitter, queue)) in enumerate(zip(self._emitters, self._emit_queues))
+        ]
+
+    def stop(self, timeout=None):
+        """Stop collecting, and wait for the queued snapshots to be transformed
+        and emitted.
+        """
+        self._stop.set()
+        self._collector_thread.join(timeout)
+        self._transform_queue.close()
+        for thread in self._transform_threads:
+            thread.join(timeout)
+        for queue in self._emit_queues:
+            queue.close()
+        for thread in self._emit_threads:
+            thread.join(timeout)
+
+    def run(self):
+        """Start the pipeline and wait until interrupted (KeyboardInterrupt)"""
+        self.start()
+        try:
+            while self._collector_thread.is_alive():
+                self._collector_thread.join(1)
+        finally:
+            self.stop()
+
+    def stats(self):
+        """Return pipeline metrics: queue depths, drop counts and errors.
+        Paths are under the stats_prefix, or "pipeline" if it's not set.
+
+        :return dict: flattened paths mapped to values
+        """
+        prefix = self._stats_prefix or 'pipeline'
+        stats = {
+            '{}.transform.queue_depth'.format(prefix): self._transform_queue.depth,
+            '{}.transform.queue_max_depth'.format(prefix): self._transform_queue.max_depth,
+            '{}.transform.dropped'.format(prefix): self._transform_queue.dropped,
+        }
+        for index, queue in enumerate(self._emit_queues):
+            stats['{}.emit_{}.queue_depth'.format(prefix, index)] = queue.depth
+            stats['{}.emit_{}.queue_max_depth'.format(prefix, index)] = queue.max_depth
+            stats['{}.emit_{}.dropped'.format(prefix, index)] = queue.dropped
+        with self._errors_lock:
+            errors_by_stage = list(self._errors.items())
+        for stage, errors in errors_by_stage:
+            stats['{}.{}.errors'.format(prefix, stage)] = errors
+        return stats
+
+    def _count_error(self, stage):
+        # errors of a stage are counted by all of its threads
+        with self._errors_lock:
+            self._errors[stage] += 1
+
+    def _start_thread(self, target, name, args=()):
+        thread = threading.Thread(target=target, name='elasticmetrics-pipeline-{}'.format(name), args=args)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _run_collector(self):
+        next_collection = time.time()
+        while not self._stop.is_set():
+            timestamp = time.time()
+            try:
+                snapshot = self._collect()
+            except Exception as err:
+                logger.error('failed to collect metrics: {}'.format(err))
+                self._count_error('collect')
+            else:
+                self._transform_queue.put((self._sequence, timestamp, snapshot))
+                self._sequence += 1
+            next_collection += self._interval
+            # skip collections that are already missed, instead of bursting to catch up
+            now = time.time()
+            if next_collection < now:
+                next_collection = now + self._interval - ((now - next_collection) % self._interval)
+            self._stop.wait(next_collection - now)
+
+    def _run_transformer(self):
+        while True:
+            # snapshots are taken in order of collection, and registered as in flight at once,
+            # so earlier snapshots still being transformed are known when a later one is done
+            with self._take_lock:
+                try:
+                    sequence, timestamp, snapshot = self._transform_queue.get()
+                except QueueClosed:
+                    return
+                with self._order_lock:
+                    self._in_flight.add(sequence)
+            try:
+                metrics = self._transform(snapshot)
+            except Exception as err:
+                logger.error('failed to transform metrics: {}'.format(err))
+                self._count_error('transform')
+                metrics = None
+            self._emit_in_order(sequence, timestamp, metrics)
+
+    def _emit_in_order(self, sequence, timestamp, metrics):
+        """Queue the transformed snapshot, and the ones waiting for it, to the emitters.
+        Snapshots dropped from the transform queue are never in flight, so they do not hold
+        back later ones.
+        """
+        with self._order_lock:
+            self._in_flight.discard(sequence)
+            self._transformed[sequence] = (timestamp, metrics)
+            earliest_in_flight = min(self._in_flight) if self._in_flight else None
+            for ready in sorted(self._transformed):
+                if earliest_in_flight is not None and ready > earliest_in_flight:
+                    break
+                timestamp, metrics = self._transformed.pop(ready)
+                if metrics is None:
+                    continue
+                if self._stats_prefix:
+                    metrics.update(self.stats())
+                for queue in self._emit_queues:
+                    queue.put((timestamp, metrics))
+
+    def _run_emitter(self, emitter, queue):
+        while True:
+            try:
+                timestamp, metrics = queue.get()
+            except QueueClosed:
+                return
+            try:
+                emitter(metrics, timestamp)
+            except Exception as err:
+                logger.error('failed to emit metrics: {}'.format(err))
+                self._count_error('emit')
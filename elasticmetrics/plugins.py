@@ -0,0 +1,205 @@
+"""
+elasticmetrics.plugins
+~~~~~~~~~~~~~~~~~~~~~~
+Registry of collect targets, formatters and sinks, loaded lazily.
+
+Plugins are registered by references ("module:attribute"), and the module is
+imported only when the plugin is loaded. Other packages can provide plugins
+by entry points in these groups:
+
+    elasticmetrics.targets      Target instances
+    elasticmetrics.formatters   callables formatting flattened metrics into text
+    elasticmetrics.sinks        callables creating sinks, called with an optional argument string
+                                (like "host:port", a URL or a file name)
+
+The built in collect targets of the tool (cluster_health, cluster_stats, node_stats,
+hotspots and cluster_pending_tasks) are not registered, they're collected by the tool
+with options (like --cat and --hotspots-k) plugin targets do not have.
+
+Entry points are discovered only when a name is not registered by this package,
+so runs using only built in plugins do not scan installed packages.
+"""
+from importlib import import_module
+from logging import getLogger
+from .exceptions import ElasticMetricsError
+
+
+KINDS = ('targets', 'formatters', 'sinks')
+ENTRY_POINT_GROUP_PREFIX = 'elasticmetrics.'
+
+logger = getLogger(__name__)
+
+
+def load_reference(reference):
+    """Import the module of the reference and return the attribute,
+    like "elasticmetrics.sinks:GraphiteSink". Nested attributes are separated by dots.
+
+    :param str reference: module and attribute separated by ":"
+    :raise ElasticMetricsError: if the module or attribute can not be loaded
+    """
+    module_name, _, attribute = reference.partition(':')
+    try:
+        obj = import_module(module_name)
+        for name in attribute.split('.') if attribute else ():
+            obj = getattr(obj, name)
+    except (ImportError, AttributeError) as err:
+        raise ElasticMetricsError('failed to load "{}": {}'.format(reference, err))
+    return obj
+
+
+def _iter_entry_points(group):
+    """Yield (name, entry point) of the group, from the installed packages"""
+    # imported only when discovering, pkg_resources in particular is slow to import
+    try:
+        from importlib import metadata as importlib_metadata
+    except ImportError:
+        importlib_metadata = None
+    if importlib_metadata is not None:
+        entry_points = importlib_metadata.entry_points()
+        if hasattr(entry_points, 'select'):
+            entry_points = entry_points.select(group=group)
+        else:  # Python < 3.10
+            entry_points = entry_points.get(group, ())
+        for entry_point in entry_points:
+            yield entry_point.name, entry_point
+    else:
+        try:
+            import pkg_resources
+        except ImportError:
+            return
+        for entry_point in pkg_resources.iter_entry_points(group):
+            yield entry_point.name, entry_point
+
+
+class Target(object):
+    """A collect target: a collector method requesting the stats, and
+    a metrics function selecting the metrics from the stats.
+
+    :param str|callable collect: name of the ElasticSearchCollector method, or a callable
+                                 accepting the collector
+    :param str|callable metrics: metrics function accepting the stats, or a reference to it
+                                 ("module:function"), imported on first use
+    :param str prefix: prefix of the flattened metric paths, None to prefix with the node alias
+    """
+
+    def __init__(self, collect, metrics, prefix='cluster'):
+        self._collect = collect
+        self._metrics = metrics
+        self.prefix = prefix
+
+    def collect(self, collector, sections=None):
+        """Request the stats of the target using the collector.
+
+        :param ElasticSearchCollector collector: the collector
+        :param iterable sections: sections of the stats to request (like for node_stats), default is all
+        """
+        collect = self._collect if callable(self._collect) else getattr(collector, self._collect)
+        args = (sections,) if sections else ()
+        if callable(self._collect):
+            args = (collector,) + args
+        return collect(*args)
+
+    def metrics(self, stats):
+        """Return the metrics selected from the stats"""
+        if not callable(self._metrics):
+            self._metrics = load_reference(self._metrics)
+        return self._metrics(stats)
+
+
+class Registry(object):
+    """Plugins of each kind (targets, formatters and sinks), by name.
+
+    Plugins are registered as references (loaded on first use) or objects,
+    and plugins provided by entry points of installed packages are discovered
+    when a name is not registered.
+
+    :param bool entry_points: discover plugins from entry points
+    """
+
+    def __init__(self, entry_points=True):
+        self._entry_points = entry_points
+        self._plugins = dict((kind, {}) for kind in KINDS)
+        self._loaded = dict((kind, {}) for kind in KINDS)
+        self._discovered = set()
+        self._entry_point_names = set()
+
+    def register(self, kind, name, plugin):
+        """Register the plugin by name.
+
+        :param str kind: targets, formatters or sinks
+        :param str name: name of the plugin
+        :param plugin: the plugin, or its reference as "module:attribute"
+        """
+        self._plugins_of(kind)[name] = plugin
+        self._loaded[kind].pop(name, None)
+        self._entry_point_names.discard((kind, name))
+
+    def names(self, kind):
+        """Return the sorted names of the plugins of the kind, including entry points.
+
+        :param str kind: targets, formatters or sinks
+        :rtype: list
+        """
+        self._discover(kind)
+        return sorted(self._plugins_of(kind))
+
+    def __contains__(self, kind_name):
+        kind, name = kind_name
+        plugins = self._plugins_of(kind)
+        if name not in plugins:
+            self._discover(kind)
+        return name in plugins
+
+    def load(self, kind, name):
+        """Return the plugin, importing its module on first use.
+
+        :param str kind: targets, formatters or sinks
+        :param str name: name of the plugin
+        :raise ElasticMetricsError: if there is no such plugin, or it can not be loaded
+        """
+        self._plugins_of(kind)
+        loaded = self._loaded[kind]
+        if name in loaded:
+            return loaded[name]
+        if (kind, name) not in self:
+            raise ElasticMetricsError('no {} plugin "{}"'.format(kind.rstrip('s'), name))
+        plugin = self._plugins[kind][name]
+        if isinstance(plugin, str):
+            plugin = load_reference(plugin)
+        elif (kind, name) in self._entry_point_names:
+            try:
+                plugin = plugin.load()
+            except Exception as err:
+                raise ElasticMetricsError('failed to load {} plugin "{}": {}'.format(kind.rstrip('s'), name, err))
+        logger.debug('loaded {} plugin "{}"'.format(kind.rstrip('s'), name))
+        loaded[name] = plugin
+        return plugin
+
+    def _plugins_of(self, kind):
+        if kind not in self._plugins:
+            raise ElasticMetricsError('invalid plugin kind "{}"'.format(kind))
+        return self._plugins[kind]
+
+    def _discover(self, kind):
+        if not self._entry_points or kind in self._discovered:
+            return
+        self._discovered.add(kind)
+        plugins = self._plugins[kind]
+        for name, entry_point in _iter_entry_points(ENTRY_POINT_GROUP_PREFIX + kind):
+            if name in plugins:
+                logger.debug('skipping {} plugin "{}" from entry points, already registered'.format(kind, name))
+                continue
+            plugins[name] = entry_point
+            self._entry_point_names.add((kind, name))
+
+
+def default_registry():
+    """Return a registry with the built in formatters and sinks. Sinks are created
+    from an address ("host[:port]"), a URL or a file name.
+    """
+    registry = Registry()
+    registry.register('formatters', 'prometheus', 'elasticmetrics.formatters:prometheus_text')
+    for name, sink in (('graphite', 'graphite_sink'), ('statsd', 'statsd_sink'), ('http', 'http_sink'),
+                       ('textfile', 'TextfileSink')):
+        registry.register('sinks', name, 'elasticmetrics.sinks:' + sink)
+    return registry
@@ -0,0 +1,160 @@
+"""
+elasticmetrics.processing
+~~~~~~~~~~~~~~~~~~~~~~~~~
+Decode and transform raw ElasticSearch responses into flattened metrics,
+in the current process or in a pool of worker processes.
+"""
+import os
+import json
+from itertools import count
+from collections import OrderedDict
+from logging import getLogger
+from multiprocessing import Pool
+from .metrics import cluster_health_metrics, cluster_stats_metrics, node_performance_metrics
+from .formatters import CachedFlattener
+from .exceptions import ElasticMetricsError, ElasticMetricsRequestError
+
+
+TRANSFORMS = {
+    'cluster_health': cluster_health_metrics,
+    'cluster_stats': cluster_stats_metrics,
+    'node_stats': node_performance_metrics,
+}
+
+logger = getLogger(__name__)
+
+
+class _ShapeTracker(object):
+    """Flatten metrics of each (target, prefix), and keep track of the shapes
+    (the sorted flattened paths) already reported to the consumer of the results
+    """
+
+    _keys = count()
+
+    def __init__(self, path_separator):
+        self._path_separator = path_separator
+        self._flatteners = {}
+        self._reported = {}
+
+    def process(self, target, body, prefix, send_paths=False):
+        """Decode and transform the response body, and flatten the metrics.
+        Returns a compact (shape key, paths or None, values) tuple. Paths are only
+        included when the shape is new to the consumer, or explicitly requested.
+        Raises ElasticMetricsRequestError on invalid responses, like in-process decoding.
+        """
+        if target not in TRANSFORMS:
+            raise ElasticMetricsError('invalid target "{}"'.format(target))
+        flattener_key = (target, prefix)
+        flattener = self._flatteners.get(flattener_key)
+        if flattener is None:
+            flattener = self._flatteners[flattener_key] = CachedFlattener(self._path_separator, prefix, sort=True)
+
+        try:
+            stats = json.loads(body.decode('utf-8'))
+        except ValueError as err:  # including UnicodeDecodeError
+            raise ElasticMetricsRequestError('invalid JSON response of "{}": {}'.format(target, err))
+        metrics = TRANSFORMS[target](stats)
+        flattened = flattener.flatten(metrics)
+        rebuilds = flattener.rebuilds
+        if self._reported.get(flattener_key, (None,))[0] != rebuilds:
+            self._reported[flattener_key] = (rebuilds, '{}-{}'.format(os.getpid(), next(self._keys)))
+            send_paths = True
+        shape_key = self._reported[flattener_key][1]
+        paths = tuple(flattened.keys()) if send_paths else None
+        return (shape_key, paths, tuple(flattened.values()))
+
+
+_worker_tracker = None
+
+
+def _init_worker(path_separator):
+    global _worker_tracker
+    _worker_tracker = _ShapeTracker(path_separator)
+
+
+def _process_in_worker(job):
+    return _worker_tracker.process(*job)
+
+
+class Processor(object):
+    """Decode and transform raw responses (as returned by
+    ElasticSearchCollector.raw_stats) into sorted flattened metrics, in the
+    current process.
+
+    See: ProcessPoolProcessor
+
+    :param str path_separator: separate paths in flattened path from the hierarchy
+    :param int max_shapes: maximum number of cached shapes
+    """
+
+    def __init__(self, path_separator='.', max_shapes=1000):
+        self._path_separator = path_separator
+        self._max_shapes = max_shapes
+        self._shapes = {}
+        self._tracker = _ShapeTracker(path_separator)
+
+    def process(self, target, body, prefix=''):
+        """Decode and transform the response body of the target into flattened metrics.
+
+        :param str target: name of the target, like "node_stats"
+        :param bytes body: the raw response body
+        :param str prefix: prefix for the metrics paths
+        :return OrderedDict: sorted flattened paths mapped to metric values
+        """
+        return self.process_many([(target, body, prefix)])[0]
+
+    def process_many(self, jobs):
+        """Decode and transform multiple response bodies.
+
+        :param iterable jobs: (target, body, prefix) tuples
+        :return list: list of OrderedDicts, sorted flattened paths mapped to metric values
+        """
+        jobs = [(target, body, prefix, False) for (target, body, prefix) in jobs]
+        results = self._run(jobs)
+        for (shape_key, paths, _) in results:
+            if paths is not None:
+                if len(self._shapes) >= self._max_shapes:
+                    self._shapes.clear()
+                self._shapes[shape_key] = paths
+
+        processed = []
+        for index, (shape_key, paths, values) in enumerate(results):
+            paths = self._shapes.get(shape_key)
+            if paths is None:
+                # paths were sent along with another result, not available here (yet)
+                shape_key, paths, values = self._run([jobs[index][:3] + (True,)])[0]
+                self._shapes[shape_key] = paths
+            processed.append(OrderedDict(zip(paths, values)))
+        return processed
+
+    def close(self):
+        pass
+
+    def _run(self, jobs):
+        return [self._tracker.process(*job) for job in jobs]
+
+
+class ProcessPoolProcessor(Processor):
+    """Decode and transform raw responses into sorted flattened metrics, in a pool
+    of worker processes, to use multiple CPUs for large responses.
+
+    Only the raw response bodies are sent to the workers. Workers return the
+    metric values, and send the paths only when the shape of the metrics changes.
+
+    See: Processor
+
+    :param int processes: number of worker processes, default is number of CPUs
+    :param str path_separator: separate paths in flattened path from the hierarchy
+    :param int max_shapes: maximum number of cached shapes
+    """
+
+    def __init__(self, processes=None, path_separator='.', max_shapes=1000):
+        super(ProcessPoolProcessor, self).__init__(path_separator, max_shapes)
+        self._pool = Pool(processes, _init_worker, (path_separator,))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def _run(self, jobs):
+        return self._pool.map(_process_in_worker, jobs, chunksize=1)
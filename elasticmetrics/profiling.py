@@ -0,0 +1,140 @@
+"""
+elasticmetrics.profiling
+~~~~~~~~~~~~~~~~~~~~~~~~
+Profile CPU and memory usage of collection cycles of a running process.
+"""
+import os
+import time
+import signal
+import pstats
+import cProfile
+from contextlib import contextmanager
+from logging import getLogger
+from .exceptions import ElasticMetricsError
+
+try:
+    import tracemalloc
+except ImportError:  # Python < 3.4
+    tracemalloc = None
+
+
+logger = getLogger(__name__)
+
+
+class CycleProfiler(object):
+    """Profile selected cycles with cProfile (cpu) and/or tracemalloc (mem),
+    and write the reports to a directory. Only the most recent "keep" reports
+    of each kind are kept.
+
+    Cycles are profiled every "every" cycles (0 disables periodic profiling),
+    and for the next "trigger_cycles" cycles after trigger is called, for example
+    from a signal handler (see install_signal_handler).
+
+    :param str directory: path to the directory to write reports into
+    :param bool cpu: profile CPU usage with cProfile
+    :param bool mem: trace memory allocations with tracemalloc
+    :param int every: profile every N cycles, 0 to only profile when triggered
+    :param int trigger_cycles: number of cycles to profile when triggered
+    :param int keep: number of reports of each kind to keep
+    :param int top: number of entries in each report
+    """
+
+    def __init__(self, directory, cpu=True, mem=False, every=0, trigger_cycles=5, keep=20, top=50):
+        if mem and tracemalloc is None:
+            raise ElasticMetricsError('memory profiling requires tracemalloc (Python 3.4+)')
+        if not (cpu or mem):
+            raise ElasticMetricsError('no profiling is enabled')
+        self._directory = directory
+        self._cpu = cpu
+        self._mem = mem
+        self._every = every
+        self._trigger_cycles = trigger_cycles
+        self._keep = keep
+        self._top = top
+        self._cycle = 0
+        self._triggered = 0
+
+    def trigger(self, cycles=None):
+        """Profile the next cycles (default is trigger_cycles)"""
+        self._triggered = self._trigger_cycles if cycles is None else cycles
+        logger.info('profiling next {} cycles'.format(self._triggered))
+
+    def install_signal_handler(self, signum=getattr(signal, 'SIGUSR1', None)):
+        """Trigger profiling when the process receives the signal (default SIGUSR1)"""
+        if signum is None:
+            raise ElasticMetricsError('signal is not supported on this platform')
+        signal.signal(signum, lambda signum, frame: self.trigger())
+
+    @property
+    def due(self):
+        """If the next cycle is going to be profiled"""
+        return self._triggered > 0 or bool(self._every and self._cycle % self._every == 0)
+
+    @contextmanager
+    def cycle(self):
+        """Context manager wrapping a cycle, profiles it if it's due"""
+        if not self.due:
+            self._cycle += 1
+            yield
+            return
+
+        if self._triggered > 0:
+            self._triggered -= 1
+        name = 'cycle-{}-{:08d}'.format(time.strftime('%Y%m%d%H%M%S'), self._cycle)
+        self._cycle += 1
+        profile = cProfile.Profile() if self._cpu else None
+        # tracing started by others (like PYTHONTRACEMALLOC) is left running
+        started_tracing = self._mem and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(10)
+        if profile:
+            profile.enable()
+        started = time.time()
+        try:
+            yield
+        finally:
+            duration = time.time() - started
+            if profile:
+                profile.disable()
+            try:
+                self._write_reports(name, profile, duration)
+            except (IOError, OSError) as err:
+                logger.error('failed to write profile reports for {}: {}'.format(name, err))
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
+
+    def _write_reports(self, name, profile, duration):
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+
+        if profile:
+            base_path = os.path.join(self._directory, name + '.cpu')
+            profile.dump_stats(base_path + '.prof')
+            with open(base_path + '.txt', 'wt') as fh:
+                fh.write('{} took {:.6f} seconds\n\n'.format(name, duration))
+                stats = pstats.Stats(profile, stream=fh)
+                stats.sort_stats('cumulative').print_stats(self._top)
+            self._rotate('.cpu.txt')
+            self._rotate('.cpu.prof')
+            logger.debug('wrote CPU profile report {}.txt'.format(base_path))
+
+        if self._mem:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            path = os.path.join(self._directory, name + '.mem.txt')
+            with open(path, 'wt') as fh:
+                fh.write('{} took {:.6f} seconds\n'.format(name, duration))
+                fh.write('traced memory: current {} bytes, peak {} bytes\n\n'.format(current, peak))
+                for stat in snapshot.statistics('lineno')[:self._top]:
+                    fh.write('{}\n'.format(stat))
+            self._rotate('.mem.txt')
+            logger.debug('wrote memory profile report {}'.format(path))
+
+    def _rotate(self, suffix):
+        reports = sorted(
+            filename for filename in os.listdir(self._directory)
+            if filename.startswith('cycle-') and filename.endswith(suffix)
+        )
+        for filename in reports[:max(0, len(reports) - self._keep)]:
+            os.remove(os.path.join(self._directory, filename))
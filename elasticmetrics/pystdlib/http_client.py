@@ -0,0 +1,10 @@
+"""
+elasticmetrics.pystdlib.http_client
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+Proxy to Python standard library, abstracing 2/3 differences,
+to keep try/imports in one place.
+"""
+try:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+except ImportError:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
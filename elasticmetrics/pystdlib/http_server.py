@@ -0,0 +1,12 @@
+"""
+elasticmetrics.pystdlib.http_server
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+Proxy to Python standard library, abstracing 2/3 differences,
+to keep try/imports in one place.
+"""
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
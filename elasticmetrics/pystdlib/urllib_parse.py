@@ -0,0 +1,11 @@
+"""
+elasticmetrics.pystdlib.urllib_parse
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+Proxy to Python standard library, abstracing 2/3 differences,
+to keep try/imports in one place.
+"""
+try:
+    from urlparse import urlparse
+    from urllib import unquote
+except ImportError:
+    from urllib.parse import urlparse, unquote
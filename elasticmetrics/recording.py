@@ -0,0 +1,165 @@
+"""
+elasticmetrics.recording
+~~~~~~~~~~~~~~~~~~~~~~~~
+Record raw responses of ElasticSearch APIs into a compressed log, and replay
+them through the collector, to reproduce and benchmark real captures.
+
+The log is gzip compressed. Each response is a line of JSON metadata (time, elapsed,
+path, url and size of the body), followed by the raw body and a new line. Responses
+are flushed as they're recorded, so a log that was never closed (like of a killed
+process) is replayed up to the last flushed response.
+"""
+import gzip
+import json
+import time
+from collections import namedtuple
+from logging import getLogger
+from .collectors import ElasticSearchCollector
+from .exceptions import ElasticMetricsError, ReplayFinished
+
+
+logger = getLogger(__name__)
+
+RecordedResponse = namedtuple('RecordedResponse', ('time', 'elapsed', 'path', 'url', 'body'))
+
+
+class ResponseRecorder(object):
+    """Append raw responses to a gzip compressed log. Set as the recorder of an
+    HttpClient (like ElasticSearchCollector) to record all of its responses.
+    Each response is flushed (a zlib sync flush, the compression history is kept)
+    so the log can be read without closing it.
+
+    :param str filename: path to the log file, appended if it exists
+    :param int compresslevel: gzip compression level
+    """
+
+    def __init__(self, filename, compresslevel=6):
+        self._filename = filename
+        self._file = gzip.open(filename, 'ab', compresslevel)
+        self._recorded = 0
+
+    @property
+    def recorded(self):
+        return self._recorded
+
+    def record(self, path, url, started, elapsed, body):
+        """Append a response to the log.
+
+        :param str path: the URL path
+        :param str url: the full URL
+        :param float started: the time the request was sent
+        :param float elapsed: seconds from sending the request to reading the response
+        :param bytes body: the raw response body
+        """
+        metadata = {'time': started, 'elapsed': elapsed, 'path': path, 'url': url, 'size': len(body)}
+        self._file.write(json.dumps(metadata, sort_keys=True).encode('utf-8'))
+        self._file.write(b'\n')
+        self._file.write(body)
+        self._file.write(b'\n')
+        self._file.flush()
+        self._recorded += 1
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def iter_recorded_responses(filename):
+    """Yield the responses recorded in the log, in the order they were recorded.
+    A log that was not closed ends at the last flushed response.
+
+    :param str filename: path to the log file
+    :return: generator of RecordedResponse
+    :raise ElasticMetricsError: on invalid logs
+    """
+    with gzip.open(filename, 'rb') as log_file:
+        while True:
+            try:
+                line = log_file.readline()
+            except EOFError:
+                # the gzip member was not closed, the recorder did not finish the log
+                logger.debug('log "{}" ends without a gzip trailer'.format(filename))
+                return
+            if not line:
+                return
+            try:
+                metadata = json.loads(line.decode('utf-8'))
+                body = log_file.read(metadata['size'])
+                end = log_file.read(1)
+            except (ValueError, KeyError, TypeError) as err:
+                raise ElasticMetricsError('invalid recorded response in "{}": {}'.format(filename, err))
+            except EOFError:
+                logger.warning('log "{}" ends with a partially recorded response'.format(filename))
+                return
+            if len(body) != metadata['size'] or end != b'\n':
+                raise ElasticMetricsError('truncated recorded response in "{}"'.format(filename))
+            yield RecordedResponse(metadata['time'], metadata['elapsed'], metadata['path'], metadata['url'], body)
+
+
+class ReplayCollector(ElasticSearchCollector):
+    """An ElasticSearchCollector that replays recorded responses, instead of
+    requesting ElasticSearch.
+
+    Each request is answered with the next recorded response of the same path
+    (recorded responses of other paths are skipped). Responses are replayed at
+    the recorded speed multiplied by speed, or as fast as possible with speed 0.
+
+    :param str filename: path to the log file
+    :param float speed: replay speed, relative to the recorded speed. 0 is as fast as possible
+    :raise ReplayFinished: on requests after all the responses are replayed
+    """
+
+    def __init__(self, filename, speed=0, **kwargs):
+        if speed < 0:
+            raise ElasticMetricsError('invalid replay speed "{}"'.format(speed))
+        kwargs.setdefault('host', 'localhost')
+        super(ReplayCollector, self).__init__(**kwargs)
+        self._filename = filename
+        self._speed = speed
+        self._responses = iter_recorded_responses(filename)
+        self._first_recorded = None
+        self._replay_started = None
+        self._replayed = 0
+        self._skipped = 0
+
+    @property
+    def replayed(self):
+        return self._replayed
+
+    @property
+    def skipped(self):
+        return self._skipped
+
+    def _next_response(self, path):
+        for response in self._responses:
+            if response.path == path:
+                self._wait(response)
+                self._update_latency(response.elapsed)
+                self._replayed += 1
+                return response
+            logger.debug('skipping recorded response of "{}", requested "{}"'.format(response.path, path))
+            self._skipped += 1
+        raise ReplayFinished('replayed {} responses from "{}"'.format(self._replayed, self._filename))
+
+    def _wait(self, response):
+        """Wait until the response would have been read, at the replay speed"""
+        if self._first_recorded is None:
+            self._first_recorded = response.time
+            self._replay_started = time.time()
+        if self._speed:
+            due = self._replay_started + (response.time + response.elapsed - self._first_recorded) / self._speed
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _get(self, path):
+        return self._next_response(path).body
+
+    def _get_chunks(self, path, chunk_size=65536):
+        body = self._next_response(path).body
+        for offset in range(0, len(body), chunk_size):
+            yield body[offset:offset + chunk_size]
@@ -0,0 +1,261 @@
+"""
+elasticmetrics.scheduler
+~~~~~~~~~~~~~~~~~~~~~~~~
+Schedule collection of different targets (and stats sections) at different rates.
+"""
+import time
+import zlib
+from collections import namedtuple
+from .collectors import NODE_STATS_SECTIONS
+from .exceptions import ElasticMetricsError
+
+
+Tier = namedtuple('Tier', ('interval', 'target', 'sections'))
+
+
+def parse_tier(spec, targets=('cluster_health', 'node_stats')):
+    """Parse a tier specification "INTERVAL:TARGET[:SECTIONS]", where sections
+    are comma separated (only for node_stats). For example:
+        "1:cluster_health", "10:node_stats:jvm,process,thread_pool", "60:node_stats:indices,fs"
+
+    :param str spec: tier specification
+    :param iterable targets: valid target names
+    :return Tier: the parsed tier. sections is a tuple, empty for all sections
+    :raise ElasticMetricsError: on invalid specification
+    """
+    parts = spec.split(':')
+    if len(parts) not in (2, 3):
+        raise ElasticMetricsError('invalid tier "{}", expected INTERVAL:TARGET[:SECTIONS]'.format(spec))
+    try:
+        interval = float(parts[0])
+    except ValueError:
+        interval = 0
+    if interval <= 0:
+        raise ElasticMetricsError('invalid interval for tier "{}"'.format(spec))
+    target = parts[1].strip().lower()
+    if target not in targets:
+        raise ElasticMetricsError('invalid target for tier "{}"'.format(spec))
+    sections = tuple(sorted(set(
+        section.strip().lower() for section in (parts[2] if len(parts) == 3 else '').split(',') if section.strip()
+    )))
+    if sections and target != 'node_stats':
+        raise ElasticMetricsError('sections are only supported for node_stats tiers: "{}"'.format(spec))
+    invalid_sections = set(sections).difference(NODE_STATS_SECTIONS)
+    if invalid_sections:
+        raise ElasticMetricsError('invalid sections for tier "{}": {}'.format(spec, ','.join(sorted(invalid_sections))))
+    return Tier(interval, target, sections)
+
+
+class TieredScheduler(object):
+    """Schedule tiers of targets (and sections) to be collected, each at its own
+    interval.
+
+    Tiers are due on a grid of their interval, shifted by a phase derived from
+    the spread key (like the hostname), so the same tiers on different agents
+    (with different keys) are spread over the interval, instead of all querying
+    ElasticSearch at the same time.
+
+    :param list tiers: list of Tier
+    :param str spread_key: key to derive the phase of tiers from
+    :param callable clock: returns current time in seconds
+    """
+
+    def __init__(self, tiers, spread_key='', clock=time.time):
+        if not tiers:
+            raise ElasticMetricsError('no tiers to schedule')
+        self._tiers = list(tiers)
+        self._clock = clock
+        now = clock()
+        self._next = [self._first_due(tier, spread_key, now) for tier in self._tiers]
+
+    @staticmethod
+    def _first_due(tier, spread_key, now):
+        key = u'{}:{}:{}'.format(spread_key, tier.target, ','.join(tier.sections)).encode('utf-8')
+        phase = (zlib.crc32(key) & 0xffffffff) % 10000 / 10000.0 * tier.interval
+        return now - ((now - phase) % tier.interval) + tier.interval
+
+    def due(self, now=None):
+        """Return the due tiers, and schedule their next run. Runs that are
+        missed (when called late) are skipped.
+
+        :param float now: current time, default is from the clock
+        :return list: due tiers
+        """
+        now = self._clock() if now is None else now
+        due_tiers = []
+        for index, tier in enumerate(self._tiers):
+            if self._next[index] <= now:
+                due_tiers.append(tier)
+                missed = (now - self._next[index]) // tier.interval
+                self._next[index] += (missed + 1) * tier.interval
+        return due_tiers
+
+    def next_due(self):
+        """Time when the next tier is due"""
+        return min(self._next)
+
+    def wait(self, sleep=time.sleep):
+        """Sleep until at least one tier is due, and return the targets
+        to collect.
+
+        See: requests
+
+        :return dict: target names mapped to tuples of sections
+        """
+        while True:
+            due_tiers = self.due()
+            if due_tiers:
+                return self.requests(due_tiers)
+            sleep(max(0, self.next_due() - self._clock()))
+
+    @staticmethod
+    def requests(tiers):
+        """Merge the tiers into targets to collect. Sections of the same target
+        are merged, so each target is requested once. An empty tuple of sections
+        means all sections.
+
+        :param list tiers: list of Tier
+        :return dict: target names mapped to tuples of sections
+        """
+        merged = {}
+        for tier in tiers:
+            if tier.target in merged and not merged[tier.target]:
+                continue
+            if not tier.sections:
+                merged[tier.target] = set()
+            else:
+                merged.setdefault(tier.target, set()).update(tier.sections)
+        return dict((target, tuple(sorted(sections))) for (target, sections) in merged.items())
+
+
+# thresholds of stress signals, a cycle is stressed if any signal reaches its threshold
+DEFAULT_STRESS_THRESHOLDS = {
+    'latency': 2.0,  # seconds of the slowest request in a cycle
+    'pending_tasks': 50,  # number_of_pending_tasks of cluster health
+    'task_max_waiting_in_queue_millis': 5000,
+    'thread_pool_queue': 1000,  # largest queue of node thread pools
+    'thread_pool_rejected': 1,  # rejections of node thread pools since the previous cycle
+}
+EXPENSIVE_TARGETS = ('cluster_stats', 'hotspots', 'cluster_pending_tasks')
+EXPENSIVE_SECTIONS = ('indices', 'fs', 'ingest', 'adaptive_selection')
+
+
+class AdaptiveScheduler(object):
+    """Adapt the collection interval to the stress of ElasticSearch.
+
+    After each cycle the collected metrics (and the request latency) are observed.
+    A stressed cycle raises the backoff level, which stretches the interval by the
+    backoff factor (up to max_interval), and drops expensive targets and node stats
+    sections from collection. After recovery_cycles calm cycles in a row, the level
+    is lowered by one, so the full rate is recovered gradually.
+
+    :param float interval: interval between cycles when ElasticSearch is not stressed
+    :param float max_interval: maximum interval when backing off, default is 8 times the interval
+    :param float backoff_factor: multiplier of the interval for each backoff level
+    :param int recovery_cycles: number of calm cycles to lower the backoff level
+    :param dict thresholds: thresholds of stress signals, overriding DEFAULT_STRESS_THRESHOLDS
+    """
+
+    def __init__(self, interval, max_interval=None, backoff_factor=2.0, recovery_cycles=3, thresholds=None):
+        if interval <= 0:
+            raise ElasticMetricsError('invalid interval "{}"'.format(interval))
+        if backoff_factor <= 1:
+            raise ElasticMetricsError('invalid backoff factor "{}"'.format(backoff_factor))
+        self._interval = interval
+        self._max_interval = max(max_interval or interval * 8, interval)
+        self._backoff_factor = backoff_factor
+        self._recovery_cycles = max(recovery_cycles, 1)
+        self._thresholds = dict(DEFAULT_STRESS_THRESHOLDS)
+        self._thresholds.update(thresholds or {})
+        self._level = 0
+        self._calm_cycles = 0
+        self._rejected = None
+        self._stress = ()
+
+    @property
+    def level(self):
+        """Backoff level, 0 when collecting at the full rate"""
+        return self._level
+
+    @property
+    def interval(self):
+        """Interval until the next cycle"""
+        return min(self._interval * self._backoff_factor ** self._level, self._max_interval)
+
+    @property
+    def stress(self):
+        """Names of the stress signals that reached their thresholds in the last observed cycle"""
+        return self._stress
+
+    def signals(self, output, latency=None):
+        """Return the stress signals of a cycle.
+
+        :param dict output: collected metrics, target names mapped to metrics (see tool.collect)
+        :param float latency: seconds of the slowest request in the cycle
+        :return dict: signal names mapped to values
+        """
+        signals = {}
+        if latency is not None:
+            signals['latency'] = latency
+        health = output.get('cluster_health') or {}
+        for signal, name in (('pending_tasks', 'number_of_pending_tasks'),
+                             ('task_max_waiting_in_queue_millis', 'task_max_waiting_in_queue_millis')):
+            if name in health:
+                signals[signal] = health[name]
+        thread_pools = (output.get('node_stats') or {}).get('thread_pool')
+        if thread_pools:
+            signals['thread_pool_queue'] = max(pool.get('queue', 0) for pool in thread_pools.values())
+            rejected = dict((name, pool.get('rejected', 0)) for name, pool in thread_pools.items())
+            if self._rejected is not None:
+                # rejected counts are cumulative (and reset when a node restarts)
+                signals['thread_pool_rejected'] = sum(
+                    max(0, count - self._rejected.get(name, count)) for name, count in rejected.items())
+            self._rejected = rejected
+        return signals
+
+    def observe(self, output=None, latency=None, failed=False):
+        """Observe a collection cycle, and adapt the backoff level.
+
+        :param dict output: collected metrics, target names mapped to metrics (see tool.collect)
+        :param float latency: seconds of the slowest request in the cycle
+        :param bool failed: the cycle failed (like on request timeouts), which is a stress signal
+        :return int: the backoff level
+        """
+        signals = self.signals(output or {}, latency)
+        stress = sorted(name for name, value in signals.items()
+                        if name in self._thresholds and value >= self._thresholds[name])
+        if failed:
+            stress.append('failed')
+        self._stress = tuple(stress)
+        if stress:
+            self._calm_cycles = 0
+            if self.interval < self._max_interval:
+                self._level += 1
+        elif self._level:
+            self._calm_cycles += 1
+            if self._calm_cycles >= self._recovery_cycles:
+                self._calm_cycles = 0
+                self._level -= 1
+        return self._level
+
+    def targets(self, targets):
+        """Return the targets to collect at the backoff level. When backing off,
+        expensive targets and node stats sections are dropped.
+
+        :param iterable targets: target names, or a dict of target names mapped to sections
+        :return: the targets, or a dict of target names mapped to sections when backing off
+        """
+        if not self._level:
+            return targets
+        sections = targets if isinstance(targets, dict) else dict((target, ()) for target in targets)
+        adapted = {}
+        for target, target_sections in sections.items():
+            if target in EXPENSIVE_TARGETS:
+                continue
+            if target == 'node_stats':
+                target_sections = tuple(section for section in target_sections or NODE_STATS_SECTIONS
+                                        if section not in EXPENSIVE_SECTIONS)
+                if not target_sections:
+                    continue
+            adapted[target] = target_sections
+        return adapted
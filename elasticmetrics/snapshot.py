@@ -0,0 +1,266 @@
+"""
+elasticmetrics.snapshot
+~~~~~~~~~~~~~~~~~~~~~~~
+Share the latest flattened metrics with local processes through a memory mapped file.
+
+The file has a fixed binary layout (little endian):
+
+    offset 0   header: magic (4s), layout version (B), 3 padding bytes,
+               sequence (Q), timestamp (d), count (I), names generation (I),
+               names size (I), padded to 64 bytes
+    offset 64  values: count doubles
+    after      names: names size bytes of UTF-8 metric names, separated by new lines
+
+The publisher updates the file in place, guarded by a seqlock: the sequence is odd
+while a snapshot is being written and even when it's complete. Readers never block
+the publisher, they read the sequence before and after reading the snapshot, and
+retry if it was odd or changed.
+"""
+import os
+import mmap
+import time
+import struct
+from collections import OrderedDict, namedtuple
+from numbers import Real
+from logging import getLogger
+from .exceptions import ElasticMetricsError
+
+
+MAGIC = b'EMSS'
+LAYOUT_VERSION = 1
+HEADER_SIZE = 64
+DEFAULT_SIZE = 1024 * 1024
+
+_HEADER = struct.Struct('<4sB3xQdIII')
+_SEQUENCE = struct.Struct('<Q')
+_SEQUENCE_OFFSET = 8
+_VALUE = struct.Struct('<d')
+
+Snapshot = namedtuple('Snapshot', ('sequence', 'timestamp', 'metrics'))
+
+logger = getLogger(__name__)
+
+
+class SnapshotPublisher(object):
+    """Publish snapshots of flattened metrics into a memory mapped file.
+
+    An existing snapshot file is reused in place (with its sequence), so readers
+    that have the file mapped keep working when the publisher is restarted.
+    Non numeric metrics (like cluster status) are not published.
+
+    Implements the sink interface (send, flush, close), but each call to send
+    replaces the published snapshot.
+
+    :param str filename: path to the snapshot file
+    :param int size: size of the file in bytes, limits the size of snapshots
+    """
+
+    def __init__(self, filename, size=DEFAULT_SIZE):
+        if size < HEADER_SIZE:
+            raise ElasticMetricsError('invalid snapshot size "{}"'.format(size))
+        self._filename = filename
+        self._size = size
+        self._names = ()
+        self._names_generation = 0
+        self._names_size = 0
+        self._values_struct = struct.Struct('<0d')
+        self._published = 0
+        self._skipped = 0
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._mmap = mmap.mmap(fd, size, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+        magic, version, sequence, _, _, names_generation, _ = _HEADER.unpack_from(self._mmap, 0)
+        valid = magic == MAGIC and version == LAYOUT_VERSION
+        self._sequence = sequence if valid else 0
+        self._names_generation = names_generation if valid else 0
+        if not valid or sequence % 2:
+            # a new file, or the previous publisher stopped while writing a snapshot
+            self._sequence += self._sequence % 2
+            self._names_generation = (self._names_generation + 1) & 0xffffffff
+            self._write_header(0.0, 0)
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    @property
+    def stats(self):
+        return {'published': self._published, 'skipped': self._skipped, 'metrics': len(self._names),
+                'sequence': self._sequence}
+
+    def publish(self, metrics, timestamp=None):
+        """Replace the published snapshot with the numeric metrics.
+
+        :param dict metrics: flattened paths mapped to values
+        :param float timestamp: collection time of the metrics, default is now
+        :raises ElasticMetricsError: if the snapshot doesn't fit in the file
+        """
+        if self._mmap is None:
+            raise ElasticMetricsError('snapshot publisher is closed')
+        timestamp = time.time() if timestamp is None else timestamp
+        names = []
+        values = []
+        for name, value in metrics.items():
+            if isinstance(value, Real):
+                names.append(name)
+                values.append(float(value))
+        names = tuple(names)
+        encoded_names = None
+        if names != self._names:
+            encoded_names = '\n'.join(names).encode('utf-8')
+            if HEADER_SIZE + _VALUE.size * len(values) + len(encoded_names) > self._size:
+                raise ElasticMetricsError(
+                    'snapshot of {} metrics does not fit in {} bytes of "{}"'.format(
+                        len(values), self._size, self._filename))
+            self._values_struct = struct.Struct('<{}d'.format(len(values)))
+
+        self._write_sequence(self._sequence + 1)
+        self._values_struct.pack_into(self._mmap, HEADER_SIZE, *values)
+        if encoded_names is not None:
+            names_offset = HEADER_SIZE + self._values_struct.size
+            self._mmap[names_offset:names_offset + len(encoded_names)] = encoded_names
+            self._names = names
+            self._names_size = len(encoded_names)
+            self._names_generation = (self._names_generation + 1) & 0xffffffff
+        self._write_header(timestamp, len(values))
+        self._write_sequence(self._sequence + 1)
+        self._published += 1
+
+    def send(self, metrics, timestamp=None):
+        """Publish the metrics like publish, as a sink. Snapshots that do not fit
+        in the file are logged and skipped (the previous snapshot stays published),
+        so a growing number of metrics does not stop reporting to other outputs.
+        """
+        try:
+            self.publish(metrics, timestamp)
+        except ElasticMetricsError as err:
+            self._skipped += 1
+            logger.error('skipped publishing snapshot: {}'.format(err))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap.close()
+            self._mmap = None
+
+    def _write_sequence(self, sequence):
+        self._sequence = sequence
+        _SEQUENCE.pack_into(self._mmap, _SEQUENCE_OFFSET, sequence)
+
+    def _write_header(self, timestamp, count):
+        _HEADER.pack_into(self._mmap, 0, MAGIC, LAYOUT_VERSION, self._sequence, timestamp, count,
+                          self._names_generation, self._names_size)
+
+
+class SnapshotReader(object):
+    """Read snapshots published by SnapshotPublisher, without querying ElasticSearch.
+
+    Values are unpacked directly from the mapped file. Metric names are only
+    decoded when they change, so steady state reads only unpack the values.
+
+    :param str filename: path to the snapshot file
+    :param int retries: number of attempts to read a consistent snapshot
+    :raises ElasticMetricsError: if the file is not a snapshot file
+    """
+
+    def __init__(self, filename, retries=1000):
+        self._filename = filename
+        self._retries = retries
+        self._names = ()
+        self._index = {}
+        self._names_generation = None
+        with open(filename, 'rb') as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER_SIZE or self._mmap[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ElasticMetricsError('"{}" is not a metrics snapshot file'.format(filename))
+        version = _HEADER.unpack_from(self._mmap, 0)[1]
+        if version != LAYOUT_VERSION:
+            self.close()
+            raise ElasticMetricsError('unsupported snapshot layout version "{}"'.format(version))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def sequence(self):
+        """Sequence of the current snapshot, changes on each publish"""
+        return _SEQUENCE.unpack_from(self._mmap, _SEQUENCE_OFFSET)[0]
+
+    def read(self):
+        """Read the current snapshot.
+
+        :return Snapshot: sequence, timestamp and OrderedDict of metrics
+        :raises ElasticMetricsError: if no consistent snapshot could be read
+        """
+        for _ in range(self._retries):
+            sequence, timestamp, count, values = self._read_values()
+            if values is not None and sequence == self.sequence:
+                return Snapshot(sequence, timestamp, OrderedDict(zip(self._names, values)))
+            time.sleep(0)
+        raise ElasticMetricsError('failed to read a consistent snapshot from "{}"'.format(self._filename))
+
+    def get(self, name, default=None):
+        """Read the current value of a single metric.
+
+        :param str name: flattened path of the metric
+        :param default: returned if the metric is not in the snapshot
+        :raises ElasticMetricsError: if no consistent value could be read
+        """
+        for _ in range(self._retries):
+            sequence, _, count = self._read_header()
+            if sequence is not None:
+                index = self._index.get(name)
+                if index is None:
+                    value = default
+                else:
+                    value = _VALUE.unpack_from(self._mmap, HEADER_SIZE + _VALUE.size * index)[0]
+                if sequence == self.sequence:
+                    return value
+            time.sleep(0)
+        raise ElasticMetricsError('failed to read a consistent snapshot from "{}"'.format(self._filename))
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _read_header(self):
+        """Read the header, and the names if they changed. Returns a None sequence
+        if a snapshot is being published"""
+        _, _, sequence, timestamp, count, names_generation, names_size = _HEADER.unpack_from(self._mmap, 0)
+        if sequence % 2:
+            return None, None, None
+        if names_generation != self._names_generation:
+            names_offset = HEADER_SIZE + _VALUE.size * count
+            encoded_names = self._mmap[names_offset:names_offset + names_size]
+            if sequence != self.sequence:
+                return None, None, None
+            names = tuple(encoded_names.decode('utf-8').split('\n')) if count else ()
+            if len(names) != count:
+                return None, None, None
+            self._names = names
+            self._index = dict((name, index) for index, name in enumerate(names))
+            self._names_generation = names_generation
+        return sequence, timestamp, count
+
+    def _read_values(self):
+        sequence, timestamp, count = self._read_header()
+        if sequence is None:
+            return None, None, None, None
+        values = struct.unpack_from('<{}d'.format(count), self._mmap, HEADER_SIZE)
+        return sequence, timestamp, count, values
@@ -0,0 +1,141 @@
+"""
+elasticmetrics.streaming
+~~~~~~~~~~~~~~~~~~~~~~~~
+Process large responses in constant memory: decode JSON incrementally
+and summarize values with approximate quantiles.
+"""
+import re
+import json
+import math
+import codecs
+from .exceptions import ElasticMetricsError, ElasticMetricsRequestError
+
+
+_SKIP_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json_array(chunks, key, encoding='utf-8'):
+    """Yield the items of the array mapped to the key in a JSON object, decoding
+    the JSON text incrementally from the chunks. Only one item (and a chunk)
+    is kept in memory, however long the array is.
+
+    The key is expected to be one of the top level keys of the object, like
+    "tasks" in responses of _cluster/pending_tasks API.
+
+    :param iterable chunks: chunks of the JSON text (bytes)
+    :param str key: key of the array
+    :param str encoding: encoding of the JSON text
+    :raise ElasticMetricsRequestError: if the key is not found, or the JSON text is invalid or truncated
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)()
+    chunks = iter(chunks)
+    array_start = re.compile(r'"{}"\s*:\s*\['.format(re.escape(key)))
+    buffer_ = ''
+    pos = 0
+
+    def read(buffer_, pos):
+        for chunk in chunks:
+            text = text_decoder.decode(chunk)
+            if text:
+                return buffer_[pos:] + text, 0
+        return None, pos
+
+    # find the start of the array, keeping enough text to match the key across chunks
+    while True:
+        match = array_start.search(buffer_)
+        if match:
+            pos = match.end()
+            break
+        buffer_, _ = read(buffer_, max(0, len(buffer_) - len(key) - 64))
+        if buffer_ is None:
+            raise ElasticMetricsRequestError('no "{}" array found in JSON'.format(key))
+
+    while True:
+        pos = _SKIP_SEPARATORS.match(buffer_, pos).end()
+        if pos < len(buffer_):
+            if buffer_[pos] == ']':
+                # read the rest of the response, so the request completes (and is recorded)
+                for _ in chunks:
+                    pass
+                return
+            try:
+                item, end = decoder.raw_decode(buffer_, pos)
+            except ValueError:
+                pass
+            else:
+                # a scalar at the end of the buffer may continue in the next chunk
+                if end < len(buffer_) or isinstance(item, (dict, list)):
+                    yield item
+                    pos = end
+                    continue
+        more, pos = read(buffer_, pos)
+        if more is None:
+            raise ElasticMetricsRequestError('invalid or truncated JSON array "{}"'.format(key))
+        buffer_ = more
+
+
+class QuantileSketch(object):
+    """Approximate quantiles of positive values in constant memory.
+
+    Values are counted in logarithmic buckets, so quantiles are estimated
+    with the relative accuracy (like 1%). Values not greater than 0 are counted
+    in a separate bucket. When there are more than max_buckets buckets, the
+    lowest buckets are merged, losing accuracy only for the lowest quantiles.
+
+    :param float relative_accuracy: relative error of estimated quantiles, between 0 and 1
+    :param int max_buckets: maximum number of buckets
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        if not 0 < relative_accuracy < 1:
+            raise ElasticMetricsError('invalid relative accuracy "{}"'.format(relative_accuracy))
+        if max_buckets < 1:
+            raise ElasticMetricsError('invalid max buckets "{}"'.format(max_buckets))
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._max_buckets = max_buckets
+        self._buckets = {}
+        self._zero_count = 0
+        self._count = 0
+
+    @property
+    def count(self):
+        return self._count
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def add(self, value):
+        self._count += 1
+        if value <= 0:
+            self._zero_count += 1
+            return
+        index = int(math.ceil(math.log(value) / self._log_gamma))
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        if len(self._buckets) > self._max_buckets:
+            self._collapse()
+
+    def quantile(self, q):
+        """Return the estimated value of the quantile (between 0 and 1),
+        None if no values were added.
+
+        :param float q: the quantile, like 0.99
+        """
+        if not 0 <= q <= 1:
+            raise ElasticMetricsError('invalid quantile "{}"'.format(q))
+        if not self._count:
+            return None
+        rank = q * (self._count - 1)
+        seen = self._zero_count
+        if seen > rank:
+            return 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen > rank:
+                return 2 * self._gamma ** index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._buckets) / (self._gamma + 1)
+
+    def _collapse(self):
+        lowest, second_lowest = sorted(self._buckets)[:2]
+        self._buckets[second_lowest] += self._buckets.pop(lowest)
@@ -0,0 +1,128 @@
+import os
+import math
+import shutil
+import tempfile
+from array import array
+from unittest import skipIf
+from collections import OrderedDict
+from elasticmetrics.archive import ArchiveWriter, ArchiveReader, archive_files, numpy
+from elasticmetrics.exceptions import ElasticMetricsError
+from . import BaseTestCase
+
+
+class TestArchive(BaseTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.archive_dir = os.path.join(self.tmp_dir, 'archive')
+
+    def _write(self, samples, **kwargs):
+        writer = ArchiveWriter(self.archive_dir, **kwargs)
+        for timestamp, metrics in samples:
+            writer.send(metrics, timestamp)
+        writer.close()
+        return writer
+
+    def _reader(self, filename, **kwargs):
+        reader = ArchiveReader(filename, **kwargs)
+        self.addCleanup(reader.close)
+        return reader
+
+    def test_archive_reader_reads_series_across_segments(self):
+        samples = [(1000.0 + i, OrderedDict([('cluster.status', 2), ('es01.jvm.heap', i * 1.5), ('name', 'es01')]))
+                   for i in range(10)]
+        writer = self._write(samples, segment_rows=4)
+        self.assertEqual(writer.stats, {'samples': 10, 'segments': 2, 'files': 1, 'pruned': 0})
+        reader = self._reader(writer.filename, use_numpy=False)
+        self.assertEqual(reader.paths, ('cluster.status', 'es01.jvm.heap'))
+        self.assertEqual(len(reader), 10)
+        self.assertEqual(reader.timestamps(), array('d', [1000.0 + i for i in range(10)]))
+        self.assertEqual(reader.series('es01.jvm.heap'), array('d', [i * 1.5 for i in range(10)]))
+        self.assertEqual(list(reader.series('cluster.status')), [2.0] * 10)
+
+    def test_archive_reader_returns_nan_for_missing_values(self):
+        writer = self._write([(1.0, {'a': 1, 'b': 2}), (2.0, {'a': 3})])
+        reader = self._reader(writer.filename, use_numpy=False)
+        self.assertEqual(list(reader.series('a')), [1.0, 3.0])
+        values = reader.series('b')
+        self.assertEqual(values[0], 2.0)
+        self.assertTrue(math.isnan(values[1]))
+
+    def test_archive_writer_starts_new_file_on_max_segments(self):
+        self._write([(1.0, {'a': 1}), (2.0, {'a': 2, 'b': 1}), (3.0, {'a': 3}), (4.0, {'a': 4})],
+                    segment_rows=1, max_segments=2)
+        filenames = archive_files(self.archive_dir)
+        self.assertEqual(len(filenames), 2)
+        samples = [list(self._reader(filename, use_numpy=False).timestamps()) for filename in filenames]
+        self.assertEqual(samples, [[1.0, 2.0], [3.0, 4.0]])
+
+    def test_archive_writer_adds_new_paths_to_the_current_file(self):
+        writer = ArchiveWriter(self.archive_dir, segment_rows=4)
+        writer.send({'b': 1}, 1.0)
+        writer.flush()
+        writer.send({'a': 2, 'b': 3}, 2.0)
+        writer.send({'a': 4, 'c': 5}, 3.0)
+        writer.close()
+        self.assertEqual(archive_files(self.archive_dir), [writer.filename])
+        self.assertEqual(writer.stats, {'samples': 3, 'segments': 2, 'files': 1, 'pruned': 0})
+        reader = self._reader(writer.filename, use_numpy=False)
+        self.assertEqual(reader.paths, ('b', 'a', 'c'))
+        self.assertEqual(list(reader.timestamps()), [1.0, 2.0, 3.0])
+        series = dict((path, [None if math.isnan(value) else value for value in reader.series(path)])
+                      for path in reader.paths)
+        self.assertEqual(series, {'a': [None, 2.0, 4.0], 'b': [1.0, 3.0, None], 'c': [None, None, 5.0]})
+
+    def test_archive_writer_flush_writes_partial_segment(self):
+        writer = ArchiveWriter(self.archive_dir, segment_rows=100)
+        self.addCleanup(writer.close)
+        writer.send({'a': 1}, 1.0)
+        writer.flush()
+        self.assertEqual(list(self._reader(writer.filename, use_numpy=False).series('a')), [1.0])
+        writer.send({'a': 2}, 2.0)
+        writer.flush()
+        self.assertEqual(list(self._reader(writer.filename, use_numpy=False).series('a')), [1.0, 2.0])
+
+    def test_archive_writer_writes_partial_segment_after_flush_interval(self):
+        writer = ArchiveWriter(self.archive_dir, segment_rows=100, flush_interval=10)
+        self.addCleanup(writer.close)
+        writer.send({'a': 1}, 1.0)
+        writer.send({'a': 2}, 5.0)
+        writer.send({'a': 3}, 11.0)
+        self.assertEqual(list(self._reader(writer.filename, use_numpy=False).series('a')), [1.0, 2.0, 3.0])
+
+    def test_archive_writer_prunes_old_files_and_files_over_max_bytes(self):
+        for timestamp in (1.0, 2.0, 3.0):
+            self._write([(timestamp, {'a': 1})])
+        old_filename = archive_files(self.archive_dir)[0]
+        os.utime(old_filename, (1.0, 1.0))
+        writer = self._write([(4.0, {'d': 1})], max_age=3600)
+        self.assertEqual(writer.stats['pruned'], 1)
+        self.assertEqual(len(archive_files(self.archive_dir)), 3)
+        file_size = os.path.getsize(writer.filename)
+        writer = self._write([(5.0, {'e': 1})], max_bytes=file_size + 1)
+        self.assertEqual(writer.stats['pruned'], 2)
+        self.assertEqual(archive_files(self.archive_dir)[-1], writer.filename)
+        self.assertEqual(len(archive_files(self.archive_dir)), 2)
+
+    def test_archive_writer_raises_on_invalid_limits(self):
+        for kwargs in ({'flush_interval': 0}, {'max_age': -1}, {'max_bytes': 0}):
+            with self.assertRaises(ElasticMetricsError):
+                ArchiveWriter(self.archive_dir, **kwargs)
+
+    @skipIf(numpy is None, 'requires NumPy')
+    def test_archive_reader_returns_numpy_views(self):
+        writer = self._write([(float(i), {'a': i}) for i in range(5)])
+        reader = self._reader(writer.filename, use_numpy=True)
+        series = reader.series('a')
+        self.assertIsInstance(series, numpy.ndarray)
+        self.assertEqual(series.tolist(), [0.0, 1.0, 2.0, 3.0, 4.0])
+
+    def test_archive_reader_raises_on_invalid_files_and_paths(self):
+        filename = os.path.join(self.tmp_dir, 'invalid.emar')
+        with open(filename, 'wb') as fh:
+            fh.write(b'\0' * 64)
+        with self.assertRaises(ElasticMetricsError):
+            ArchiveReader(filename)
+        writer = self._write([(1.0, {'a': 1})])
+        with self.assertRaises(ElasticMetricsError):
+            self._reader(writer.filename).series('invalid')
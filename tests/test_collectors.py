@@ -1,5 +1,6 @@
 from elasticmetrics.collectors import ElasticSearchCollector
 from elasticmetrics.http import HttpClient
+from elasticmetrics.exceptions import ElasticMetricsError
 from elasticmetrics.pystdlib.urllib_request import Request
 from . import BaseTestCase
 
@@ -72,3 +73,113 @@ class TestElasticSearchCollector(BaseTestCase):
             urlopen_arg.get_full_url(),
             'http://localhost:9300/_cluster/pending_tasks'
         )
+
+    def test_elasticsearch_collector_raw_stats_returns_response_body_of_target(self):
+        es_collector = ElasticSearchCollector('localhost')
+        resp = es_collector.raw_stats('node_stats')
+
+        self.assertEqual(resp, b'{"_nodes": []}')
+        urlopen_arg = self.mock_urlopen.call_args[0][0]
+        self.assertEqual(
+            urlopen_arg.get_full_url(),
+            'http://localhost:9200/_nodes/_local/stats'
+        )
+
+    def test_elasticsearch_collector_raw_stats_raises_on_invalid_target(self):
+        es_collector = ElasticSearchCollector('localhost')
+        with self.assertRaises(ElasticMetricsError):
+            es_collector.raw_stats('invalid')
+
+    def test_elasticsearch_collector_node_stats_queries_only_specified_sections(self):
+        es_collector = ElasticSearchCollector('localhost')
+        es_collector.node_stats(['jvm', 'indices', 'jvm'])
+        urlopen_arg = self.mock_urlopen.call_args[0][0]
+        self.assertEqual(
+            urlopen_arg.get_full_url(),
+            'http://localhost:9200/_nodes/_local/stats/indices,jvm'
+        )
+
+    def test_elasticsearch_collector_node_stats_raises_on_invalid_sections(self):
+        es_collector = ElasticSearchCollector('localhost')
+        with self.assertRaises(ElasticMetricsError):
+            es_collector.node_stats(['jvm', 'invalid'])
+
+    def test_elasticsearch_collector_node_info_queries_api_with_filter_path(self):
+        es_collector = ElasticSearchCollector('localhost')
+        es_collector.node_info()
+        self.assertEqual(
+            self.mock_urlopen.call_args[0][0].get_full_url(),
+            'http://localhost:9200/_nodes/_local?filter_path='
+            'nodes.*.name,nodes.*.host,nodes.*.version,nodes.*.roles,nodes.*.attributes'
+        )
+        es_collector.node_info(['node2', 'node1'])
+        self.assertTrue(
+            self.mock_urlopen.call_args[0][0].get_full_url().startswith('http://localhost:9200/_nodes/node1,node2?')
+        )
+
+    def test_elasticsearch_collector_cached_node_info_requests_once_within_ttl(self):
+        mock_time = self.set_up_patch('elasticmetrics.collectors.time.time')
+        mock_time.return_value = 1000.0
+        self.mock_urlopen.return_value = self._mock_urlopen_response(b'{"nodes": {"node1": {"name": "es01"}}}')
+        es_collector = ElasticSearchCollector('localhost', node_info_ttl=60)
+        self.assertEqual(es_collector.cached_node_info(['node1']), {'node1': {'name': 'es01'}})
+        mock_time.return_value = 1059.0
+        self.assertEqual(es_collector.cached_node_info(['node1']), {'node1': {'name': 'es01'}})
+        self.assertEqual(self.mock_urlopen.call_count, 1)
+        mock_time.return_value = 1060.0
+        es_collector.cached_node_info(['node1'])
+        self.assertEqual(self.mock_urlopen.call_count, 2)
+
+    def test_elasticsearch_collector_cached_node_info_refreshes_once_on_unknown_nodes(self):
+        self.mock_urlopen.return_value = self._mock_urlopen_response(b'{"nodes": {"node1": {"name": "es01"}}}')
+        es_collector = ElasticSearchCollector('localhost')
+        es_collector.cached_node_info(['node1'])
+        self.assertEqual(self.mock_urlopen.call_count, 1)
+        self.mock_urlopen.return_value = self._mock_urlopen_response(b'{"nodes": {"node2": {"name": "es02"}}}')
+        self.assertEqual(es_collector.cached_node_info(['node2']), {'node2': {'name': 'es02'}})
+        self.assertEqual(self.mock_urlopen.call_count, 2)
+        es_collector.cached_node_info(['node2', 'node3'])
+        self.assertEqual(self.mock_urlopen.call_count, 3)
+        es_collector.cached_node_info(['node2', 'node3'])
+        self.assertEqual(self.mock_urlopen.call_count, 3)
+
+    def test_elasticsearch_collector_node_stats_queries_specified_nodes(self):
+        es_collector = ElasticSearchCollector('localhost')
+        es_collector.node_stats(['jvm', 'fs'], node_ids=['_all'])
+        self.assertEqual(
+            self.mock_urlopen.call_args[0][0].get_full_url(),
+            'http://localhost:9200/_nodes/_all/stats/fs,jvm'
+        )
+
+    def test_elasticsearch_collector_iter_cluster_pending_tasks_streams_tasks(self):
+        body = b'{"tasks": [{"insert_order": 1, "priority": "URGENT"}, {"insert_order": 2, "priority": "HIGH"}]}'
+        chunks = [body[i:i + 10] for i in range(0, len(body), 10)]
+        mock_response = self._mock_urlopen_response()
+        mock_response.read.side_effect = chunks + [b'']
+        self.mock_urlopen.return_value = mock_response
+        es_collector = ElasticSearchCollector('localhost')
+        tasks = list(es_collector.iter_cluster_pending_tasks(chunk_size=10))
+        self.assertEqual([task['insert_order'] for task in tasks], [1, 2])
+        self.assertEqual(
+            self.mock_urlopen.call_args[0][0].get_full_url(),
+            'http://localhost:9200/_cluster/pending_tasks'
+        )
+        mock_response.read.assert_called_with(10)
+
+    def test_elasticsearch_collector_cat_health_queries_api_with_columns_and_returns_text(self):
+        self.mock_urlopen.return_value = self._mock_urlopen_response(b'green 10 5 0 0 0 - 100.0%\n')
+        es_collector = ElasticSearchCollector('localhost')
+        self.assertEqual(es_collector.cat_health(), 'green 10 5 0 0 0 - 100.0%\n')
+        self.assertEqual(
+            self.mock_urlopen.call_args[0][0].get_full_url(),
+            'http://localhost:9200/_cat/health?h=status,shards,pri,relo,init,pending_tasks,max_task_wait_time,'
+            'active_shards_percent&time=ms'
+        )
+
+    def test_elasticsearch_collector_cat_thread_pool_queries_api_with_columns(self):
+        es_collector = ElasticSearchCollector('localhost')
+        es_collector.cat_thread_pool()
+        self.assertEqual(
+            self.mock_urlopen.call_args[0][0].get_full_url(),
+            'http://localhost:9200/_cat/thread_pool?h=id,name,active,queue,rejected,largest,completed,pool_size'
+        )
@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from elasticmetrics.derived import DerivedMetrics
+from . import BaseTestCase
+
+
+class TestDerivedMetrics(BaseTestCase):
+    def test_derived_metrics_derives_nothing_on_first_snapshot(self):
+        derived = DerivedMetrics()
+        self.assertEqual(derived.derive({'es01.indices.search.query_total': 10,
+                                         'es01.indices.search.query_time_in_millis': 50}), {})
+
+    def test_derived_metrics_derives_mean_latency_of_interval(self):
+        derived = DerivedMetrics()
+        derived.derive({'es01.indices.search.query_total': 10, 'es01.indices.search.query_time_in_millis': 50,
+                        'es01.indices.refresh.total': 1, 'es01.indices.refresh.total_time_in_millis': 8})
+        self.assertEqual(
+            derived.derive({'es01.indices.search.query_total': 14, 'es01.indices.search.query_time_in_millis': 60,
+                            'es01.indices.refresh.total': 3, 'es01.indices.refresh.total_time_in_millis': 20}),
+            OrderedDict([('es01.indices.search.query_latency_in_millis', 2.5),
+                         ('es01.indices.refresh.latency_in_millis', 6.0)])
+        )
+
+    def test_derived_metrics_derives_cache_hit_ratio_of_interval(self):
+        derived = DerivedMetrics()
+        derived.derive({'indices.query_cache.hit_count': 100, 'indices.query_cache.miss_count': 100})
+        self.assertEqual(derived.derive({'indices.query_cache.hit_count': 130, 'indices.query_cache.miss_count': 110}),
+                         {'indices.query_cache.hit_ratio': 0.75})
+
+    def test_derived_metrics_skips_intervals_without_operations(self):
+        derived = DerivedMetrics()
+        metrics = {'indices.get.total': 5, 'indices.get.time_in_millis': 9,
+                   'indices.request_cache.hit_count': 3, 'indices.request_cache.miss_count': 1}
+        derived.derive(metrics)
+        self.assertEqual(derived.derive(metrics), {})
+
+    def test_derived_metrics_skips_reset_counters(self):
+        derived = DerivedMetrics()
+        derived.derive({'indices.flush.total': 50, 'indices.flush.total_time_in_millis': 500})
+        self.assertEqual(derived.derive({'indices.flush.total': 2, 'indices.flush.total_time_in_millis': 30}), {})
+        self.assertEqual(derived.derive({'indices.flush.total': 4, 'indices.flush.total_time_in_millis': 40}),
+                         {'indices.flush.latency_in_millis': 5.0})
+
+    def test_derived_metrics_ignores_incomplete_or_non_numeric_counters(self):
+        derived = DerivedMetrics()
+        for _ in range(2):
+            self.assertEqual(derived.derive({'indices.search.query_total': 1, 'search.query_total': 1,
+                                             'indices.search.query_time_in_millis': None,
+                                             'indices.merges.total': 3}), {})
+
+    def test_derived_metrics_derives_from_interleaved_snapshots_of_tiers(self):
+        derived = DerivedMetrics()
+        derived.derive({'es01.indices.search.query_total': 10, 'es01.indices.search.query_time_in_millis': 50})
+        # snapshots of other targets or clusters, without the counters, do not lose them
+        self.assertEqual(derived.derive({'cluster.status': 2}), {})
+        derived.derive({'es02.indices.get.total': 1, 'es02.indices.get.time_in_millis': 10})
+        self.assertEqual(
+            derived.derive({'es01.indices.search.query_total': 12, 'es01.indices.search.query_time_in_millis': 60}),
+            {'es01.indices.search.query_latency_in_millis': 5.0})
+        self.assertEqual(derived.derive({'es02.indices.get.total': 3, 'es02.indices.get.time_in_millis': 20}),
+                         {'es02.indices.get.latency_in_millis': 5.0})
+
+    def test_derived_metrics_forgets_counters_not_seen_for_expire_after(self):
+        derived = DerivedMetrics(expire_after=60)
+        derived.derive({'es01.indices.get.total': 1, 'es01.indices.get.time_in_millis': 10}, 1000)
+        derived.derive({'es02.indices.get.total': 1, 'es02.indices.get.time_in_millis': 10}, 1030)
+        derived.derive({'es02.indices.get.total': 2, 'es02.indices.get.time_in_millis': 20}, 1070)
+        self.assertEqual(sorted(derived._previous), ['es02.indices.get.latency_in_millis'])
+        self.assertEqual(derived.derive({'es01.indices.get.total': 3, 'es01.indices.get.time_in_millis': 30}, 1080),
+                         {})
+
+    def test_derived_metrics_reset_derives_from_next_two_snapshots(self):
+        derived = DerivedMetrics()
+        derived.derive({'indices.merges.total': 1, 'indices.merges.total_time_in_millis': 10})
+        derived.reset()
+        self.assertEqual(derived.derive({'indices.merges.total': 2, 'indices.merges.total_time_in_millis': 30}), {})
+
+    def test_derived_metrics_with_custom_counters(self):
+        derived = DerivedMetrics(latency_counters={'indices.warmer': (('total', 'total_time_in_millis', 'latency'),)},
+                                 hit_ratio_counters={}, max_cached_paths=1)
+        derived.derive({'indices.warmer.total': 1, 'indices.warmer.total_time_in_millis': 2,
+                        'indices.query_cache.hit_count': 1, 'indices.query_cache.miss_count': 1})
+        self.assertEqual(derived.derive({'indices.warmer.total': 3, 'indices.warmer.total_time_in_millis': 8,
+                                         'indices.query_cache.hit_count': 2, 'indices.query_cache.miss_count': 1}),
+                         {'indices.warmer.latency': 3.0})
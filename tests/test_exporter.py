@@ -0,0 +1,116 @@
+import threading
+from elasticmetrics.exporter import MetricsCache, PrometheusExporter
+from elasticmetrics.exceptions import ElasticMetricsError
+from elasticmetrics.pystdlib.urllib_request import urlopen
+from . import BaseTestCase
+
+
+class TestMetricsCache(BaseTestCase):
+    def test_metrics_cache_get_collects_once_and_returns_cached_results(self):
+        results = iter(['first', 'second'])
+        cache = MetricsCache(lambda: next(results), 60)
+        self.assertEqual(cache.get(), 'first')
+        self.assertEqual(cache.get(), 'first')
+        self.assertEqual(cache.collections, 1)
+        self.assertIsNotNone(cache.updated)
+
+    def test_metrics_cache_refresh_updates_cached_results(self):
+        results = iter(['first', 'second'])
+        cache = MetricsCache(lambda: next(results), 60)
+        cache.get()
+        self.assertEqual(cache.refresh(), 'second')
+        self.assertEqual(cache.get(), 'second')
+
+    def test_metrics_cache_keeps_previous_results_on_collection_errors(self):
+        results = iter(['first'])
+        cache = MetricsCache(lambda: next(results), 60)
+        cache.get()
+        self.assertEqual(cache.refresh(), 'first')
+        self.assertEqual(cache.errors, 1)
+
+    def test_metrics_cache_get_raises_if_nothing_could_be_collected(self):
+        def fail():
+            raise ValueError('failed')
+
+        cache = MetricsCache(fail, 60)
+        with self.assertRaises(ElasticMetricsError):
+            cache.get()
+
+    def test_metrics_cache_concurrent_readers_share_one_collection(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_collect():
+            started.set()
+            release.wait(5)
+            return 'metrics'
+
+        cache = MetricsCache(slow_collect, 60)
+        results = []
+        readers = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(5)]
+        readers[0].start()
+        started.wait(5)
+        for reader in readers[1:]:
+            reader.start()
+        release.set()
+        for reader in readers:
+            reader.join(5)
+        self.assertEqual(results, ['metrics'] * 5)
+        self.assertEqual(cache.collections, 1)
+
+    def test_metrics_cache_refreshes_in_background(self):
+        refreshed = threading.Event()
+        calls = []
+
+        def collect():
+            calls.append(1)
+            if len(calls) > 1:
+                refreshed.set()
+            return 'metrics'
+
+        cache = MetricsCache(collect, 0.01)
+        cache.start()
+        self.assertTrue(refreshed.wait(5))
+        cache.stop()
+        self.assertGreater(cache.collections, 1)
+
+
+class TestPrometheusExporter(BaseTestCase):
+    def _start_exporter(self, collect):
+        cache = MetricsCache(collect, 60)
+        exporter = PrometheusExporter(cache, host='127.0.0.1', port=0)
+        thread = threading.Thread(target=exporter.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        def stop():
+            exporter.shutdown()
+            thread.join(5)
+            exporter.close()
+
+        self.addCleanup(stop)
+        return 'http://127.0.0.1:{}'.format(exporter.server_address[1])
+
+    def test_prometheus_exporter_serves_cached_metrics(self):
+        url = self._start_exporter(lambda: 'elasticsearch_jvm_threads 10\n')
+        response = urlopen(url + '/metrics')
+        body = response.read().decode('utf-8')
+        self.assertEqual(response.getcode(), 200)
+        self.assertIn('text/plain', response.info()['Content-Type'])
+        self.assertTrue(body.startswith('elasticsearch_jvm_threads 10\n'))
+        self.assertIn('elasticmetrics_collections_total 1\n', body)
+
+    def test_prometheus_exporter_responds_not_found_to_other_paths(self):
+        url = self._start_exporter(lambda: '')
+        with self.assertRaises(IOError) as context:
+            urlopen(url + '/other')
+        self.assertEqual(context.exception.code, 404)
+
+    def test_prometheus_exporter_responds_unavailable_without_metrics(self):
+        def fail():
+            raise ValueError('failed')
+
+        url = self._start_exporter(fail)
+        with self.assertRaises(IOError) as context:
+            urlopen(url + '/metrics')
+        self.assertEqual(context.exception.code, 503)
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from elasticmetrics.filters import ChangeFilter
+from elasticmetrics.exceptions import ElasticMetricsError
+from . import BaseTestCase
+
+
+class TestChangeFilter(BaseTestCase):
+    def test_change_filter_emits_all_metrics_on_first_cycle(self):
+        change_filter = ChangeFilter()
+        metrics = OrderedDict([('cluster.status', 2), ('jvm.mem.heap_used_percent', 20)])
+        self.assertEqual(change_filter.filter(metrics), metrics)
+        self.assertEqual(len(change_filter), 2)
+
+    def test_change_filter_suppresses_unchanged_values(self):
+        change_filter = ChangeFilter()
+        change_filter.filter({'cluster.status': 2, 'jvm.mem.heap_used_percent': 20})
+        self.assertEqual(
+            change_filter.filter({'cluster.status': 2, 'jvm.mem.heap_used_percent': 21}),
+            {'jvm.mem.heap_used_percent': 21}
+        )
+        self.assertEqual(change_filter.filter({'cluster.status': 2, 'jvm.mem.heap_used_percent': 21}), {})
+
+    def test_change_filter_emits_new_paths(self):
+        change_filter = ChangeFilter()
+        change_filter.filter({'a': 1})
+        self.assertEqual(change_filter.filter({'a': 1, 'b': 1}), {'b': 1})
+
+    def test_change_filter_resends_unchanged_values_every_heartbeat_cycles(self):
+        change_filter = ChangeFilter(heartbeat=3)
+        emitted = [change_filter.filter({'a': 1}) for _ in range(7)]
+        self.assertEqual(emitted, [{'a': 1}, {}, {}, {'a': 1}, {}, {}, {'a': 1}])
+
+    def test_change_filter_heartbeat_counts_from_last_emission(self):
+        change_filter = ChangeFilter(heartbeat=3)
+        change_filter.filter({'a': 1})
+        change_filter.filter({'a': 2})
+        self.assertEqual(change_filter.filter({'a': 2}), {})
+        self.assertEqual(change_filter.filter({'a': 2}), {})
+        self.assertEqual(change_filter.filter({'a': 2}), {'a': 2})
+
+    def test_change_filter_compares_large_integers_exactly(self):
+        change_filter = ChangeFilter()
+        change_filter.filter({'a': 2 ** 60})
+        self.assertEqual(change_filter.filter({'a': 2 ** 60 + 1}), {'a': 2 ** 60 + 1})
+        self.assertEqual(change_filter.filter({'a': 2 ** 60 + 1}), {})
+        self.assertEqual(change_filter.filter({'a': 2 ** 60 + 1}), {})
+
+    def test_change_filter_always_emits_non_numeric_values(self):
+        change_filter = ChangeFilter()
+        change_filter.filter({'a': 'green'})
+        self.assertEqual(change_filter.filter({'a': 'green'}), {'a': 'green'})
+
+    def test_change_filter_suppresses_unchanged_bools(self):
+        change_filter = ChangeFilter()
+        change_filter.filter({'a': True})
+        self.assertEqual(change_filter.filter({'a': True}), {})
+        self.assertEqual(change_filter.filter({'a': False}), {'a': False})
+
+    def test_change_filter_suppresses_nan_after_nan(self):
+        change_filter = ChangeFilter()
+        change_filter.filter({'a': float('nan')})
+        self.assertEqual(change_filter.filter({'a': float('nan')}), {})
+        self.assertEqual(change_filter.filter({'a': 1.0}), {'a': 1.0})
+        self.assertEqual(list(change_filter.filter({'a': float('nan')})), ['a'])
+
+    def test_change_filter_reset_emits_all_metrics_on_next_cycle(self):
+        change_filter = ChangeFilter()
+        change_filter.filter({'a': 1})
+        change_filter.reset()
+        self.assertEqual(change_filter.filter({'a': 1}), {'a': 1})
+
+    def test_change_filter_init_raises_on_negative_heartbeat(self):
+        with self.assertRaises(ElasticMetricsError):
+            ChangeFilter(-1)
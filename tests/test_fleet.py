@@ -0,0 +1,170 @@
+import os
+import json
+import shutil
+import tempfile
+import mock
+from elasticmetrics.fleet import HashRing, assign_clusters, load_fleet_config, run_worker, FleetSupervisor
+from elasticmetrics.exceptions import ElasticMetricsError, ElasticMetricsRequestError
+from . import BaseTestCase, FIXTURES_PATH
+
+
+FIXTURE_NODESTATS = os.path.join(FIXTURES_PATH, 'node_stats.json')
+
+with open(FIXTURE_NODESTATS, 'rb') as fh:
+    NODE_STATS_BODY = fh.read()
+
+
+class MockReporter(object):
+    def __init__(self):
+        self.reported = []
+        self.closed = False
+
+    def report_flattened(self, metrics):
+        self.reported.append(metrics)
+
+    def close(self):
+        self.closed = True
+
+
+class TestHashRing(BaseTestCase):
+    def test_hash_ring_distributes_keys_over_all_nodes(self):
+        ring = HashRing(range(4))
+        nodes = [ring.get('cluster-{}'.format(i)) for i in range(400)]
+        for node in range(4):
+            self.assertGreater(nodes.count(node), 50)
+
+    def test_hash_ring_moves_few_keys_when_adding_a_node(self):
+        keys = ['cluster-{}'.format(i) for i in range(1000)]
+        ring = HashRing(range(4))
+        bigger_ring = HashRing(range(5))
+        moved = [key for key in keys if ring.get(key) != bigger_ring.get(key)]
+        # about 1/5 of the keys should move, all to the new node
+        self.assertLess(len(moved), 300)
+        self.assertEqual(set(bigger_ring.get(key) for key in moved), set([4]))
+
+    def test_hash_ring_raises_without_nodes(self):
+        with self.assertRaises(ElasticMetricsError):
+            HashRing([])
+
+
+class TestAssignClusters(BaseTestCase):
+    def test_assign_clusters_assigns_each_cluster_to_one_worker(self):
+        clusters = [{'name': 'cluster-{}'.format(i), 'host': 'localhost'} for i in range(20)]
+        assignments = assign_clusters(clusters, 3)
+        self.assertEqual(sorted(assignments.keys()), [0, 1, 2])
+        assigned = sorted(cluster['name'] for worker_clusters in assignments.values() for cluster in worker_clusters)
+        self.assertEqual(assigned, sorted(cluster['name'] for cluster in clusters))
+
+
+class TestLoadFleetConfig(BaseTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def _write_config(self, config):
+        filename = os.path.join(self.tmp_dir, 'fleet.json')
+        with open(filename, 'wt') as fh:
+            json.dump(config, fh)
+        return filename
+
+    def test_load_fleet_config_returns_clusters_with_passwords_from_env(self):
+        self.set_up_patch('elasticmetrics.fleet.os.environ', {'PROD_PASSWORD': 'secret'})
+        filename = self._write_config({'clusters': [
+            {'name': 'prod', 'host': 'es.example.org', 'password_env': 'PROD_PASSWORD'},
+        ]})
+        clusters = load_fleet_config(filename)
+        self.assertEqual(clusters[0]['name'], 'prod')
+        self.assertEqual(clusters[0]['password'], 'secret')
+
+    def test_load_fleet_config_raises_on_missing_host(self):
+        filename = self._write_config({'clusters': [{'name': 'prod'}]})
+        with self.assertRaises(ElasticMetricsError):
+            load_fleet_config(filename)
+
+    def test_load_fleet_config_raises_on_duplicate_names(self):
+        filename = self._write_config({'clusters': [
+            {'name': 'prod', 'host': 'es1.example.org'},
+            {'name': 'prod', 'host': 'es2.example.org'},
+        ]})
+        with self.assertRaises(ElasticMetricsError):
+            load_fleet_config(filename)
+
+    def test_load_fleet_config_raises_on_invalid_target(self):
+        filename = self._write_config({'clusters': [{'name': 'prod', 'host': 'es', 'targets': ['invalid']}]})
+        with self.assertRaises(ElasticMetricsError):
+            load_fleet_config(filename)
+
+    def test_load_fleet_config_raises_on_invalid_file(self):
+        with self.assertRaises(ElasticMetricsError):
+            load_fleet_config(os.path.join(self.tmp_dir, 'missing.json'))
+
+
+class TestRunWorker(BaseTestCase):
+    def setUp(self):
+        self.mock_collector_class = self.set_up_patch('elasticmetrics.fleet.ElasticSearchCollector')
+        self.set_up_patch('elasticmetrics.fleet.time.sleep')
+
+    def test_run_worker_reuses_collectors_and_reports_metrics_prefixed_by_cluster_name(self):
+        collector = self.mock_collector_class.return_value
+        collector.raw_stats.side_effect = lambda target: {
+            'cluster_health': b'{"status": "green"}',
+            'node_stats': NODE_STATS_BODY,
+        }[target]
+        reporter = MockReporter()
+        run_worker([{'name': 'prod', 'host': 'es.example.org'}], 10, lambda: reporter, cycles=2)
+
+        self.assertEqual(self.mock_collector_class.call_count, 1)
+        self.assertEqual(len(reporter.reported), 2)
+        self.assertEqual(reporter.reported[0]['prod.cluster.status'], 2)
+        self.assertEqual(reporter.reported[0]['prod.jvm.threads.count'], 89)
+        self.assertTrue(reporter.closed)
+
+    def test_run_worker_continues_with_other_clusters_on_errors(self):
+        failing, working = mock.Mock(), mock.Mock()
+        self.mock_collector_class.side_effect = [failing, working]
+        failing.raw_stats.side_effect = ElasticMetricsRequestError('failed')
+        working.raw_stats.return_value = b'{"status": "red"}'
+        reporter = MockReporter()
+        run_worker(
+            [{'name': 'a', 'host': 'a', 'targets': ['cluster_health']},
+             {'name': 'b', 'host': 'b', 'targets': ['cluster_health']}],
+            10, lambda: reporter, cycles=1
+        )
+        self.assertEqual(reporter.reported, [{'b.cluster.status': 6}])
+
+    def test_run_worker_continues_with_other_clusters_on_unexpected_responses(self):
+        not_json, unexpected, working = mock.Mock(), mock.Mock(), mock.Mock()
+        self.mock_collector_class.side_effect = [not_json, unexpected, working]
+        not_json.raw_stats.return_value = b'<html>Bad Gateway</html>'
+        unexpected.raw_stats.return_value = b'{"error": "unexpected"}'
+        working.raw_stats.return_value = b'{"status": "green"}'
+        reporter = MockReporter()
+        run_worker(
+            [{'name': 'a', 'host': 'a', 'targets': ['cluster_health']},
+             {'name': 'b', 'host': 'b', 'targets': ['node_stats']},
+             {'name': 'c', 'host': 'c', 'targets': ['cluster_health']}],
+            10, lambda: reporter, cycles=2
+        )
+        self.assertEqual(reporter.reported, [{'c.cluster.status': 2}, {'c.cluster.status': 2}])
+
+
+class TestFleetSupervisor(BaseTestCase):
+    def test_fleet_supervisor_restarts_dead_workers(self):
+        clusters = [{'name': 'cluster-{}'.format(i), 'host': '127.0.0.1', 'port': 1} for i in range(10)]
+        supervisor = FleetSupervisor(clusters, 2, 60, MockReporter, restart_delay=0)
+        self.addCleanup(supervisor.stop)
+        supervisor.start()
+        pids = supervisor.pids
+        self.assertEqual(len(pids), 2)
+
+        dead_process = supervisor._processes[0]
+        dead_process.terminate()
+        dead_process.join()
+        self.assertEqual(supervisor.check(), 1)
+        self.assertEqual(supervisor.restarts, 1)
+        self.assertNotEqual(supervisor.pids[0], pids[0])
+        self.assertEqual(supervisor.pids[1], pids[1])
+
+    def test_fleet_supervisor_raises_on_invalid_number_of_workers(self):
+        with self.assertRaises(ElasticMetricsError):
+            FleetSupervisor([], 0, 60, MockReporter)
@@ -2,7 +2,10 @@ import os
 import json
 from collections import OrderedDict
 from mock import call
-from elasticmetrics.formatters import flatten_metrics, sort_flatten_metrics_iter
+from elasticmetrics.formatters import flatten_metrics, sort_flatten_metrics_iter, prometheus_text
+from elasticmetrics.formatters import InfluxLineEncoder, influx_line_protocol, CachedFlattener, PrometheusTextRenderer
+from elasticmetrics.metrics import node_labels
+from elasticmetrics.exceptions import ElasticMetricsError
 from . import BaseTestCase, FIXTURES_PATH
 
 
@@ -107,3 +110,159 @@ class TestSortFlattenMetricsIter(BaseTestCase):
         result = sort_flatten_metrics_iter((metrics1, metrics2))
         self.assertIsInstance(result, OrderedDict)
         self.assertEqual(result, expected)
+
+
+class TestPrometheusText(BaseTestCase):
+    def test_prometheus_text_formats_metrics_with_valid_names(self):
+        metrics = OrderedDict()
+        metrics['cluster.status'] = 2
+        metrics['jvm.mem.heap-used'] = 1.5
+        text = prometheus_text(metrics)
+        self.assertEqual(text, 'elasticsearch_cluster_status 2\nelasticsearch_jvm_mem_heap_used 1.5\n')
+
+    def test_prometheus_text_adds_escaped_labels(self):
+        text = prometheus_text({'status': 2}, namespace='es', labels={'node': 'es"01', 'cluster': 'main'})
+        self.assertEqual(text, 'es_status{cluster="main",node="es\\"01"} 2\n')
+
+    def test_prometheus_text_sanitizes_label_names_of_node_attributes(self):
+        labels = node_labels({'name': 'es01', 'attributes': {'ml.machine_memory': '1000', 'xpack.installed': 'true'}})
+        labels['1zone'] = 'a'
+        text = prometheus_text({'jvm.x': 1}, labels=labels)
+        self.assertEqual(
+            text,
+            'elasticsearch_jvm_x{_1zone="a",attr_ml_machine_memory="1000",attr_xpack_installed="true",'
+            'node_name="es01"} 1\n'
+        )
+        renderer = PrometheusTextRenderer(labels=labels)
+        self.assertEqual(renderer.render({'jvm.x': 1}), text)
+
+    def test_prometheus_text_skips_non_numeric_values(self):
+        text = prometheus_text({'status': 'green', 'timed_out': False}, namespace='')
+        self.assertEqual(text, 'timed_out 0\n')
+
+    def test_prometheus_text_renderer_renders_like_prometheus_text(self):
+        metrics = OrderedDict([('cluster.status', 2), ('timed_out', False), ('name', 'es01'), ('heap', 1.5)])
+        renderer = PrometheusTextRenderer(labels={'node': 'es01'})
+        self.assertEqual(renderer.render(metrics), prometheus_text(metrics, labels={'node': 'es01'}))
+
+    def test_prometheus_text_renderer_reuses_lines_of_unchanged_values(self):
+        renderer = PrometheusTextRenderer(namespace='es')
+        renderer.render(OrderedDict([('a', 1), ('b', 2)]))
+        line = renderer._lines['a'][1]
+        text = renderer.render(OrderedDict([('a', 1), ('b', 3)]))
+        self.assertEqual(text, 'es_a 1\nes_b 3\n')
+        self.assertIs(renderer._lines['a'][1], line)
+        self.assertEqual((renderer.reused, renderer.formatted), (1, 3))
+
+    def test_prometheus_text_renderer_formats_equal_values_of_other_types(self):
+        renderer = PrometheusTextRenderer(namespace='es')
+        renderer.render({'a': 1})
+        self.assertEqual(renderer.render({'a': 1.0}), 'es_a 1.0\n')
+        self.assertEqual(renderer.render({'a': True}), 'es_a 1\n')
+
+    def test_prometheus_text_renderer_drops_missing_paths_and_resets_on_label_changes(self):
+        renderer = PrometheusTextRenderer(namespace='es', strip_prefix='es01')
+        renderer.render({'es01.a': 1, 'es01.b': 2})
+        self.assertEqual(renderer.render({'es01.a': 1}), 'es_a 1\n')
+        self.assertEqual(list(renderer._lines), ['es01.a'])
+        renderer.labels = {'node': 'es01'}
+        self.assertEqual(renderer.render({'es01.a': 1}), 'es_a{node="es01"} 1\n')
+        self.assertEqual(renderer.reused, 1)
+
+
+class TestInfluxLineProtocol(BaseTestCase):
+    def test_influx_line_protocol_maps_sections_to_measurements_and_keys_to_fields(self):
+        metrics = OrderedDict()
+        metrics['jvm'] = OrderedDict()
+        metrics['jvm']['mem'] = OrderedDict([('heap_used_in_bytes', 100), ('heap_used_percent', 20)])
+        metrics['indices'] = {'search': {'query_current': 3}}
+        lines = influx_line_protocol(metrics, tags={'node': 'es01', 'cluster': 'main'}, timestamp=15, precision='s')
+        self.assertEqual(
+            lines,
+            b'jvm.mem,cluster=main,node=es01 heap_used_in_bytes=100i,heap_used_percent=20i 15\n'
+            b'indices.search,cluster=main,node=es01 query_current=3i 15\n'
+        )
+
+    def test_influx_line_protocol_uses_prefix_or_root_measurement_for_top_level_fields(self):
+        self.assertEqual(
+            influx_line_protocol({'status': 2}, timestamp=1, prefix='cluster', precision='ms'),
+            b'cluster status=2i 1000\n'
+        )
+        self.assertEqual(
+            influx_line_protocol({'status': 2}, timestamp=1),
+            b'elasticsearch status=2i 1000000000\n'
+        )
+
+    def test_influx_line_protocol_encodes_value_types_and_escapes_names(self):
+        metrics = OrderedDict([('ratio', 0.5), ('up', True), ('name', 'a "b"'), ('a key,x', 1)])
+        lines = influx_line_protocol({'my section': metrics}, tags={'node': 'es 01', 'empty': ''}, timestamp=1)
+        self.assertEqual(
+            lines,
+            b'my\\ section,node=es\\ 01 ratio=0.5,up=true,name="a \\"b\\"",a\\ key\\,x=1i 1000000000\n'
+        )
+
+    def test_influx_line_protocol_skips_non_finite_values(self):
+        metrics = OrderedDict([('nan', float('nan')), ('inf', float('inf')), ('ninf', float('-inf')), ('ok', 1.5)])
+        self.assertEqual(influx_line_protocol({'jvm': metrics}, timestamp=1, precision='s'), b'jvm ok=1.5 1\n')
+        self.assertEqual(influx_line_protocol({'jvm': {'nan': float('nan')}}, timestamp=1), b'')
+
+    def test_influx_line_encoder_reuses_the_buffer(self):
+        encoder = InfluxLineEncoder(precision='s')
+        first = encoder.encode({'jvm': {'threads': 1}}, timestamp=1)
+        second = encoder.encode({'jvm': {'threads': 2}}, timestamp=2)
+        self.assertIs(first, second)
+        self.assertEqual(bytes(second), b'jvm threads=2i 2\n')
+
+    def test_influx_line_encoder_encode_into_appends_to_buffer(self):
+        encoder = InfluxLineEncoder(precision='s')
+        buffer_ = bytearray(b'existing\n')
+        encoder.encode_into(buffer_, {'status': 2}, timestamp=1, prefix='cluster')
+        self.assertEqual(bytes(buffer_), b'existing\ncluster status=2i 1\n')
+
+    def test_influx_line_encoder_updates_measurements_when_tags_change(self):
+        encoder = InfluxLineEncoder({'node': 'es01'}, precision='s')
+        encoder.encode({'jvm': {'threads': 1}}, timestamp=1)
+        encoder.tags = {'node': 'es02'}
+        self.assertEqual(bytes(encoder.encode({'jvm': {'threads': 1}}, timestamp=1)), b'jvm,node=es02 threads=1i 1\n')
+
+    def test_influx_line_encoder_raises_on_invalid_precision(self):
+        with self.assertRaises(ElasticMetricsError):
+            InfluxLineEncoder(precision='m')
+
+
+class TestCachedFlattener(BaseTestCase):
+    def test_cached_flattener_returns_same_results_as_flatten_metrics(self):
+        flattener = CachedFlattener(path_separator='->', prefix='mynode')
+        expected = flatten_metrics(MOCK_NODE_METRICS, path_separator='->', prefix='mynode')
+        self.assertEqual(flattener.flatten(MOCK_NODE_METRICS), expected)
+        self.assertEqual(flattener.flatten(MOCK_NODE_METRICS), expected)
+        self.assertEqual(flattener.rebuilds, 1)
+
+    def test_cached_flattener_returns_sorted_ordered_dict_when_sorting(self):
+        flattener = CachedFlattener(prefix='mynode', sort=True)
+        expected = sort_flatten_metrics_iter([MOCK_NODE_METRICS], prefix='mynode')
+        for _ in range(2):
+            result = flattener.flatten(MOCK_NODE_METRICS)
+            self.assertIsInstance(result, OrderedDict)
+            self.assertEqual(list(result.items()), list(expected.items()))
+
+    def test_cached_flattener_reuses_path_strings(self):
+        flattener = CachedFlattener()
+        first = flattener.flatten({'jvm': {'threads': 1}})
+        second = flattener.flatten({'jvm': {'threads': 2}})
+        self.assertEqual(second, {'jvm.threads': 2})
+        self.assertIs(list(first.keys())[0], list(second.keys())[0])
+
+    def test_cached_flattener_learns_shape_again_when_keys_change(self):
+        flattener = CachedFlattener()
+        flattener.flatten({'jvm': {'threads': 1}, 'http': {'current_open': 1}})
+        self.assertEqual(flattener.flatten({'jvm': {'threads': 1, 'peak': 2}}), {'jvm.threads': 1, 'jvm.peak': 2})
+        self.assertEqual(flattener.flatten({'jvm': {'count': 3}}), {'jvm.count': 3})
+        self.assertEqual(flattener.rebuilds, 3)
+
+    def test_cached_flattener_learns_shape_again_when_values_become_containers(self):
+        flattener = CachedFlattener()
+        flattener.flatten({'jvm': {'threads': 1}})
+        self.assertEqual(flattener.flatten({'jvm': {'threads': {'count': 1}}}), {'jvm.threads.count': 1})
+        self.assertEqual(flattener.flatten({'jvm': 1}), {'jvm': 1})
+        self.assertEqual(flattener.rebuilds, 3)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import ssl
 from elasticmetrics.http import HttpClient
+from elasticmetrics.pystdlib.http_client import HTTPConnection, HTTPSConnection
 from elasticmetrics.exceptions import ElasticMetricsError
 from . import BaseTestCase
 
@@ -106,3 +107,23 @@ class TestHttpClient(BaseTestCase):
                       )
         self.assertFalse(http_client.ssl_context.check_hostname)
         self.assertEqual(http_client.ssl_context.verify_mode, ssl.CERT_NONE)
+
+    def test_http_client_connection_uses_ssl_context_for_https(self):
+        http_client = HttpClient('localhost', port=9201, scheme='https')
+        connection = http_client._connection(timeout=3)
+        self.assertIsInstance(connection, HTTPSConnection)
+        self.assertEqual((connection.host, connection.port, connection.timeout), ('localhost', 9201, 3))
+        self.assertIsInstance(HttpClient('localhost')._connection(), HTTPConnection)
+
+    def test_http_client_measures_latency_of_requests(self):
+        mock_urlopen = self.set_up_patch('elasticmetrics.http.urlopen')
+        mock_urlopen.return_value = self._mock_urlopen_response(b'{}')
+        mock_time = self.set_up_patch('elasticmetrics.http.time.time')
+        mock_time.side_effect = [100.0, 100.5, 200.0, 200.2]
+        http_client = HttpClient('localhost')
+        self.assertIsNone(http_client.latency)
+        http_client._get_json('_cluster/health')
+        http_client._get_json('_cluster/health')
+        self.assertAlmostEqual(http_client.latency, 0.2)
+        self.assertAlmostEqual(http_client.reset_max_latency(), 0.5)
+        self.assertIsNone(http_client.reset_max_latency())
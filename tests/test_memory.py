@@ -0,0 +1,184 @@
+"""
+Memory budgets of the stages of a collection cycle: peak traced memory and
+allocated blocks (still alive after the stage, mostly the result) on generated
+fixtures of growing size. Budgets are in fixtures/memory_budgets.json, print
+budgets from the current measurements (with HEADROOM) to update them:
+
+    $ python -m tests.test_memory
+
+The budgets were generated on CPython 3.11. Sizes and counts of allocations
+differ between Python versions, regenerate the budgets when they no longer fit.
+"""
+import os
+import sys
+import json
+from copy import deepcopy
+from unittest import skipIf
+from elasticmetrics.collectors import ElasticSearchCollector
+from elasticmetrics.metrics import node_performance_metrics
+from elasticmetrics.formatters import flatten_metrics, sort_flatten_metrics_iter
+from elasticmetrics.profiling import tracemalloc
+from . import BaseTestCase, FIXTURES_PATH
+
+
+FIXTURE_NODESTATS = os.path.join(FIXTURES_PATH, 'node_stats.json')
+FIXTURE_NODEMETRICS = os.path.join(FIXTURES_PATH, 'node_metrics.json')
+FIXTURE_MEMORY_BUDGETS = os.path.join(FIXTURES_PATH, 'memory_budgets.json')
+
+SIZES = (10, 100, 500)
+HEADROOM = 1.5
+# frames of allocation tracebacks, deep enough to reach measure from the allocations of stages
+TRACEBACK_FRAMES = 16
+
+with open(FIXTURE_NODESTATS, 'rt') as fh:
+    MOCK_NODE_STATS = json.load(fh)
+
+with open(FIXTURE_NODEMETRICS, 'rt') as fh:
+    MOCK_NODE_METRICS = json.load(fh)
+
+
+class BodyCollector(ElasticSearchCollector):
+    """Respond to requests with the body, to measure decoding only"""
+
+    def __init__(self, body):
+        super(BodyCollector, self).__init__('localhost')
+        self.body = body
+
+    def _get(self, path):
+        return self.body
+
+
+def cluster_node_stats(size):
+    """Return node stats of a cluster of size nodes"""
+    node_id, node_data = list(MOCK_NODE_STATS['nodes'].items())[0]
+    nodes = dict(('{}{:05d}'.format(node_id, i), dict(deepcopy(node_data), name='es{:05d}'.format(i)))
+                 for i in range(size))
+    return {'cluster_name': 'es', 'nodes': nodes}
+
+
+def node_metrics_with_indices(size):
+    """Return node metrics with size extra per index sections"""
+    metrics = deepcopy(MOCK_NODE_METRICS)
+    metrics['per_index'] = dict(('index-{:05d}'.format(i), deepcopy(MOCK_NODE_METRICS['indices']))
+                                for i in range(size))
+    return metrics
+
+
+def _decode_node_stats(size):
+    collector = BodyCollector(json.dumps(cluster_node_stats(size)).encode('utf-8'))
+    return lambda: collector._get_json('_nodes/_all/stats')
+
+
+def _node_performance_metrics(size):
+    # only the stats of a node are selected, so memory should not grow with the cluster
+    node_stats = cluster_node_stats(size)
+    return lambda: node_performance_metrics(node_stats)
+
+
+def _flatten_metrics(size):
+    metrics = node_metrics_with_indices(size)
+    return lambda: flatten_metrics(metrics, prefix='es01')
+
+
+def _sort_flatten_metrics_iter(size):
+    metrics = node_metrics_with_indices(size)
+    return lambda: sort_flatten_metrics_iter([metrics], prefix='es01')
+
+
+# stages mapped to functions returning the stage on a fixture of the size
+STAGES = {
+    '_get_json': _decode_node_stats,
+    'node_performance_metrics': _node_performance_metrics,
+    'flatten_metrics': _flatten_metrics,
+    'sort_flatten_metrics_iter': _sort_flatten_metrics_iter,
+}
+
+
+def measure(stage):
+    """Run the stage while tracing memory allocations. Allocated blocks are the
+    difference of snapshots before and after the stage, filtered to allocations of
+    the stage, so allocations of other threads (like daemon threads of other tests)
+    are not counted. The peak is of all the traced memory while the stage runs.
+
+    :param callable stage: the stage, with its input already created
+    :return dict: peak traced bytes (peak_bytes), and number of allocated blocks
+                  still alive after the stage (blocks)
+    """
+    stage()  # warm up caches (like interned strings and compiled regular expressions)
+    tracemalloc.start(TRACEBACK_FRAMES)
+    try:
+        before = tracemalloc.take_snapshot()
+        traced = tracemalloc.get_traced_memory()[0]
+        # allocations of the stage have the line calling it in their tracebacks
+        stage_lineno = sys._getframe().f_lineno + 1
+        result = stage()
+        peak = tracemalloc.get_traced_memory()[1] - traced
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    filters = [tracemalloc.Filter(True, __file__, lineno=stage_lineno, all_frames=True)]
+    diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'filename')
+    return {'peak_bytes': peak, 'blocks': sum(stat.count_diff for stat in diff)}
+
+
+def measure_budgets(headroom=HEADROOM):
+    """Return budgets of the stages on fixtures of each size, from the current
+    measurements multiplied by the headroom
+    """
+    budgets = {}
+    for name, stage in STAGES.items():
+        budgets[name] = {}
+        for size in SIZES:
+            measured = measure(stage(size))
+            budgets[name][str(size)] = dict((key, int(value * headroom)) for key, value in measured.items())
+    return budgets
+
+
+@skipIf(tracemalloc is None, 'memory budgets require tracemalloc (Python 3.4+)')
+class TestMemoryBudgets(BaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(FIXTURE_MEMORY_BUDGETS, 'rt') as fh:
+            cls.budgets = json.load(fh)
+
+    def _assert_within_budget(self, name):
+        if tracemalloc.is_tracing():
+            # measuring would stop tracing started by someone else (like python -X tracemalloc)
+            self.skipTest('memory budgets are not measured while memory allocations are already traced')
+        budgets = self.budgets[name]
+        self.assertEqual(sorted(budgets), sorted(str(size) for size in SIZES))
+        for size in SIZES:
+            measured = measure(STAGES[name](size))
+            for key, budget in budgets[str(size)].items():
+                self.assertLessEqual(
+                    measured[key], budget,
+                    '{} of {} on size {} fixture is {}, over the budget of {}'.format(
+                        key, name, size, measured[key], budget)
+                )
+
+    def test_memory_budgets_cover_all_stages(self):
+        self.assertEqual(sorted(self.budgets), sorted(STAGES))
+        for budgets in self.budgets.values():
+            for budget in budgets.values():
+                self.assertEqual(sorted(budget), ['blocks', 'peak_bytes'])
+
+    def test_get_json_is_within_memory_budget(self):
+        self._assert_within_budget('_get_json')
+
+    def test_node_performance_metrics_is_within_memory_budget(self):
+        self._assert_within_budget('node_performance_metrics')
+
+    def test_flatten_metrics_is_within_memory_budget(self):
+        self._assert_within_budget('flatten_metrics')
+
+    def test_sort_flatten_metrics_iter_is_within_memory_budget(self):
+        self._assert_within_budget('sort_flatten_metrics_iter')
+
+
+if __name__ == '__main__':
+    if tracemalloc is None:
+        sys.exit('memory budgets require tracemalloc (Python 3.4+)')
+    if tracemalloc.is_tracing():
+        sys.exit('memory budgets can not be measured while memory allocations are already traced')
+    print(json.dumps(measure_budgets(), indent=4, sort_keys=True))
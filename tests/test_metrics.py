@@ -1,14 +1,21 @@
 import os
 import json
-from elasticmetrics.metrics import node_performance_metrics, cluster_health_metrics
+from elasticmetrics.metrics import (node_performance_metrics, nodes_performance_metrics, cluster_health_metrics,
+                                    node_labels, hotspot_metrics, cluster_pending_tasks_metrics,
+                                    cluster_stats_metrics, cat_health_metrics, cat_thread_pool_metrics)
+from elasticmetrics.exceptions import ElasticMetricsRequestError
 from . import BaseTestCase, FIXTURES_PATH
 
 
 FIXTURE_NODESTATS = os.path.join(FIXTURES_PATH, 'node_stats.json')
+FIXTURE_CLUSTERSTATS = os.path.join(FIXTURES_PATH, 'cluster_stats.json')
 
 with open(FIXTURE_NODESTATS, 'rt') as fh:
     MOCK_NODE_STATS = json.load(fh)
 
+with open(FIXTURE_CLUSTERSTATS, 'rt') as fh:
+    MOCK_CLUSTER_STATS = json.load(fh)
+
 
 MOCK_CLUSTER_HEALTH = {
     "active_primary_shards": 3962,
@@ -28,6 +35,14 @@ MOCK_CLUSTER_HEALTH = {
     "unassigned_shards": 1
 }
 
+MOCK_NODE_INFO = {
+    "name": "esserver",
+    "host": "10.0.0.1",
+    "version": "7.10.2",
+    "roles": ["data", "ingest", "data_hot"],
+    "attributes": {"zone": "eu-1a", "box_type": "hot"}
+}
+
 
 class TestClusterHealthMetrics(BaseTestCase):
     def test_cluster_health_metrics_returns_integer_metrics(self):
@@ -192,6 +207,21 @@ class TestNodePerformanceMetrics(BaseTestCase):
         self.assertEqual(sub_metrics['query_current'], 0)
         self.assertEqual(sub_metrics['scroll_current'], 0)
         self.assertEqual(sub_metrics['suggest_current'], 0)
+        self.assertEqual(sub_metrics['query_total'], 0)
+        self.assertEqual(sub_metrics['query_time_in_millis'], 0)
+        self.assertEqual(sub_metrics['fetch_total'], 0)
+        self.assertEqual(sub_metrics['fetch_time_in_millis'], 0)
+        self.assertNotIn('suggest_total', sub_metrics)
+
+    def test_node_performance_metrics_returns_indices_operations_metrics(self):
+        metrics = node_performance_metrics(MOCK_NODE_STATS)['indices']
+        self.assertEqual(metrics['indexing'], {
+            'index_current': 0, 'index_failed': 0, 'index_total': 0, 'index_time_in_millis': 0,
+            'delete_total': 0, 'delete_time_in_millis': 0, 'throttle_time_in_millis': 0})
+        self.assertEqual(metrics['get'], {'current': 0, 'total': 0, 'time_in_millis': 0})
+        self.assertEqual(metrics['refresh'], {'total': 0, 'total_time_in_millis': 0})
+        self.assertEqual(metrics['flush'], {'total': 0, 'total_time_in_millis': 0})
+        self.assertEqual(metrics['merges'], {'current': 0, 'total': 0, 'total_time_in_millis': 0})
 
     def test_node_performance_metrics_returns_indices_segments_metrics(self):
         metrics = node_performance_metrics(MOCK_NODE_STATS)
@@ -225,3 +255,193 @@ class TestNodePerformanceMetrics(BaseTestCase):
         sub_metrics = metrics['indices']['warmer']
         self.assertEqual(sub_metrics['current'], 0)
         self.assertEqual(sub_metrics['total'], 0)
+
+    def test_node_performance_metrics_returns_available_sections_only(self):
+        node_stats = {'nodes': {'abcd12345node': {'process': {'open_file_descriptors': 10}}}}
+        metrics = node_performance_metrics(node_stats)
+        self.assertEqual(metrics, {'process': {'open_file_descriptors': 10}})
+
+    def test_node_performance_metrics_adds_node_roles_from_node_info(self):
+        metrics = node_performance_metrics(MOCK_NODE_STATS, {'abcd12345node': MOCK_NODE_INFO})
+        roles = metrics['node']['roles']
+        self.assertEqual(roles['data'], 1)
+        self.assertEqual(roles['data_hot'], 1)
+        self.assertEqual(roles['ingest'], 1)
+        self.assertEqual(roles['master'], 0)
+        self.assertEqual(roles['ml'], 0)
+
+    def test_node_performance_metrics_ignores_node_info_of_other_nodes(self):
+        metrics = node_performance_metrics(MOCK_NODE_STATS, {'othernode': MOCK_NODE_INFO})
+        self.assertNotIn('node', metrics)
+
+    def test_node_labels_returns_node_metadata_and_attributes(self):
+        self.assertEqual(
+            node_labels(MOCK_NODE_INFO),
+            {'node_name': 'esserver', 'host': '10.0.0.1', 'version': '7.10.2',
+             'attr_zone': 'eu-1a', 'attr_box_type': 'hot'}
+        )
+        self.assertEqual(node_labels({}), {})
+
+    def test_nodes_performance_metrics_returns_metrics_of_all_nodes_by_name(self):
+        node_stats = {'nodes': {
+            'node1': {'name': 'es01', 'process': {'open_file_descriptors': 10}},
+            'node2': {'process': {'open_file_descriptors': 20}},
+        }}
+        metrics = nodes_performance_metrics(node_stats)
+        self.assertEqual(metrics, {
+            'es01': {'process': {'open_file_descriptors': 10}},
+            'node2': {'process': {'open_file_descriptors': 20}},
+        })
+
+
+class TestHotspotMetrics(BaseTestCase):
+    def setUp(self):
+        self.nodes_metrics = {}
+        for i in range(10):
+            self.nodes_metrics['es{:02d}'.format(i)] = {
+                'jvm': {'mem': {'heap_used_percent': 50 + i}},
+                'fs': {'total': {'available_in_bytes': 1000 * (i + 1)}},
+                'thread_pool': {'search': {'rejected': i % 3}, 'write': {'rejected': i}},
+                'indices': {'search': {'query_current': 10}},
+            }
+
+    def test_hotspot_metrics_returns_top_k_nodes_of_each_metric(self):
+        metrics = hotspot_metrics(self.nodes_metrics, k=2)['hotspot']
+        self.assertEqual(metrics['heap_used_percent'], {'es09': 59, 'es08': 58})
+        self.assertEqual(metrics['fs_available_in_bytes'], {'es00': 1000, 'es01': 2000})
+        self.assertEqual(len(metrics['search_query_current']), 2)
+        self.assertNotIn('thread_pool_rejected', metrics)
+        self.assertNotIn('skew', metrics)
+
+    def test_hotspot_metrics_ranks_counters_by_increase_since_previous_call(self):
+        previous = {}
+        self.assertNotIn('thread_pool_rejected', hotspot_metrics(self.nodes_metrics, previous=previous)['hotspot'])
+        # es09 has the most rejections since start, es01 the most in the interval
+        self.nodes_metrics['es01']['thread_pool']['write']['rejected'] += 20
+        self.nodes_metrics['es09']['thread_pool']['write']['rejected'] += 1
+        # es02 restarted, its rejections since start are counted
+        self.nodes_metrics['es02']['thread_pool'] = {'write': {'rejected': 3}}
+        self.nodes_metrics['es10'] = {'thread_pool': {'write': {'rejected': 100}}}
+        metrics = hotspot_metrics(self.nodes_metrics, k=3, previous=previous)['hotspot']
+        self.assertEqual(metrics['thread_pool_rejected'], {'es01': 20, 'es02': 3, 'es09': 1})
+        self.assertEqual(previous['thread_pool_rejected']['es10'], 100)
+
+    def test_hotspot_metrics_adds_skew_of_each_metric(self):
+        metrics = hotspot_metrics(self.nodes_metrics, k=1, skew=True)['hotspot']
+        self.assertAlmostEqual(metrics['skew']['heap_used_percent'], 59 / 54.5)
+        # lowest available disk space to the median
+        self.assertAlmostEqual(metrics['skew']['fs_available_in_bytes'], 1000 / 5500.0)
+        self.assertEqual(metrics['skew']['search_query_current'], 1.0)
+
+    def test_hotspot_metrics_skips_missing_metrics_and_replaces_dots_in_node_names(self):
+        metrics = hotspot_metrics({'es01.example.org': {'jvm': {'mem': {'heap_used_percent': 70}}}, 'es02': {}})
+        self.assertEqual(metrics, {'hotspot': {'heap_used_percent': {'es01_example_org': 70}}})
+
+
+class TestClusterPendingTasksMetrics(BaseTestCase):
+    def test_cluster_pending_tasks_metrics_summarizes_tasks(self):
+        tasks = [
+            {'insert_order': i, 'priority': 'HIGH' if i % 4 else 'URGENT', 'executing': i == 0,
+             'time_in_queue_millis': i * 10}
+            for i in range(100)
+        ]
+        metrics = cluster_pending_tasks_metrics(iter(tasks))
+        self.assertEqual(metrics['count'], 100)
+        self.assertEqual(metrics['executing'], 1)
+        self.assertEqual(metrics['oldest_time_in_queue_millis'], 990)
+        self.assertEqual(metrics['priority']['urgent'], 25)
+        self.assertEqual(metrics['priority']['high'], 75)
+        self.assertEqual(metrics['priority']['languid'], 0)
+        self.assertAlmostEqual(metrics['time_in_queue_millis']['p50'], 490, delta=10)
+        self.assertAlmostEqual(metrics['time_in_queue_millis']['p99'], 980, delta=20)
+
+    def test_cluster_pending_tasks_metrics_counts_tasks_without_priority_as_unknown(self):
+        metrics = cluster_pending_tasks_metrics([{'time_in_queue_millis': 5}, {'priority': None}, {'priority': 'LOW'}])
+        self.assertEqual(metrics['count'], 3)
+        self.assertEqual(metrics['priority']['unknown'], 2)
+        self.assertEqual(metrics['priority']['low'], 1)
+        self.assertNotIn('', metrics['priority'])
+
+    def test_cluster_pending_tasks_metrics_accepts_api_response(self):
+        metrics = cluster_pending_tasks_metrics({'tasks': []})
+        self.assertEqual(metrics['count'], 0)
+        self.assertEqual(metrics['oldest_time_in_queue_millis'], 0)
+        self.assertEqual(metrics['time_in_queue_millis'], {'p50': 0, 'p90': 0, 'p99': 0})
+
+
+class TestClusterStatsMetrics(BaseTestCase):
+    def test_cluster_stats_metrics_returns_status_code(self):
+        metrics = cluster_stats_metrics(MOCK_CLUSTER_STATS)
+        self.assertEqual(metrics['status'], 2)
+
+    def test_cluster_stats_metrics_returns_indices_metrics(self):
+        metrics = cluster_stats_metrics(MOCK_CLUSTER_STATS)['indices']
+        self.assertEqual(metrics['count'], 12)
+        self.assertEqual(metrics['shards'], {'total': 48, 'primaries': 24, 'replication': 1.0})
+        self.assertEqual(metrics['docs'], {'count': 1052744, 'deleted': 2048})
+        self.assertEqual(metrics['store'], {'size_in_bytes': 2147483648})
+        self.assertEqual(metrics['fielddata'], {'memory_size_in_bytes': 104857, 'evictions': 3})
+        self.assertEqual(metrics['query_cache']['hit_count'], 4000)
+        self.assertEqual(metrics['query_cache']['miss_count'], 1000)
+        self.assertEqual(metrics['segments']['count'], 310)
+        self.assertEqual(metrics['segments']['memory_in_bytes'], 5242880)
+        self.assertNotIn('file_sizes', metrics['segments'])
+
+    def test_cluster_stats_metrics_returns_nodes_metrics(self):
+        metrics = cluster_stats_metrics(MOCK_CLUSTER_STATS)['nodes']
+        self.assertEqual(metrics['count']['total'], 3)
+        self.assertEqual(metrics['count']['data'], 3)
+        self.assertEqual(metrics['count']['coordinating_only'], 0)
+        self.assertEqual(metrics['os']['mem']['used_percent'], 80)
+        self.assertEqual(metrics['process'], {'cpu': {'percent': 7},
+                                              'open_file_descriptors': {'min': 310, 'max': 340, 'avg': 325}})
+        self.assertEqual(metrics['jvm'], {'max_uptime_in_millis': 864000000, 'threads': 180,
+                                          'mem': {'heap_used_in_bytes': 3221225472, 'heap_max_in_bytes': 12884901888}})
+        self.assertEqual(metrics['fs']['available_in_bytes'], 198642237440)
+        self.assertNotIn('versions', metrics)
+
+    def test_cluster_stats_metrics_returns_available_sections_only(self):
+        self.assertEqual(cluster_stats_metrics({'status': 'yellow'}), {'status': 4})
+        self.assertEqual(cluster_stats_metrics({}), {})
+
+
+class TestCatMetrics(BaseTestCase):
+    def test_cat_health_metrics_returns_cluster_health_metric_names(self):
+        metrics = cat_health_metrics('green 7927 3962 0 0 1 10 100.0%\n')
+        expected = cluster_health_metrics(MOCK_CLUSTER_HEALTH)
+        del expected['delayed_unassigned_shards']
+        del expected['number_of_in_flight_fetch']
+        self.assertEqual(metrics, expected)
+
+    def test_cat_health_metrics_parses_missing_task_wait_time_as_zero(self):
+        metrics = cat_health_metrics('yellow 10 5 1 2 0 - 66.7%')
+        self.assertEqual(metrics['status'], 4)
+        self.assertEqual(metrics['task_max_waiting_in_queue_millis'], 0)
+        self.assertEqual(metrics['active_shards_percent_as_number'], 66)
+        self.assertEqual(cat_health_metrics(''), {})
+
+    def test_cat_thread_pool_metrics_returns_thread_pools_of_the_node(self):
+        cat_thread_pool = (
+            'abcd12345node search 2 10 5 13 1000 13\n'
+            'abcd12345node write 0 0 0 8 200 8\n'
+            'otherNode0001 search 9 99 9 13 1000 13\n'
+        )
+        metrics = cat_thread_pool_metrics(cat_thread_pool, 'abcd12345node')
+        self.assertEqual(metrics, {'thread_pool': {
+            'search': {'active': 2, 'queue': 10, 'rejected': 5, 'largest': 13, 'completed': 1000, 'threads': 13},
+            'write': {'active': 0, 'queue': 0, 'rejected': 0, 'largest': 8, 'completed': 200, 'threads': 8},
+        }})
+        node_thread_pools = node_performance_metrics(MOCK_NODE_STATS)['thread_pool']
+        self.assertEqual(set(metrics['thread_pool']['search']), set(node_thread_pools['search']))
+
+    def test_cat_thread_pool_metrics_matches_full_node_ids(self):
+        cat_thread_pool = 'abcd search 2 10 5 13 1000 13\nabcd12345node search 0 1 0 13 1000 13\n'
+        metrics = cat_thread_pool_metrics(cat_thread_pool, 'abcd12345node')
+        self.assertEqual(metrics['thread_pool']['search']['queue'], 1)
+        self.assertEqual(cat_thread_pool_metrics(cat_thread_pool, 'abcd1'), {})
+
+    def test_cat_metrics_raise_on_rows_not_matching_columns(self):
+        with self.assertRaises(ElasticMetricsRequestError):
+            cat_health_metrics('green 10 5')
+        with self.assertRaises(ElasticMetricsRequestError):
+            cat_thread_pool_metrics('abcd search 2', 'abcd')
@@ -0,0 +1,155 @@
+import time
+import threading
+from elasticmetrics.pipeline import BoundedQueue, QueueClosed, Pipeline
+from elasticmetrics.exceptions import ElasticMetricsError
+from . import BaseTestCase
+
+
+class TestBoundedQueue(BaseTestCase):
+    def test_bounded_queue_returns_items_in_order(self):
+        queue = BoundedQueue(3)
+        for item in range(3):
+            self.assertTrue(queue.put(item))
+        self.assertEqual(queue.depth, 3)
+        self.assertEqual([queue.get() for _ in range(3)], [0, 1, 2])
+
+    def test_bounded_queue_drop_oldest_policy_drops_oldest_items(self):
+        queue = BoundedQueue(2, 'drop_oldest')
+        for item in range(4):
+            self.assertTrue(queue.put(item))
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual([queue.get(), queue.get()], [2, 3])
+
+    def test_bounded_queue_drop_newest_policy_drops_new_items(self):
+        queue = BoundedQueue(2, 'drop_newest')
+        results = [queue.put(item) for item in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual([queue.get(), queue.get()], [0, 1])
+
+    def test_bounded_queue_block_policy_waits_for_room(self):
+        queue = BoundedQueue(1, 'block')
+        queue.put(0)
+        putter = threading.Thread(target=queue.put, args=(1,))
+        putter.start()
+        putter.join(0.05)
+        self.assertTrue(putter.is_alive())
+        self.assertEqual(queue.get(), 0)
+        putter.join(5)
+        self.assertFalse(putter.is_alive())
+        self.assertEqual(queue.get(), 1)
+        self.assertEqual(queue.max_depth, 1)
+
+    def test_bounded_queue_close_releases_getters_after_queued_items(self):
+        queue = BoundedQueue(2)
+        queue.put(0)
+        queue.close()
+        self.assertFalse(queue.put(1))
+        self.assertEqual(queue.get(), 0)
+        with self.assertRaises(QueueClosed):
+            queue.get()
+
+    def test_bounded_queue_init_raises_on_invalid_arguments(self):
+        with self.assertRaises(ElasticMetricsError):
+            BoundedQueue(0)
+        with self.assertRaises(ElasticMetricsError):
+            BoundedQueue(1, 'invalid')
+
+
+class TestPipeline(BaseTestCase):
+    def test_pipeline_collects_transforms_and_emits_with_collection_timestamps(self):
+        collected = []
+        emitted = []
+        done = threading.Event()
+
+        def collect():
+            collected.append(len(collected))
+            return {'value': collected[-1]}
+
+        def emit(metrics, timestamp):
+            emitted.append((metrics, timestamp))
+            if len(emitted) >= 3:
+                done.set()
+
+        pipeline = Pipeline(collect, lambda snapshot: dict(snapshot), [emit], 0.01)
+        pipeline.start()
+        self.assertTrue(done.wait(5))
+        pipeline.stop(5)
+
+        values = [metrics['value'] for (metrics, _) in emitted]
+        self.assertEqual(values, sorted(values))
+        self.assertIn('elasticmetrics.pipeline.transform.queue_depth', emitted[0][0])
+        self.assertIn('elasticmetrics.pipeline.emit_0.dropped', emitted[0][0])
+        self.assertIsInstance(emitted[0][1], float)
+
+    def test_pipeline_slow_emitter_does_not_delay_collection(self):
+        release = threading.Event()
+        collected = []
+        enough_collected = threading.Event()
+
+        def collect():
+            collected.append(1)
+            if len(collected) >= 10:
+                enough_collected.set()
+            return {}
+
+        pipeline = Pipeline(collect, dict, [lambda metrics, timestamp: release.wait(5)], 0.001,
+                            queue_size=2, policy='drop_oldest', stats_prefix=None)
+        pipeline.start()
+        self.assertTrue(enough_collected.wait(5))
+        release.set()
+        pipeline.stop(5)
+        stats = pipeline.stats()
+        self.assertGreater(stats['pipeline.emit_0.dropped'] + stats['pipeline.transform.dropped'], 0)
+
+    def test_pipeline_emits_snapshots_in_order_of_collection_with_multiple_transform_workers(self):
+        emitted = []
+        done = threading.Event()
+        collected = []
+
+        def collect():
+            collected.append(len(collected))
+            return {'value': collected[-1]}
+
+        def transform(snapshot):
+            # earlier snapshots take longer, so later ones are transformed first
+            time.sleep(0.02 if snapshot['value'] % 3 == 0 else 0)
+            return dict(snapshot)
+
+        def emit(metrics, timestamp):
+            emitted.append(metrics['value'])
+            if len(emitted) >= 12:
+                done.set()
+
+        pipeline = Pipeline(collect, transform, [emit], 0.001, transform_workers=3, queue_size=100,
+                            stats_prefix=None)
+        pipeline.start()
+        self.assertTrue(done.wait(5))
+        pipeline.stop(5)
+        self.assertEqual(emitted, list(range(len(emitted))))
+
+    def test_pipeline_counts_errors_of_stages(self):
+        emitted = threading.Event()
+        calls = []
+
+        def collect():
+            calls.append(1)
+            if len(calls) == 1:
+                raise ValueError('collect failure')
+            return {}
+
+        def emit(metrics, timestamp):
+            emitted.set()
+            raise ValueError('emit failure')
+
+        pipeline = Pipeline(collect, dict, [emit], 0.001, stats_prefix=None)
+        pipeline.start()
+        self.assertTrue(emitted.wait(5))
+        pipeline.stop(5)
+        stats = pipeline.stats()
+        self.assertEqual(stats['pipeline.collect.errors'], 1)
+        self.assertGreaterEqual(stats['pipeline.emit.errors'], 1)
+
+    def test_pipeline_init_raises_without_emitters(self):
+        with self.assertRaises(ElasticMetricsError):
+            Pipeline(dict, dict, [], 1)
@@ -0,0 +1,85 @@
+import os
+import json
+from collections import OrderedDict
+from elasticmetrics.processing import Processor, ProcessPoolProcessor
+from elasticmetrics.formatters import sort_flatten_metrics_iter
+from elasticmetrics.metrics import node_performance_metrics
+from elasticmetrics.exceptions import ElasticMetricsError, ElasticMetricsRequestError
+from . import BaseTestCase, FIXTURES_PATH
+
+
+FIXTURE_NODESTATS = os.path.join(FIXTURES_PATH, 'node_stats.json')
+
+with open(FIXTURE_NODESTATS, 'rb') as fh:
+    NODE_STATS_BODY = fh.read()
+
+CLUSTER_HEALTH_BODY = b'{"cluster_name": "es", "status": "green", "active_shards": 10}'
+
+
+class TestProcessor(BaseTestCase):
+    def setUp(self):
+        self.processor = Processor()
+        self.addCleanup(self.processor.close)
+
+    def test_processor_process_returns_sorted_flattened_metrics(self):
+        expected = sort_flatten_metrics_iter(
+            [node_performance_metrics(json.loads(NODE_STATS_BODY.decode('utf-8')))],
+            prefix='es01'
+        )
+        result = self.processor.process('node_stats', NODE_STATS_BODY, 'es01')
+        self.assertIsInstance(result, OrderedDict)
+        self.assertEqual(list(result.items()), list(expected.items()))
+
+    def test_processor_process_many_returns_results_in_order_of_jobs(self):
+        results = self.processor.process_many([
+            ('cluster_health', CLUSTER_HEALTH_BODY, 'cluster'),
+            ('node_stats', NODE_STATS_BODY, ''),
+        ])
+        self.assertEqual(results[0], {'cluster.active_shards': 10, 'cluster.status': 2})
+        self.assertEqual(results[1]['jvm.threads.count'], 89)
+
+    def test_processor_process_returns_new_results_when_shape_changes(self):
+        self.processor.process('cluster_health', CLUSTER_HEALTH_BODY, 'cluster')
+        result = self.processor.process('cluster_health', b'{"status": "red"}', 'cluster')
+        self.assertEqual(result, {'cluster.status': 6})
+
+    def test_processor_process_transforms_cluster_stats(self):
+        with open(os.path.join(FIXTURES_PATH, 'cluster_stats.json'), 'rb') as fh:
+            result = self.processor.process('cluster_stats', fh.read(), 'cluster')
+        self.assertEqual(result['cluster.nodes.count.data'], 3)
+        self.assertEqual(result['cluster.indices.docs.count'], 1052744)
+
+    def test_processor_process_raises_on_invalid_target(self):
+        with self.assertRaises(ElasticMetricsError):
+            self.processor.process('invalid', b'{}')
+
+    def test_processor_process_raises_request_error_on_invalid_responses(self):
+        for body in (b'{"status": "gre', b'\xff\xfe'):
+            with self.assertRaises(ElasticMetricsRequestError):
+                self.processor.process('cluster_health', body)
+
+
+class TestProcessPoolProcessor(BaseTestCase):
+    def setUp(self):
+        self.processor = ProcessPoolProcessor(2)
+        self.addCleanup(self.processor.close)
+
+    def test_process_pool_processor_returns_same_results_as_processor(self):
+        jobs = [('node_stats', NODE_STATS_BODY, 'es{:02d}'.format(i % 2)) for i in range(6)]
+        jobs.append(('cluster_health', CLUSTER_HEALTH_BODY, 'cluster'))
+        expected = Processor().process_many(jobs)
+        # second round is served with cached shapes
+        for _ in range(2):
+            results = self.processor.process_many(jobs)
+            self.assertEqual([list(result.items()) for result in results],
+                             [list(result.items()) for result in expected])
+
+    def test_process_pool_processor_requests_paths_for_unknown_shapes(self):
+        self.processor.process('node_stats', NODE_STATS_BODY)
+        self.processor._shapes.clear()
+        result = self.processor.process('node_stats', NODE_STATS_BODY)
+        self.assertEqual(result['jvm.threads.count'], 89)
+
+    def test_process_pool_processor_raises_request_error_on_invalid_responses(self):
+        with self.assertRaises(ElasticMetricsRequestError):
+            self.processor.process('cluster_health', b'<html>')
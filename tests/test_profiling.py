@@ -0,0 +1,84 @@
+import os
+import shutil
+import signal
+import tempfile
+from unittest import skipIf
+from elasticmetrics.profiling import CycleProfiler, tracemalloc
+from elasticmetrics.exceptions import ElasticMetricsError
+from . import BaseTestCase
+
+
+class TestCycleProfiler(BaseTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.profile_dir = os.path.join(self.tmp_dir, 'profiles')
+
+    def _run_cycles(self, profiler, count):
+        for _ in range(count):
+            with profiler.cycle():
+                sorted(str(i) for i in range(1000))
+
+    def _reports(self, suffix):
+        if not os.path.isdir(self.profile_dir):
+            return []
+        return sorted(filename for filename in os.listdir(self.profile_dir) if filename.endswith(suffix))
+
+    def test_cycle_profiler_writes_cpu_reports_every_n_cycles(self):
+        profiler = CycleProfiler(self.profile_dir, cpu=True, every=2)
+        self._run_cycles(profiler, 4)
+        reports = self._reports('.cpu.txt')
+        self.assertEqual(len(reports), 2)
+        self.assertEqual(len(self._reports('.cpu.prof')), 2)
+        with open(os.path.join(self.profile_dir, reports[0]), 'rt') as fh:
+            self.assertIn('function calls', fh.read())
+
+    def test_cycle_profiler_does_not_profile_unless_triggered(self):
+        profiler = CycleProfiler(self.profile_dir, cpu=True, every=0, trigger_cycles=2)
+        self._run_cycles(profiler, 3)
+        self.assertEqual(self._reports('.cpu.txt'), [])
+        profiler.trigger()
+        self.assertTrue(profiler.due)
+        self._run_cycles(profiler, 3)
+        self.assertEqual(len(self._reports('.cpu.txt')), 2)
+        self.assertFalse(profiler.due)
+
+    def test_cycle_profiler_keeps_most_recent_reports(self):
+        profiler = CycleProfiler(self.profile_dir, cpu=True, every=1, keep=2)
+        self._run_cycles(profiler, 5)
+        reports = self._reports('.cpu.txt')
+        self.assertEqual(len(reports), 2)
+        self.assertTrue(reports[-1].endswith('-00000004.cpu.txt'))
+
+    @skipIf(tracemalloc is None, 'tracemalloc is not available')
+    def test_cycle_profiler_writes_memory_reports(self):
+        profiler = CycleProfiler(self.profile_dir, cpu=False, mem=True, every=1)
+        self._run_cycles(profiler, 1)
+        reports = self._reports('.mem.txt')
+        self.assertEqual(len(reports), 1)
+        with open(os.path.join(self.profile_dir, reports[0]), 'rt') as fh:
+            self.assertIn('peak', fh.read())
+        self.assertFalse(tracemalloc.is_tracing())
+
+    @skipIf(tracemalloc is None, 'tracemalloc is not available')
+    def test_cycle_profiler_does_not_stop_tracing_it_did_not_start(self):
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        profiler = CycleProfiler(self.profile_dir, cpu=False, mem=True, every=1)
+        self._run_cycles(profiler, 1)
+        self.assertEqual(len(self._reports('.mem.txt')), 1)
+        self.assertTrue(tracemalloc.is_tracing())
+
+    @skipIf(not hasattr(signal, 'SIGUSR1'), 'SIGUSR1 is not available')
+    def test_cycle_profiler_is_triggered_by_signal(self):
+        previous_handler = signal.getsignal(signal.SIGUSR1)
+        self.addCleanup(signal.signal, signal.SIGUSR1, previous_handler)
+        profiler = CycleProfiler(self.profile_dir, cpu=True, every=0)
+        profiler.install_signal_handler(signal.SIGUSR1)
+        self.assertFalse(profiler.due)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.assertTrue(profiler.due)
+
+    def test_cycle_profiler_init_raises_if_nothing_is_profiled(self):
+        with self.assertRaises(ElasticMetricsError):
+            CycleProfiler(self.profile_dir, cpu=False, mem=False)
@@ -0,0 +1,131 @@
+import os
+import gzip
+import shutil
+import tempfile
+import mock
+from elasticmetrics.collectors import ElasticSearchCollector
+from elasticmetrics.recording import ResponseRecorder, ReplayCollector, iter_recorded_responses
+from elasticmetrics.exceptions import ElasticMetricsError, ReplayFinished
+from . import BaseTestCase
+
+
+class TestRecording(BaseTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.log_file = os.path.join(self.tmp_dir, 'responses.log.gz')
+        self.mock_urlopen = self.set_up_patch('elasticmetrics.http.urlopen')
+
+    def _record(self, responses):
+        recorder = ResponseRecorder(self.log_file)
+        for path, started, elapsed, body in responses:
+            recorder.record(path, 'http://localhost:9200/' + path, started, elapsed, body)
+        recorder.close()
+
+    def test_recorder_records_responses_of_collector(self):
+        self.mock_urlopen.return_value = self._mock_urlopen_response(b'{"status": "green"}')
+        collector = ElasticSearchCollector('localhost')
+        collector.recorder = ResponseRecorder(self.log_file)
+        self.assertEqual(collector.cluster_health(), {'status': 'green'})
+        self.assertEqual(collector.raw_stats('node_stats'), b'{"status": "green"}')
+        collector.recorder.close()
+
+        responses = list(iter_recorded_responses(self.log_file))
+        self.assertEqual([response.path for response in responses], ['_cluster/health', '_nodes/_local/stats'])
+        self.assertEqual(responses[0].url, 'http://localhost:9200/_cluster/health')
+        self.assertEqual(responses[0].body, b'{"status": "green"}')
+        self.assertGreaterEqual(responses[0].elapsed, 0)
+
+    def test_recorder_records_chunked_responses(self):
+        response = self._mock_urlopen_response()
+        response.read.side_effect = [b'{"tasks": [{"priority": "URGENT"}', b', {"priority": "HIGH"}]}', b'']
+        self.mock_urlopen.return_value = response
+        collector = ElasticSearchCollector('localhost')
+        collector.recorder = ResponseRecorder(self.log_file)
+        tasks = list(collector.iter_cluster_pending_tasks(chunk_size=32))
+        collector.recorder.close()
+        self.assertEqual(len(tasks), 2)
+
+        responses = list(iter_recorded_responses(self.log_file))
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(responses[0].body, b'{"tasks": [{"priority": "URGENT"}, {"priority": "HIGH"}]}')
+
+    def test_recorder_appends_to_existing_log(self):
+        self._record([('_cluster/health', 1.0, 0.1, b'{}')])
+        self._record([('_cluster/health', 2.0, 0.1, b'{"status": "red"}')])
+        responses = list(iter_recorded_responses(self.log_file))
+        self.assertEqual([response.time for response in responses], [1.0, 2.0])
+
+    def test_iter_recorded_responses_raises_on_truncated_log(self):
+        with gzip.open(self.log_file, 'wb') as log_file:
+            log_file.write(b'{"elapsed": 0, "path": "_cluster/health", "size": 100, "time": 1, "url": ""}\n{}')
+        with self.assertRaises(ElasticMetricsError):
+            list(iter_recorded_responses(self.log_file))
+
+    def test_iter_recorded_responses_reads_log_that_was_not_closed(self):
+        recorder = ResponseRecorder(self.log_file)
+        self.addCleanup(recorder.close)
+        for started in (1.0, 2.0):
+            recorder.record('_cluster/health', '', started, 0.1, b'{"status": "green"}')
+        # like a killed recorder, that never wrote the gzip trailer
+        with open(self.log_file, 'rb') as log_file:
+            unclosed_log = log_file.read()
+        unclosed_log_file = os.path.join(self.tmp_dir, 'unclosed.log.gz')
+        with open(unclosed_log_file, 'wb') as log_file:
+            log_file.write(unclosed_log)
+        responses = list(iter_recorded_responses(unclosed_log_file))
+        self.assertEqual([response.time for response in responses], [1.0, 2.0])
+
+        collector = ReplayCollector(unclosed_log_file)
+        self.assertEqual(collector.cluster_health(), {'status': 'green'})
+        self.assertEqual(collector.cluster_health(), {'status': 'green'})
+        with self.assertRaises(ReplayFinished):
+            collector.cluster_health()
+
+    def test_replay_collector_replays_responses_of_requested_paths(self):
+        self._record([
+            ('_cluster/health', 1.0, 0.1, b'{"status": "green"}'),
+            ('_nodes/_local/stats', 1.1, 0.1, b'{"nodes": {}}'),
+            ('_cluster/health', 2.0, 0.1, b'{"status": "yellow"}'),
+        ])
+        collector = ReplayCollector(self.log_file)
+        self.assertEqual(collector.cluster_health(), {'status': 'green'})
+        self.assertEqual(collector.cluster_health(), {'status': 'yellow'})
+        self.assertEqual(collector.replayed, 2)
+        self.assertEqual(collector.skipped, 1)
+        with self.assertRaises(ReplayFinished):
+            collector.cluster_health()
+        self.assertFalse(self.mock_urlopen.called)
+
+    def test_replay_collector_streams_chunked_responses(self):
+        self._record([('_cluster/pending_tasks', 1.0, 0.1, b'{"tasks": [{"priority": "HIGH"}]}')])
+        collector = ReplayCollector(self.log_file)
+        self.assertEqual(list(collector.iter_cluster_pending_tasks(chunk_size=4)), [{'priority': 'HIGH'}])
+
+    def test_replay_collector_paces_responses_by_speed(self):
+        self._record([
+            ('_cluster/health', 10.0, 0.5, b'{}'),
+            ('_cluster/health', 14.0, 0.5, b'{}'),
+        ])
+        mock_sleep = self.set_up_patch('elasticmetrics.recording.time.sleep')
+        mock_time = self.set_up_patch('elasticmetrics.recording.time.time')
+        mock_time.return_value = 100.0
+        collector = ReplayCollector(self.log_file, speed=2)
+        collector.cluster_health()
+        mock_sleep.assert_called_once_with(0.25)
+        mock_sleep.reset_mock()
+        mock_time.return_value = 101.0
+        collector.cluster_health()
+        mock_sleep.assert_called_once_with(1.25)
+
+    def test_replay_collector_with_speed_zero_does_not_sleep(self):
+        self._record([('_cluster/health', 10.0, 0.5, b'{}'), ('_cluster/health', 20.0, 0.5, b'{}')])
+        with mock.patch('elasticmetrics.recording.time.sleep') as mock_sleep:
+            collector = ReplayCollector(self.log_file, speed=0)
+            collector.cluster_health()
+            collector.cluster_health()
+        self.assertFalse(mock_sleep.called)
+
+    def test_replay_collector_raises_on_invalid_speed(self):
+        with self.assertRaises(ElasticMetricsError):
+            ReplayCollector(self.log_file, speed=-1)
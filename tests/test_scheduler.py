@@ -0,0 +1,136 @@
+from elasticmetrics.scheduler import Tier, TieredScheduler, AdaptiveScheduler, parse_tier, EXPENSIVE_SECTIONS
+from elasticmetrics.collectors import NODE_STATS_SECTIONS
+from elasticmetrics.exceptions import ElasticMetricsError
+from . import BaseTestCase
+
+
+class TestParseTier(BaseTestCase):
+    def test_parse_tier_returns_tier_with_sorted_sections(self):
+        self.assertEqual(parse_tier('60:node_stats:indices, fs'), Tier(60.0, 'node_stats', ('fs', 'indices')))
+        self.assertEqual(parse_tier('0.5:cluster_health'), Tier(0.5, 'cluster_health', ()))
+
+    def test_parse_tier_raises_on_invalid_specs(self):
+        for spec in ('cluster_health', '0:cluster_health', 'x:cluster_health', '1:invalid',
+                     '1:cluster_health:jvm', '1:node_stats:invalid', '1:node_stats:jvm:extra'):
+            with self.assertRaises(ElasticMetricsError):
+                parse_tier(spec)
+
+
+class TestTieredScheduler(BaseTestCase):
+    def test_tiered_scheduler_runs_tiers_at_their_intervals(self):
+        fast = Tier(1, 'cluster_health', ())
+        slow = Tier(10, 'node_stats', ('indices',))
+        scheduler = TieredScheduler([fast, slow], clock=lambda: 1000.0)
+        runs = {fast: 0, slow: 0}
+        for tick in range(0, 3000):
+            for tier in scheduler.due(1000.0 + tick / 100.0):
+                runs[tier] += 1
+        self.assertEqual(runs[fast], 30)
+        self.assertEqual(runs[slow], 3)
+
+    def test_tiered_scheduler_spreads_tiers_by_key(self):
+        tier = Tier(60, 'node_stats', ('indices',))
+        first_due = set(
+            TieredScheduler([tier], spread_key='node-{}'.format(i), clock=lambda: 1000.0).next_due()
+            for i in range(20)
+        )
+        self.assertGreater(len(first_due), 10)
+        for due in first_due:
+            self.assertTrue(1000 < due <= 1060)
+
+    def test_tiered_scheduler_skips_missed_runs(self):
+        tier = Tier(1, 'cluster_health', ())
+        scheduler = TieredScheduler([tier], clock=lambda: 1000.0)
+        self.assertEqual(scheduler.due(scheduler.next_due() + 5.5), [tier])
+        self.assertEqual(scheduler.due(scheduler.next_due() - 0.1), [])
+
+    def test_tiered_scheduler_wait_sleeps_until_due_and_returns_requests(self):
+        now = [1000.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        scheduler = TieredScheduler([Tier(5, 'node_stats', ('jvm',))], clock=lambda: now[0])
+        self.assertEqual(scheduler.wait(sleep), {'node_stats': ('jvm',)})
+        self.assertEqual(len(sleeps), 1)
+
+    def test_tiered_scheduler_requests_merges_sections_of_targets(self):
+        requests = TieredScheduler.requests([
+            Tier(1, 'cluster_health', ()),
+            Tier(10, 'node_stats', ('jvm', 'process')),
+            Tier(60, 'node_stats', ('fs', 'jvm')),
+        ])
+        self.assertEqual(requests, {'cluster_health': (), 'node_stats': ('fs', 'jvm', 'process')})
+
+    def test_tiered_scheduler_requests_all_sections_if_any_tier_has_all(self):
+        requests = TieredScheduler.requests([
+            Tier(10, 'node_stats', ('jvm',)),
+            Tier(60, 'node_stats', ()),
+            Tier(10, 'node_stats', ('fs',)),
+        ])
+        self.assertEqual(requests, {'node_stats': ()})
+
+    def test_tiered_scheduler_init_raises_without_tiers(self):
+        with self.assertRaises(ElasticMetricsError):
+            TieredScheduler([])
+
+
+class TestAdaptiveScheduler(BaseTestCase):
+    def _output(self, pending_tasks=0, queue=0, rejected=0):
+        return {
+            'cluster_health': {'number_of_pending_tasks': pending_tasks, 'task_max_waiting_in_queue_millis': 0},
+            'node_stats': {'thread_pool': {'search': {'queue': queue, 'rejected': rejected},
+                                           'write': {'queue': 0, 'rejected': 0}}},
+        }
+
+    def test_adaptive_scheduler_backs_off_on_stress_up_to_max_interval(self):
+        scheduler = AdaptiveScheduler(10, max_interval=40)
+        self.assertEqual(scheduler.interval, 10)
+        self.assertEqual(scheduler.observe(self._output(pending_tasks=100)), 1)
+        self.assertEqual(scheduler.stress, ('pending_tasks',))
+        self.assertEqual(scheduler.interval, 20)
+        scheduler.observe(self._output(), latency=5.0)
+        self.assertEqual(scheduler.stress, ('latency',))
+        scheduler.observe(failed=True)
+        self.assertEqual(scheduler.stress, ('failed',))
+        self.assertEqual((scheduler.level, scheduler.interval), (2, 40))
+
+    def test_adaptive_scheduler_recovers_gradually_after_calm_cycles(self):
+        scheduler = AdaptiveScheduler(10, recovery_cycles=2)
+        scheduler.observe(self._output(queue=5000))
+        scheduler.observe(self._output(queue=5000))
+        levels = [scheduler.observe(self._output()) for _ in range(5)]
+        self.assertEqual(levels, [2, 1, 1, 0, 0])
+
+    def test_adaptive_scheduler_detects_new_thread_pool_rejections(self):
+        scheduler = AdaptiveScheduler(10)
+        scheduler.observe(self._output(rejected=100))
+        self.assertEqual(scheduler.level, 0)
+        scheduler.observe(self._output(rejected=100))
+        self.assertEqual(scheduler.level, 0)
+        scheduler.observe(self._output(rejected=103))
+        self.assertEqual(scheduler.stress, ('thread_pool_rejected',))
+        # counts reset when nodes restart
+        scheduler.observe(self._output(rejected=0))
+        self.assertEqual(scheduler.stress, ())
+
+    def test_adaptive_scheduler_drops_expensive_targets_and_sections_when_backing_off(self):
+        scheduler = AdaptiveScheduler(10, thresholds={'pending_tasks': 1})
+        targets = set(['cluster_health', 'cluster_stats', 'node_stats', 'hotspots'])
+        self.assertIs(scheduler.targets(targets), targets)
+        scheduler.observe(self._output(pending_tasks=1))
+        adapted = scheduler.targets(targets)
+        self.assertEqual(sorted(adapted), ['cluster_health', 'node_stats'])
+        self.assertEqual(adapted['cluster_health'], ())
+        self.assertEqual(adapted['node_stats'],
+                         tuple(section for section in NODE_STATS_SECTIONS if section not in EXPENSIVE_SECTIONS))
+        self.assertEqual(scheduler.targets({'node_stats': ('jvm', 'indices')}), {'node_stats': ('jvm',)})
+        self.assertEqual(scheduler.targets({'node_stats': ('indices',)}), {})
+
+    def test_adaptive_scheduler_raises_on_invalid_params(self):
+        with self.assertRaises(ElasticMetricsError):
+            AdaptiveScheduler(0)
+        with self.assertRaises(ElasticMetricsError):
+            AdaptiveScheduler(10, backoff_factor=1)
@@ -0,0 +1,401 @@
+import io
+import os
+import json
+import gzip
+import socket
+import struct
+import pickle
+import shutil
+import tempfile
+import threading
+import mock
+from elasticmetrics.sinks import GraphiteSink, StatsdSink, HttpSink, TextfileSink
+from elasticmetrics.pystdlib.http_server import HTTPServer, BaseHTTPRequestHandler, ThreadingMixIn
+from elasticmetrics.exceptions import ElasticMetricsError
+from . import BaseTestCase
+
+
+class LocalTCPServer(object):
+    """Local TCP server standing in for a metrics backend, collects all
+    received data
+    """
+    def __init__(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen(5)
+        self.port = self.socket.getsockname()[1]
+        self.connections = 0
+        self.received = b''
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.socket.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                self.received += data
+            conn.close()
+
+    def close(self):
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.socket.close()
+
+
+class LocalHTTPServer(ThreadingMixIn, HTTPServer):
+    """Local HTTP/1.1 server standing in for an ingest endpoint, collects the
+    decompressed bodies of all requests, and the client addresses they were sent from
+    """
+    daemon_threads = True
+
+    def __init__(self, status=200):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _IngestHandler)
+        self.status = status
+        self.requests = []
+        self.clients = set()
+        self.port = self.server_address[1]
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _IngestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.clients.add(self.client_address)
+        self.server.requests.append(
+            (self.path, dict(self.headers.items()), gzip.GzipFile(fileobj=io.BytesIO(body)).read()))
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestGraphiteSink(BaseTestCase):
+    def setUp(self):
+        self.server = LocalTCPServer()
+        self.addCleanup(self.server.close)
+
+    def _wait_for(self, size):
+        for _ in range(200):
+            if len(self.server.received) >= size:
+                break
+            threading.Event().wait(0.01)
+
+    def test_graphite_sink_sends_plaintext_metrics_with_timestamp(self):
+        sink = GraphiteSink('127.0.0.1', self.server.port)
+        sink.send({'node.jvm.threads': 10, 'node.cpu': 1.5}, timestamp=1550000000)
+        sink.close()
+        expected = b'node.jvm.threads 10 1550000000\nnode.cpu 1.5 1550000000\n'
+        self._wait_for(len(expected))
+        self.assertEqual(sorted(self.server.received.splitlines()), sorted(expected.splitlines()))
+
+    def test_graphite_sink_sends_pickle_metrics_with_length_header(self):
+        sink = GraphiteSink('127.0.0.1', self.server.port, protocol='pickle')
+        sink.send({'node.jvm.threads': 10}, timestamp=1550000000)
+        sink.close()
+        self._wait_for(5)
+        length = struct.unpack('!L', self.server.received[:4])[0]
+        self._wait_for(4 + length)
+        payload = pickle.loads(self.server.received[4:4 + length])
+        self.assertEqual(payload, [('node.jvm.threads', (1550000000, 10))])
+
+    def test_graphite_sink_buffers_until_batch_size_is_reached(self):
+        sink = GraphiteSink('127.0.0.1', self.server.port, batch_size=3)
+        self.assertEqual(sink.send({'a': 1, 'b': 2}), 0)
+        self.assertEqual(sink.buffered, 2)
+        self.assertEqual(sink.send({'c': 3, 'd': 4}), 4)
+        self.assertEqual(sink.buffered, 0)
+        self.assertEqual(sink.stats['batches_sent'], 2)
+        sink.close()
+
+    def test_graphite_sink_reuses_connection_across_sends(self):
+        sink = GraphiteSink('127.0.0.1', self.server.port)
+        for timestamp in range(5):
+            sink.send({'a': 1}, timestamp)
+            sink.flush()
+        sink.close()
+        self._wait_for(5 * len(b'a 1 0\n'))
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(sink.stats['connects'], 1)
+        self.assertEqual(sink.stats['metrics_sent'], 5)
+
+    def test_graphite_sink_skips_non_numeric_values(self):
+        sink = GraphiteSink('127.0.0.1', self.server.port)
+        sink.send({'a': 'green', 'b': True, 'c': 2}, 1)
+        self.assertEqual(sink.buffered, 2)
+        sink.close()
+
+    def test_graphite_sink_keeps_metrics_and_backs_off_when_server_is_down(self):
+        self.server.close()
+        mock_time = self.set_up_patch('elasticmetrics.sinks.time')
+        mock_time.time.return_value = 1000
+        sink = GraphiteSink('127.0.0.1', self.server.port, backoff=2, max_backoff=5)
+
+        self.assertEqual(sink.send({'a': 1}), 0)
+        self.assertEqual(sink.flush(), 0)
+        self.assertEqual(sink.buffered, 1)
+        self.assertFalse(sink.connected)
+        self.assertEqual(sink.stats['errors'], 1)
+
+        # within the backoff period, no connection attempts are made
+        mock_time.time.return_value = 1001
+        sink.flush()
+        self.assertEqual(sink.stats['errors'], 1)
+
+        mock_time.time.return_value = 1002
+        sink.flush()
+        self.assertEqual(sink.stats['errors'], 2)
+        # backoff is doubled, up to the maximum
+        mock_time.time.return_value = 1005
+        sink.flush()
+        self.assertEqual(sink.stats['errors'], 2)
+        mock_time.time.return_value = 1006
+        sink.flush()
+        self.assertEqual(sink.stats['errors'], 3)
+        mock_time.time.return_value = 1011
+        sink.flush()
+        self.assertEqual(sink.stats['errors'], 4)
+
+    def test_graphite_sink_drops_oldest_metrics_when_buffer_is_full(self):
+        self.server.close()
+        sink = GraphiteSink('127.0.0.1', self.server.port, batch_size=10, max_buffer_size=2)
+        sink.send({'a': 1}, 1)
+        sink.send({'a': 2}, 2)
+        sink.send({'a': 3}, 3)
+        self.assertEqual(sink.buffered, 2)
+        self.assertEqual(sink.stats['dropped'], 1)
+
+    def test_graphite_sink_drops_oldest_metrics_of_failed_batch_not_fitting_the_buffer(self):
+        mock_socket = mock.Mock()
+        self.set_up_patch('elasticmetrics.sinks.socket.create_connection', mock.Mock(return_value=mock_socket))
+        sink = GraphiteSink('127.0.0.1', self.server.port, batch_size=10, max_buffer_size=4)
+        for timestamp, path in enumerate('abcd'):
+            sink.send({path: 1}, timestamp)
+
+        def send_meanwhile_and_fail(payload):
+            sink.send({'e': 1}, 4)
+            sink.send({'f': 1}, 5)
+            raise socket.error('connection reset')
+
+        mock_socket.sendall.side_effect = send_meanwhile_and_fail
+        self.assertEqual(sink.flush(), 0)
+        self.assertEqual(sink.buffered, 4)
+        self.assertEqual(sink.stats['dropped'], 2)
+        self.assertEqual([path for path, _ in sink._buffer], ['c', 'd', 'e', 'f'])
+
+    def test_graphite_sink_init_raises_on_invalid_protocol(self):
+        with self.assertRaises(ElasticMetricsError):
+            GraphiteSink('127.0.0.1', protocol='json')
+
+
+class TestStatsdSink(BaseTestCase):
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.settimeout(2)
+        self.addCleanup(self.server.close)
+        self.port = self.server.getsockname()[1]
+
+    def _receive(self, count):
+        return [self.server.recv(65536) for _ in range(count)]
+
+    def test_statsd_sink_sends_metrics_as_gauges_with_prefix(self):
+        sink = StatsdSink('127.0.0.1', self.port, prefix='es01')
+        self.assertEqual(sink.send({'jvm.threads': 10}), 1)
+        sink.close()
+        self.assertEqual(self._receive(1), [b'es01.jvm.threads:10|g'])
+
+    def test_statsd_sink_packs_gauges_into_datagrams_within_mtu(self):
+        sink = StatsdSink('127.0.0.1', self.port, mtu=64)
+        metrics = dict(('metric{:02d}'.format(i), i) for i in range(20))
+        self.assertEqual(sink.send(metrics), 20)
+        sink.close()
+        stats = sink.stats
+        datagrams = self._receive(stats['datagrams_sent'])
+        self.assertGreater(len(datagrams), 1)
+        self.assertLess(len(datagrams), 20)
+        lines = []
+        for datagram in datagrams:
+            self.assertLessEqual(len(datagram), 64)
+            lines.extend(datagram.split(b'\n'))
+        self.assertEqual(sorted(lines), sorted('metric{:02d}:{}|g'.format(i, i).encode() for i in range(20)))
+
+    def test_statsd_sink_resets_gauge_before_sending_negative_values(self):
+        sink = StatsdSink('127.0.0.1', self.port)
+        sink.send({'delta': -5})
+        sink.close()
+        self.assertEqual(self._receive(1), [b'delta:0|g\ndelta:-5|g'])
+
+    def test_statsd_sink_caches_encoded_metric_names(self):
+        sink = StatsdSink('127.0.0.1', self.port, prefix='es01')
+        sink.send({'a': 1})
+        name = sink._names['a']
+        sink.send({'a': 2})
+        self.assertIs(sink._names['a'], name)
+        sink.close()
+
+    def test_statsd_sink_does_not_raise_on_send_errors(self):
+        sink = StatsdSink('127.0.0.1', self.port)
+        sink.close()
+        sink._socket = mock.Mock()
+        sink._socket.sendto.side_effect = socket.error('unreachable')
+        self.assertEqual(sink.send({'a': 1}), 0)
+        self.assertEqual(sink.stats['errors'], 1)
+
+
+class TestTextfileSink(BaseTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.filename = os.path.join(self.tmp_dir, 'elasticsearch.prom')
+
+    def _read(self):
+        with open(self.filename, 'rt') as fh:
+            return fh.read()
+
+    def test_textfile_sink_replaces_file_with_latest_metrics(self):
+        sink = TextfileSink(self.filename, labels={'node': 'es01'}, strip_prefix='es01')
+        sink.send({'es01.jvm.threads': 10, 'cluster.status': 'green'})
+        self.assertEqual(self._read(), 'elasticsearch_jvm_threads{node="es01"} 10\n')
+        sink.send({'es01.jvm.threads': 12})
+        sink.close()
+        self.assertEqual(self._read(), 'elasticsearch_jvm_threads{node="es01"} 12\n')
+        self.assertEqual(os.listdir(self.tmp_dir), ['elasticsearch.prom'])
+        self.assertEqual(sink.stats['writes'], 2)
+
+    def test_textfile_sink_renames_temporary_file_into_place(self):
+        sink = TextfileSink(self.filename)
+        with mock.patch('elasticmetrics.sinks.os.rename') as mock_rename:
+            sink.send({'a': 1})
+        tmp_filename = mock_rename.call_args[0][0]
+        self.assertEqual(mock_rename.call_args[0][1], self.filename)
+        self.assertEqual(os.path.dirname(tmp_filename), self.tmp_dir)
+        self.assertFalse(tmp_filename.endswith('.prom'))
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_textfile_sink_counts_write_errors(self):
+        sink = TextfileSink(os.path.join(self.tmp_dir, 'missing', 'elasticsearch.prom'))
+        self.assertEqual(sink.send({'a': 1}), 0)
+        self.assertEqual(sink.stats['errors'], 1)
+
+
+class TestHttpSink(BaseTestCase):
+    def setUp(self):
+        self.server = LocalHTTPServer()
+        self.addCleanup(self.server.close)
+
+    def _metrics(self, requests=None):
+        return [metric for _, _, body in (requests or self.server.requests) for metric in json.loads(body.decode())]
+
+    def test_http_sink_posts_gzip_compressed_json_batches(self):
+        sink = HttpSink('127.0.0.1', path='/ingest?db=es', port=self.server.port, user='metrics', password='secret')
+        self.assertEqual(sink.send({'jvm.threads': 10, 'status': 'green', 'ok': True}, 1000), 0)
+        sink.close()
+        self.assertEqual(len(self.server.requests), 1)
+        path, headers, _ = self.server.requests[0]
+        self.assertEqual(path, '/ingest?db=es')
+        headers = dict((key.lower(), value) for key, value in headers.items())
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertEqual(headers['content-type'], 'application/json')
+        self.assertTrue(headers['authorization'].startswith('Basic '))
+        self.assertEqual(sorted(self._metrics(), key=lambda metric: metric['name']), [
+            {'name': 'jvm.threads', 'value': 10, 'timestamp': 1000},
+            {'name': 'ok', 'value': 1, 'timestamp': 1000},
+        ])
+        stats = sink.stats
+        self.assertEqual(stats['metrics_sent'], 2)
+        self.assertEqual(stats['batches_sent'], 1)
+        self.assertEqual(stats['errors'], 0)
+
+    def test_http_sink_batches_metrics_of_many_sends(self):
+        sink = HttpSink('127.0.0.1', port=self.server.port, batch_size=10, max_in_flight=1)
+        for cycle in range(5):
+            sink.send(dict(('metric{}'.format(i), cycle) for i in range(4)), cycle)
+            sink.flush()
+        sink.close()
+        self.assertEqual([len(json.loads(body.decode())) for _, _, body in self.server.requests], [10, 10])
+        self.assertEqual(len(self._metrics()), 20)
+        # batches of a worker reuse its keep-alive connection
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_http_sink_flush_sends_partial_batch_older_than_max_age(self):
+        mock_time = self.set_up_patch('elasticmetrics.sinks.time.time')
+        mock_time.return_value = 100.0
+        sink = HttpSink('127.0.0.1', port=self.server.port, batch_size=100, max_batch_age=10)
+        self.addCleanup(sink.close)
+        sink.send({'a': 1})
+        self.assertEqual(sink.flush(), 0)
+        mock_time.return_value = 111.0
+        self.assertEqual(sink.flush(), 1)
+        self.assertEqual(sink.buffered, 0)
+
+    def test_http_sink_keeps_metrics_buffered_when_max_in_flight(self):
+        sink = HttpSink('127.0.0.1', port=self.server.port, batch_size=2, max_in_flight=1)
+        sink._in_flight.acquire()
+        self.assertEqual(sink.send({'a': 1, 'b': 2, 'c': 3}), 0)
+        self.assertEqual(sink.buffered, 3)
+        sink._in_flight.release()
+        sink.close()
+        self.assertEqual(sink.buffered, 0)
+        self.assertEqual(sorted(metric['name'] for metric in self._metrics()), ['a', 'b', 'c'])
+
+    def test_http_sink_drops_batch_on_error_response(self):
+        self.server.status = 500
+        sink = HttpSink('127.0.0.1', port=self.server.port)
+        sink.send({'a': 1, 'b': 2})
+        sink.close()
+        stats = sink.stats
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['dropped'], 2)
+        self.assertEqual(stats['metrics_sent'], 0)
+
+    def test_http_sink_retries_once_on_connection_errors(self):
+        sink = HttpSink('127.0.0.1', port=self.server.port)
+        connection = mock.Mock()
+        connection.getresponse.side_effect = socket.error('connection reset')
+        with mock.patch.object(sink, '_connection', return_value=connection):
+            sink.send({'a': 1})
+            sink.close()
+        self.assertEqual(connection.request.call_count, 2)
+        stats = sink.stats
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['dropped'], 1)
+
+    def test_http_sink_keeps_sending_after_unexpected_errors(self):
+        sink = HttpSink('127.0.0.1', port=self.server.port, batch_size=1, max_in_flight=1)
+        encode = sink._encode
+        with mock.patch.object(sink, '_encode', side_effect=[TypeError('not serializable'), encode([])]):
+            sink.send({'a': 1})
+            sink.send({'b': 2})
+            sink.close()
+        stats = sink.stats
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['dropped'], 1)
+        self.assertEqual(stats['batches_sent'], 1)
+
+    def test_http_sink_raises_on_invalid_params(self):
+        with self.assertRaises(ElasticMetricsError):
+            HttpSink('127.0.0.1', batch_size=0)
+        with self.assertRaises(ElasticMetricsError):
+            HttpSink('127.0.0.1', max_in_flight=0)
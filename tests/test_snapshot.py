@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from elasticmetrics.snapshot import SnapshotPublisher, SnapshotReader, HEADER_SIZE
+from elasticmetrics.exceptions import ElasticMetricsError
+from . import BaseTestCase
+
+
+class TestSnapshot(BaseTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.filename = os.path.join(self.tmp_dir, 'metrics.snapshot')
+
+    def _publisher(self, **kwargs):
+        publisher = SnapshotPublisher(self.filename, **kwargs)
+        self.addCleanup(publisher.close)
+        return publisher
+
+    def _reader(self):
+        reader = SnapshotReader(self.filename)
+        self.addCleanup(reader.close)
+        return reader
+
+    def test_snapshot_reader_reads_published_numeric_metrics(self):
+        publisher = self._publisher()
+        reader = self._reader()
+        self.assertEqual(reader.read().metrics, OrderedDict())
+        metrics = OrderedDict([('cluster.status', 'green'), ('cluster.nodes', 3), ('es01.jvm.heap', 0.5)])
+        publisher.publish(metrics, timestamp=1500000000.0)
+        snapshot = reader.read()
+        self.assertEqual(snapshot.sequence, publisher.sequence)
+        self.assertEqual(snapshot.sequence % 2, 0)
+        self.assertEqual(snapshot.timestamp, 1500000000.0)
+        self.assertEqual(snapshot.metrics, OrderedDict([('cluster.nodes', 3.0), ('es01.jvm.heap', 0.5)]))
+        self.assertEqual(reader.get('cluster.nodes'), 3.0)
+        self.assertIsNone(reader.get('cluster.status'))
+        self.assertEqual(reader.get('invalid', -1), -1)
+
+    def test_snapshot_reader_reads_updated_values_and_names(self):
+        publisher = self._publisher()
+        reader = self._reader()
+        publisher.publish({'a': 1})
+        self.assertEqual(reader.read().metrics, {'a': 1.0})
+        publisher.publish({'a': 2})
+        self.assertEqual(reader.get('a'), 2.0)
+        publisher.publish(OrderedDict([('b', 3), ('c', 4)]))
+        self.assertEqual(reader.read().metrics, OrderedDict([('b', 3.0), ('c', 4.0)]))
+        self.assertIsNone(reader.get('a'))
+        self.assertEqual(publisher.stats['published'], 3)
+
+    def test_snapshot_reader_retries_while_snapshot_is_published(self):
+        publisher = self._publisher()
+        publisher.publish({'a': 1})
+        reader = SnapshotReader(self.filename, retries=3)
+        self.addCleanup(reader.close)
+        publisher._write_sequence(publisher.sequence + 1)
+        with self.assertRaises(ElasticMetricsError):
+            reader.read()
+        with self.assertRaises(ElasticMetricsError):
+            reader.get('a')
+        publisher._write_sequence(publisher.sequence + 1)
+        self.assertEqual(reader.get('a'), 1.0)
+
+    def test_snapshot_publisher_reuses_existing_file_sequence(self):
+        publisher = self._publisher()
+        publisher.publish({'a': 1})
+        reader = self._reader()
+        sequence = publisher.sequence
+        publisher.close()
+        publisher = self._publisher()
+        self.assertEqual(reader.read().metrics, {'a': 1.0})
+        publisher.publish({'a': 2})
+        self.assertGreater(publisher.sequence, sequence)
+        self.assertEqual(reader.read().metrics, {'a': 2.0})
+
+    def test_snapshot_publisher_raises_when_snapshot_does_not_fit(self):
+        publisher = self._publisher(size=HEADER_SIZE + 24)
+        publisher.publish({'a': 1, 'b': 2})
+        with self.assertRaises(ElasticMetricsError):
+            publisher.publish({'a': 1, 'b': 2, 'c': 3})
+
+    def test_snapshot_publisher_send_skips_snapshots_that_do_not_fit(self):
+        publisher = self._publisher(size=HEADER_SIZE + 24)
+        reader = SnapshotReader(self.filename)
+        publisher.send({'a': 1, 'b': 2})
+        publisher.send({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(reader.read().metrics, {'a': 1.0, 'b': 2.0})
+        self.assertEqual(publisher.stats['skipped'], 1)
+        self.assertEqual(publisher.stats['published'], 1)
+
+    def test_snapshot_reader_raises_on_invalid_file(self):
+        with open(self.filename, 'wb') as fh:
+            fh.write(b'\0' * HEADER_SIZE)
+        with self.assertRaises(ElasticMetricsError):
+            SnapshotReader(self.filename)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+from elasticmetrics.streaming import iter_json_array, QuantileSketch
+from elasticmetrics.exceptions import ElasticMetricsError, ElasticMetricsRequestError
+from . import BaseTestCase
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestIterJsonArray(BaseTestCase):
+    def test_iter_json_array_yields_items_decoded_from_small_chunks(self):
+        tasks = [{'insert_order': i, 'source': u'put-mapping [t€st]', 'priority': 'HIGH'} for i in range(50)]
+        body = json.dumps({'tasks': tasks}, ensure_ascii=False).encode('utf-8')
+        for size in (1, 3, 7, 64, len(body)):
+            self.assertEqual(list(iter_json_array(_chunks(body, size), 'tasks')), tasks)
+
+    def test_iter_json_array_yields_scalars_split_across_chunks(self):
+        body = b'{"other": {"tasks": 1}, "values" : [ 12345 , "ab" ,6.5 ]}'
+        self.assertEqual(list(iter_json_array(_chunks(body, 2), 'values')), [12345, 'ab', 6.5])
+
+    def test_iter_json_array_yields_nothing_for_empty_array(self):
+        self.assertEqual(list(iter_json_array([b'{"tasks":[]}'], 'tasks')), [])
+
+    def test_iter_json_array_raises_on_missing_key(self):
+        with self.assertRaises(ElasticMetricsRequestError):
+            list(iter_json_array([b'{"other": []}'], 'tasks'))
+
+    def test_iter_json_array_raises_on_truncated_json(self):
+        items = iter_json_array([b'{"tasks": [{"a": 1}, {"a":'], 'tasks')
+        self.assertEqual(next(items), {'a': 1})
+        with self.assertRaises(ElasticMetricsRequestError):
+            next(items)
+
+
+class TestQuantileSketch(BaseTestCase):
+    def test_quantile_sketch_estimates_quantiles_within_relative_accuracy(self):
+        values = [random.uniform(1, 100000) for _ in range(10000)]
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+        values.sort()
+        self.assertEqual(sketch.count, 10000)
+        for q in (0.5, 0.9, 0.99):
+            expected = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q) / expected, 1, delta=0.02)
+
+    def test_quantile_sketch_counts_non_positive_values_as_zero(self):
+        sketch = QuantileSketch()
+        for value in (0, 0, 0, 10):
+            sketch.add(value)
+        self.assertEqual(sketch.quantile(0.5), 0)
+        self.assertAlmostEqual(sketch.quantile(1), 10, delta=0.1)
+
+    def test_quantile_sketch_limits_buckets_by_merging_the_lowest(self):
+        sketch = QuantileSketch(relative_accuracy=0.01, max_buckets=10)
+        for value in range(1, 10001):
+            sketch.add(value)
+        self.assertEqual(len(sketch), 10)
+        self.assertAlmostEqual(sketch.quantile(1), 10000, delta=100)
+
+    def test_quantile_sketch_returns_none_without_values(self):
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+
+    def test_quantile_sketch_raises_on_invalid_params(self):
+        with self.assertRaises(ElasticMetricsError):
+            QuantileSketch(relative_accuracy=0)
+        with self.assertRaises(ElasticMetricsError):
+            QuantileSketch(max_buckets=0)
+        with self.assertRaises(ElasticMetricsError):
+            QuantileSketch().quantile(1.5)